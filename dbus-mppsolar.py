@@ -177,24 +177,24 @@ class MPPService:
                         'pv_voltage': self.inverter.pv_voltage,
                         'pv_current': self.inverter.pv_current,
                         'pv_power': self.inverter.pv_power,
+                        'pv2_voltage': self.inverter.pv2_voltage,
+                        'pv2_current': self.inverter.pv2_current,
+                        'pv2_power': self.inverter.pv2_power,
                         'bus_voltage': self.inverter.bus_voltage,
-                        'is_switched_on': getattr(self.inverter, 'is_switched_on', True),
-                        'is_charging_on': getattr(self.inverter, 'is_charging_on', False),
-                        'is_scc_charging_on': getattr(self.inverter, 'is_scc_charging_on', False),
-                        'is_charging_to_float': getattr(self.inverter, 'is_charging_to_float', False),
+                        'mode': self.inverter.mode,
+                        'alarms': self.inverter.pop_alarm_changes(),
                     }
 
                     # Map to D-Bus paths
                     dbus_mapping = self.dbus_helper.map_mpp_values_to_dbus(mpp_data, capabilities)
 
-                    # Log comprehensive mapping details
+                    # Record the mapping in the debug tap
                     self.dbus_helper.log_data_mapping(mpp_data, dbus_mapping, capabilities)
 
                     # Publish to D-Bus
                     if self.dbus_helper.publish_data(dbus_mapping, mpp_data):
                         # Update connection status
                         self.dbus_helper.update_connection_status(self.inverter.online)
-                        logger.debug("Data published successfully")
                     else:
                         logger.warning("Failed to publish data to D-Bus")
                         self.dbus_helper.update_connection_status(False)
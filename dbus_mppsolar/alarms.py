@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+QPIWS warning decoding for MPP Solar inverters
+Maps the PI30 warning bitmap onto Venus OS /Alarms paths
+"""
+
+from typing import Dict, Optional
+
+# Venus OS alarm levels
+ALARM_OK = 0
+ALARM_WARNING = 1
+ALARM_ALARM = 2
+
+# Bit 1 of the QPIWS bitmap is the inverter fault flag. Several other bits are
+# documented as "fault when bit 1 is set, warning otherwise".
+INVERTER_FAULT_BIT = 1
+
+# QPIWS bit position -> (flag name, /Alarms path, severity, escalates on inverter fault)
+# Flag names match the mpp-solar PI30 decoder so decoded responses can be mapped back
+# onto bit positions when the raw response is not available.
+QPIWS_BITS = {
+    1: ('Inverter fault', '/Alarms/InternalFailure', ALARM_ALARM, False),
+    2: ('Bus over fault', '/Alarms/InternalFailure', ALARM_ALARM, False),
+    3: ('Bus under fault', '/Alarms/InternalFailure', ALARM_ALARM, False),
+    4: ('Bus soft fail fault', '/Alarms/InternalFailure', ALARM_ALARM, False),
+    5: ('Line fail warning', '/Alarms/GridLost', ALARM_WARNING, False),
+    6: ('OPV short warning', '/Alarms/ShortCircuit', ALARM_WARNING, False),
+    7: ('Inverter voltage too low fault', '/Alarms/LowAcOutVoltage', ALARM_ALARM, False),
+    8: ('Inverter voltage too high fault', '/Alarms/HighAcOutVoltage', ALARM_ALARM, False),
+    9: ('Over temperature fault', '/Alarms/HighTemperature', ALARM_WARNING, True),
+    10: ('Fan locked fault', '/Alarms/HighTemperature', ALARM_WARNING, True),
+    11: ('Battery voltage to high fault', '/Alarms/HighVoltage', ALARM_WARNING, True),
+    12: ('Battery low alarm warning', '/Alarms/LowBattery', ALARM_WARNING, False),
+    14: ('Battery under shutdown warning', '/Alarms/LowBattery', ALARM_ALARM, False),
+    16: ('Overload fault', '/Alarms/Overload', ALARM_WARNING, True),
+    17: ('EEPROM fault', '/Alarms/InternalFailure', ALARM_WARNING, False),
+    18: ('Inverter over current fault', '/Alarms/Overload', ALARM_ALARM, False),
+    19: ('Inverter soft fail fault', '/Alarms/InternalFailure', ALARM_ALARM, False),
+    20: ('Self test fail fault', '/Alarms/InternalFailure', ALARM_ALARM, False),
+    21: ('OP DC voltage over fault', '/Alarms/HighVoltage', ALARM_ALARM, False),
+    22: ('Bat open fault', '/Alarms/LowBattery', ALARM_ALARM, False),
+    23: ('Current sensor fail fault', '/Alarms/InternalFailure', ALARM_ALARM, False),
+    24: ('Battery short fault', '/Alarms/ShortCircuit', ALARM_ALARM, False),
+    25: ('Power limit warning', '/Alarms/Overload', ALARM_WARNING, False),
+    27: ('MPPT overload fault', '/Alarms/Overload', ALARM_WARNING, False),
+    28: ('MPPT overload warning', '/Alarms/Overload', ALARM_WARNING, False),
+    29: ('Battery too low to charge warning', '/Alarms/LowBattery', ALARM_WARNING, False),
+}
+
+# All /Alarms paths that can be produced by the table above
+ALARM_PATHS = tuple(sorted({entry[1] for entry in QPIWS_BITS.values()}))
+
+# PI30 warning flag names as decoded by mpp-solar -> QPIWS bit, for decoded
+# responses without a raw bitmap
+PI30_WARNING_FLAGS = {entry[0]: bit for bit, entry in QPIWS_BITS.items()}
+
+
+def extract_warning_bits(result, flag_bits: Optional[Dict[str, int]] = None) -> Optional[str]:
+    """
+    Extract the QPIWS bitmap from an mpp-solar command result.
+
+    Prefers the raw '(0101...' response. Falls back to rebuilding the bitmap
+    from the decoded flag names when only those are available.
+
+    Args:
+        result: Parsed QPIWS result from mpp-solar (dict with list values)
+        flag_bits: Decoded flag name -> QPIWS bit (default: PI30 flag names)
+
+    Returns:
+        str: Bitmap of '0'/'1' characters, or None if nothing usable was found
+    """
+    if not isinstance(result, dict):
+        return None
+
+    raw = result.get('raw_response')
+    if raw:
+        raw = raw[0] if isinstance(raw, (list, tuple)) else raw
+        if isinstance(raw, bytes):
+            raw = raw.decode('ascii', 'ignore')
+        start = raw.find('(') + 1
+        end = start
+        while end < len(raw) and raw[end] in '01':
+            end += 1
+        if end > start:
+            return raw[start:end]
+
+    if flag_bits is None:
+        flag_bits = PI30_WARNING_FLAGS
+    bits = ['0'] * 32
+    found = False
+    for name, value in result.items():
+        bit = flag_bits.get(name)
+        if bit is None:
+            continue
+        found = True
+        flag = value[0] if isinstance(value, (list, tuple)) else value
+        if flag and flag not in (0, '0', 'disabled'):
+            bits[bit] = '1'
+    return ''.join(bits) if found else None
+
+
+class AlarmDecoder:
+    """
+    Decodes QPIWS bitmaps into /Alarms path levels with change-only output.
+
+    Keeps the last decoded bitmap and alarm levels so a steady warning state
+    produces no changes at all.
+    """
+
+    def __init__(self):
+        """
+        Initialize the decoder with an unknown alarm state.
+        """
+        self._bits = None  # Last decoded bitmap
+        self.levels: Dict[str, int] = {}  # Current level per /Alarms path
+
+    def decode(self, bits: str) -> Dict[str, int]:
+        """
+        Decode a warning bitmap and return the alarm paths that changed.
+
+        Args:
+            bits: QPIWS bitmap string ('0'/'1' characters, 32 or more bits)
+
+        Returns:
+            dict: Changed /Alarms paths mapped to their new level
+        """
+        if bits == self._bits:
+            return {}
+        self._bits = bits
+
+        levels = dict.fromkeys(ALARM_PATHS, ALARM_OK)
+        escalate = len(bits) > INVERTER_FAULT_BIT and bits[INVERTER_FAULT_BIT] == '1'
+
+        # Only visit the set bits; a healthy inverter reports all zeros
+        index = bits.find('1')
+        while index != -1:
+            entry = QPIWS_BITS.get(index)
+            if entry is not None:
+                _, path, severity, escalates = entry
+                if escalates and escalate:
+                    severity = ALARM_ALARM
+                if severity > levels[path]:
+                    levels[path] = severity
+            index = bits.find('1', index + 1)
+
+        changes = {path: level for path, level in levels.items() if self.levels.get(path) != level}
+        self.levels = levels
+        return changes
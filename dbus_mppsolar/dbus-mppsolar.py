@@ -54,24 +54,24 @@ def poll_inverter(dbus_helper):
                 'pv_voltage': dbus_helper.inverter.pv_voltage,
                 'pv_current': dbus_helper.inverter.pv_current,
                 'pv_power': dbus_helper.inverter.pv_power,
+                'pv2_voltage': dbus_helper.inverter.pv2_voltage,
+                'pv2_current': dbus_helper.inverter.pv2_current,
+                'pv2_power': dbus_helper.inverter.pv2_power,
                 'bus_voltage': dbus_helper.inverter.bus_voltage,
-                'is_switched_on': getattr(dbus_helper.inverter, 'is_switched_on', True),
-                'is_charging_on': getattr(dbus_helper.inverter, 'is_charging_on', False),
-                'is_scc_charging_on': getattr(dbus_helper.inverter, 'is_scc_charging_on', False),
-                'is_charging_to_float': getattr(dbus_helper.inverter, 'is_charging_to_float', False),
+                'mode': dbus_helper.inverter.mode,
+                'alarms': dbus_helper.inverter.pop_alarm_changes(),
             }
 
             # Map to D-Bus paths
             dbus_mapping = dbus_helper.map_mpp_values_to_dbus(mpp_data, capabilities)
 
-            # Log comprehensive mapping details
+            # Record the mapping in the debug tap
             dbus_helper.log_data_mapping(mpp_data, dbus_mapping, capabilities)
 
             # Publish to D-Bus
             if dbus_helper.publish_data(dbus_mapping, mpp_data):
                 # Update connection status
                 dbus_helper.update_connection_status(dbus_helper.inverter.online)
-                logger.debug("Data published successfully")
             else:
                 logger.warning("Failed to publish data to D-Bus")
 
@@ -6,10 +6,10 @@ Updated for Multi/Solar Charger service architecture
 This code was generated with the help of Grok XAI
 """
 
-import logging
 import sys
 import os
-from typing import Dict, Any, Optional
+import time
+from typing import Dict, Any, Optional, Tuple, Callable
 
 # Add current directory to path for module imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -18,9 +18,13 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(1, os.path.join(os.path.dirname(__file__), "..", "ext", "velib_python"))
 
 from .utils import logger, DBUS_SERVICE_NAME, SOLAR_SERVICE_NAME, BATTERY_SERVICE_NAME, PRODUCT_NAME, PRODUCT_ID, DEVICE_TYPE, DEVICE_INSTANCE
+from .alarms import ALARM_PATHS
+from .policy import admit, compile_filters, compile_rate_limits
+from .debugtap import tap
 
 try:
     import dbus
+    import dbus.service
     import gi.repository.GObject as gobject
     from vedbus import VeDbusService
 except ImportError as e:
@@ -28,6 +32,54 @@ except ImportError as e:
     logger.error("Please install dbus-python and gobject")
     sys.exit(1)
 
+# QMOD device mode byte -> Victron Multi operating state
+# /Mode: 1=Charger only, 2=Inverter only, 3=On, 4=Off
+# /State and /Status: 0=Off, 1=Low power, 2=Fault, 8=Passthru, 9=Inverting
+MODE_STATES = {
+    'P': {'/Mode': 3, '/State': 0, '/Status': 0},  # Power on (starting up)
+    'S': {'/Mode': 4, '/State': 0, '/Status': 0},  # Standby (output off)
+    'L': {'/Mode': 3, '/State': 8, '/Status': 8},  # Line mode, AC input passed through
+    'B': {'/Mode': 3, '/State': 9, '/Status': 9},  # Battery mode, inverting
+    'F': {'/Mode': 3, '/State': 2, '/Status': 2},  # Fault mode
+    'H': {'/Mode': 3, '/State': 1, '/Status': 1},  # Power saving mode
+    'D': {'/Mode': 4, '/State': 0, '/Status': 0},  # Shutdown
+}
+
+# Solar Charger paths whose values come from _derive_solar_state, not from the mapping
+SOLAR_STATE_PATHS = ('/Mode', '/State', '/MppOperationMode')
+
+class DebugTapExport(dbus.service.Object):
+    """
+    D-Bus object exposing the debug tap next to the service items.
+
+    Exported at /DebugTap on the Multi service connection, e.g.
+    dbus -y com.victronenergy.multi /DebugTap Dump
+    """
+
+    def __init__(self, bus, debug_tap):
+        """
+        Export the tap on the given connection.
+
+        Args:
+            bus: Bus connection of the service
+            debug_tap: DebugTap instance to expose
+        """
+        super().__init__(bus, '/DebugTap')
+        self._tap = debug_tap
+
+    @dbus.service.method('com.victronenergy.mppsolar.DebugTap', out_signature='as')
+    def Dump(self):
+        return self._tap.dump()
+
+    @dbus.service.method('com.victronenergy.mppsolar.DebugTap', in_signature='i')
+    def Enable(self, size):
+        self._tap.enable(int(size))
+        logger.info(f"Debug tap {'enabled' if self._tap.enabled else 'disabled'}")
+
+    @dbus.service.method('com.victronenergy.mppsolar.DebugTap')
+    def Clear(self):
+        self._tap.clear()
+
 class DbusHelper:
     """
     D-Bus helper class for MPP Solar inverters with Multi/Solar Charger architecture.
@@ -60,6 +112,12 @@ class DbusHelper:
         self.solar_service_name = SOLAR_SERVICE_NAME
         self.battery_service_name = f"{BATTERY_SERVICE_NAME}.mppsolar"
 
+        # Last QMOD mode byte mapped to Multi state paths
+        self._mode = None
+
+        # Valid temperature range from the model profile
+        self._temp_min, self._temp_max = inverter.profile.valid_ranges['heat_sink_temp']
+
         # Service instances
         self.multi_service = None   # VeDbusService for Multi (inverter/charger)
         self.solar_service = None   # VeDbusService for Solar Charger (PV)
@@ -69,6 +127,20 @@ class DbusHelper:
         self._multi_paths: Dict[str, Dict[str, Any]] = {}  # Multi service paths
         self._solar_paths: Dict[str, Dict[str, Any]] = {}  # Solar service paths
 
+        # Publish routing, compiled once the services exist (see _compile_routes)
+        self._route_services = ()  # Services in routing index order
+        self._routes: Dict[str, Tuple[Any, Any, Any, Tuple[Tuple[int, Callable], ...]]] = {}  # Path -> (quantizer, filter, rate limit, setters)
+        self._solar_state_routes: Dict[str, Tuple[Tuple[int, Callable], ...]] = {}
+        self._rate_limited = ()  # (path, rate limit, filter, setters) for the trailing flush
+        self._flush_timer = None  # GLib source of the pending trailing flush
+        self._last_values: Dict[str, Any] = {}  # Last value published per path
+
+        # Last connection state, identity is republished when it comes back online
+        self._connected = None
+
+        # D-Bus export of the debug tap (created with the Multi service)
+        self._tap_export = None
+
         # Initialize path definitions
         self._define_multi_paths()
         self._define_solar_paths()
@@ -77,97 +149,110 @@ class DbusHelper:
     def _define_multi_paths(self):
         """
         Define D-Bus paths for the Multi service (inverter/charger functionality).
+
+        Each path declares its D-Bus type, so its values are wrapped with a
+        direct constructor call instead of being probed on every publish.
+        Measured values also declare a resolution: they are rounded to it
+        before change detection, so computed values only signal when the
+        displayed value changes.
         """
         # Core paths (always required)
         self._multi_paths = {
             # Management paths
-            '/Mgmt/ProcessName': {'value': 'dbus-mppsolar', 'required': True, 'description': 'Process Name'},
-            '/Mgmt/ProcessVersion': {'value': '0.0.2-alpha', 'required': True, 'description': 'Process Version'},
-            '/Mgmt/Connection': {'value': 'Serial USB', 'required': True, 'description': 'Connection Type'},
+            '/Mgmt/ProcessName': {'value': 'dbus-mppsolar', 'type': dbus.String, 'required': True, 'description': 'Process Name'},
+            '/Mgmt/ProcessVersion': {'value': '0.0.2-alpha', 'type': dbus.String, 'required': True, 'description': 'Process Version'},
+            '/Mgmt/Connection': {'value': 'Serial USB', 'type': dbus.String, 'required': True, 'description': 'Connection Type'},
 
             # Identification paths
-            '/DeviceInstance': {'value': self.device_instance, 'required': True, 'description': 'Device Instance'},
-            '/DeviceType': {'value': DEVICE_TYPE, 'required': True, 'description': 'Device Type'},
-            '/ProductId': {'value': PRODUCT_ID, 'required': True, 'description': 'Product ID'},
-            '/ProductName': {'value': PRODUCT_NAME, 'required': True, 'description': 'Product Name'},
-            '/FirmwareVersion': {'value': '0.0.2-alpha', 'required': True, 'description': 'Firmware Version'},
-            '/HardwareVersion': {'value': 0, 'required': True, 'description': 'Hardware Version'},
-            '/Connected': {'value': 0, 'required': True, 'description': 'Connected'},
-            '/Status': {'value': 0, 'required': True, 'description': 'Status'},
+            '/DeviceInstance': {'value': self.device_instance, 'type': dbus.Int32, 'required': True, 'description': 'Device Instance'},
+            '/DeviceType': {'value': DEVICE_TYPE, 'type': dbus.Int32, 'required': True, 'description': 'Device Type'},
+            '/ProductId': {'value': PRODUCT_ID, 'type': dbus.Int32, 'required': True, 'description': 'Product ID'},
+            '/ProductName': {'value': PRODUCT_NAME, 'type': dbus.String, 'required': True, 'description': 'Product Name'},
+            '/FirmwareVersion': {'value': '0.0.2-alpha', 'type': dbus.String, 'required': True, 'description': 'Firmware Version'},
+            '/HardwareVersion': {'value': 0, 'type': dbus.Int32, 'required': True, 'description': 'Hardware Version'},
+            '/Connected': {'value': 0, 'type': dbus.Int32, 'required': True, 'description': 'Connected'},
+            '/Status': {'value': 0, 'type': dbus.Int32, 'required': True, 'description': 'Status'},
 
             # VRM Portal identification paths
-            '/CustomName': {'value': 'MPP Solar Inverter', 'required': True, 'description': 'Custom Device Name'},
-            '/Serial': {'value': None, 'required': True, 'description': 'Device Serial Number'},
-            '/Info/Manufacturer': {'value': 'MPP Solar', 'required': True, 'description': 'Manufacturer'},
-            '/Info/Model': {'value': 'MPP Solar Inverter', 'required': True, 'description': 'Model'},
-            '/Info/Connection': {'value': 'Serial USB', 'required': True, 'description': 'Connection Type'},
+            '/CustomName': {'value': 'MPP Solar Inverter', 'type': dbus.String, 'required': True, 'description': 'Custom Device Name'},
+            '/Serial': {'value': None, 'type': dbus.String, 'required': True, 'description': 'Device Serial Number'},
+            '/Info/Manufacturer': {'value': 'MPP Solar', 'type': dbus.String, 'required': True, 'description': 'Manufacturer'},
+            '/Info/Model': {'value': 'MPP Solar Inverter', 'type': dbus.String, 'required': True, 'description': 'Model'},
+            '/Info/Connection': {'value': 'Serial USB', 'type': dbus.String, 'required': True, 'description': 'Connection Type'},
 
             # AC Output paths (core functionality)
-            '/Ac/Out/L1/V': {'value': None, 'required': True, 'description': 'AC Output Voltage'},
-            '/Ac/Out/L1/F': {'value': None, 'required': True, 'description': 'AC Output Frequency'},
-            '/Ac/Out/L1/P': {'value': None, 'required': True, 'description': 'AC Output Active Power'},
-            '/Ac/Out/L1/S': {'value': None, 'required': False, 'description': 'AC Output Apparent Power'},
-            '/Ac/Out/L1/I': {'value': None, 'required': False, 'description': 'AC Output Current'},
+            '/Ac/Out/L1/V': {'value': None, 'type': dbus.Double, 'resolution': 0.1, 'required': True, 'description': 'AC Output Voltage'},
+            '/Ac/Out/L1/F': {'value': None, 'type': dbus.Double, 'resolution': 0.01, 'required': True, 'description': 'AC Output Frequency'},
+            '/Ac/Out/L1/P': {'value': None, 'type': dbus.Double, 'resolution': 1, 'required': True, 'description': 'AC Output Active Power'},
+            '/Ac/Out/L1/S': {'value': None, 'type': dbus.Double, 'resolution': 1, 'required': False, 'description': 'AC Output Apparent Power'},
+            '/Ac/Out/L1/I': {'value': None, 'type': dbus.Double, 'resolution': 0.01, 'required': False, 'description': 'AC Output Current'},
 
             # Operating state
-            '/Mode': {'value': 3, 'required': True, 'description': 'Operating Mode'},  # 3=On
-            '/State': {'value': 9, 'required': True, 'description': 'Operating State'},  # 9=Inverting
+            '/Mode': {'value': 3, 'type': dbus.Int32, 'required': True, 'description': 'Operating Mode'},  # 3=On
+            '/State': {'value': 9, 'type': dbus.Int32, 'required': True, 'description': 'Operating State'},  # 9=Inverting
         }
 
         # Conditional paths (added based on capabilities)
         self._multi_paths.update({
             # AC Input paths (if AC input available)
-            '/Ac/In/1/L1/V': {'value': None, 'required': False, 'description': 'AC Input Voltage'},
-            '/Ac/In/1/L1/F': {'value': None, 'required': False, 'description': 'AC Input Frequency'},
-            '/Ac/ActiveIn/L1/V': {'value': None, 'required': False, 'description': 'Active AC Input Voltage'},
-            '/Ac/ActiveIn/L1/I': {'value': None, 'required': False, 'description': 'Active AC Input Current'},
-            '/Ac/ActiveIn/L1/P': {'value': None, 'required': False, 'description': 'Active AC Input Power'},
-            '/Ac/ActiveIn/Connected': {'value': 0, 'required': False, 'description': 'AC Input Connected'},
-            '/Ac/ActiveIn/ActiveInput': {'value': 240, 'required': False, 'description': 'Active Input'},
+            '/Ac/In/1/L1/V': {'value': None, 'type': dbus.Double, 'resolution': 0.1, 'required': False, 'description': 'AC Input Voltage'},
+            '/Ac/In/1/L1/F': {'value': None, 'type': dbus.Double, 'resolution': 0.01, 'required': False, 'description': 'AC Input Frequency'},
+            '/Ac/ActiveIn/L1/V': {'value': None, 'type': dbus.Double, 'resolution': 0.1, 'required': False, 'description': 'Active AC Input Voltage'},
+            '/Ac/ActiveIn/L1/I': {'value': None, 'type': dbus.Double, 'resolution': 0.01, 'required': False, 'description': 'Active AC Input Current'},
+            '/Ac/ActiveIn/L1/P': {'value': None, 'type': dbus.Double, 'resolution': 1, 'required': False, 'description': 'Active AC Input Power'},
+            '/Ac/ActiveIn/Connected': {'value': 0, 'type': dbus.Int32, 'required': False, 'description': 'AC Input Connected'},
+            '/Ac/ActiveIn/ActiveInput': {'value': 240, 'type': dbus.Int32, 'required': False, 'description': 'Active Input'},
 
             # Battery paths (if battery data available)
-            '/Dc/0/Voltage': {'value': None, 'required': False, 'description': 'Battery Voltage'},
-            '/Dc/0/Current': {'value': None, 'required': False, 'description': 'Battery Current'},
-            '/Dc/0/Power': {'value': None, 'required': False, 'description': 'Battery Power'},
-            '/Dc/0/Temperature': {'value': None, 'required': False, 'description': 'Battery Temperature'},
-            '/Soc': {'value': None, 'required': False, 'description': 'State of Charge'},
+            '/Dc/0/Voltage': {'value': None, 'type': dbus.Double, 'resolution': 0.01, 'required': False, 'description': 'Battery Voltage'},
+            '/Dc/0/Current': {'value': None, 'type': dbus.Double, 'resolution': 0.1, 'required': False, 'description': 'Battery Current'},
+            '/Dc/0/Power': {'value': None, 'type': dbus.Double, 'resolution': 1, 'required': False, 'description': 'Battery Power'},
+            '/Dc/0/Temperature': {'value': None, 'type': dbus.Double, 'resolution': 0.1, 'required': False, 'description': 'Battery Temperature'},
+            '/Soc': {'value': None, 'type': dbus.Double, 'resolution': 1, 'required': False, 'description': 'State of Charge'},
 
             # PV paths (for solar data under Multi service)
-            '/Pv/0/V': {'value': None, 'required': False, 'description': 'PV Input Voltage'},
-            '/Pv/0/I': {'value': None, 'required': False, 'description': 'PV Input Current'},
-            '/Pv/0/P': {'value': None, 'required': False, 'description': 'PV Input Power'},
-            '/Yield/Power': {'value': None, 'required': False, 'description': 'PV Power Yield'},
+            '/Pv/0/V': {'value': None, 'type': dbus.Double, 'resolution': 0.1, 'required': False, 'description': 'PV Input Voltage'},
+            '/Pv/0/I': {'value': None, 'type': dbus.Double, 'resolution': 0.1, 'required': False, 'description': 'PV Input Current'},
+            '/Pv/0/P': {'value': None, 'type': dbus.Double, 'resolution': 1, 'required': False, 'description': 'PV Input Power'},
+            '/Pv/1/V': {'value': None, 'type': dbus.Double, 'resolution': 0.1, 'required': False, 'description': 'PV2 Input Voltage'},
+            '/Pv/1/I': {'value': None, 'type': dbus.Double, 'resolution': 0.1, 'required': False, 'description': 'PV2 Input Current'},
+            '/Pv/1/P': {'value': None, 'type': dbus.Double, 'resolution': 1, 'required': False, 'description': 'PV2 Input Power'},
+            '/Yield/Power': {'value': None, 'type': dbus.Double, 'resolution': 1, 'required': False, 'description': 'PV Power Yield'},
         })
 
+        # Alarm paths decoded from the QPIWS warning bitmap (0=ok, 1=warning, 2=alarm)
+        for path in ALARM_PATHS:
+            self._multi_paths[path] = {'value': 0, 'type': dbus.Int32, 'required': True, 'description': f"Alarm {path.rsplit('/', 1)[-1]}"}
+
     def _define_solar_paths(self):
         """
         Define D-Bus paths for the Solar Charger service (PV functionality).
         """
         self._solar_paths = {
             # Management paths
-            '/Mgmt/ProcessName': {'value': 'dbus-mppsolar-solar', 'required': True, 'description': 'Process Name'},
-            '/Mgmt/ProcessVersion': {'value': '0.0.2-alpha', 'required': True, 'description': 'Process Version'},
-            '/Mgmt/Connection': {'value': 'Serial USB', 'required': True, 'description': 'Connection Type'},
+            '/Mgmt/ProcessName': {'value': 'dbus-mppsolar-solar', 'type': dbus.String, 'required': True, 'description': 'Process Name'},
+            '/Mgmt/ProcessVersion': {'value': '0.0.2-alpha', 'type': dbus.String, 'required': True, 'description': 'Process Version'},
+            '/Mgmt/Connection': {'value': 'Serial USB', 'type': dbus.String, 'required': True, 'description': 'Connection Type'},
 
             # Identification paths
-            '/DeviceInstance': {'value': self.device_instance, 'required': True, 'description': 'Device Instance'},
-            '/DeviceType': {'value': 0, 'required': True, 'description': 'Device Type'},
-            '/ProductId': {'value': 0xA042, 'required': True, 'description': 'Product ID'},
-            '/ProductName': {'value': 'MPP Solar PV Charger', 'required': True, 'description': 'Product Name'},
-            '/FirmwareVersion': {'value': '0.0.2-alpha', 'required': True, 'description': 'Firmware Version'},
-            '/HardwareVersion': {'value': 0, 'required': True, 'description': 'Hardware Version'},
-            '/Connected': {'value': 0, 'required': True, 'description': 'Connected'},
+            '/DeviceInstance': {'value': self.device_instance, 'type': dbus.Int32, 'required': True, 'description': 'Device Instance'},
+            '/DeviceType': {'value': 0, 'type': dbus.Int32, 'required': True, 'description': 'Device Type'},
+            '/ProductId': {'value': 0xA042, 'type': dbus.Int32, 'required': True, 'description': 'Product ID'},
+            '/ProductName': {'value': 'MPP Solar PV Charger', 'type': dbus.String, 'required': True, 'description': 'Product Name'},
+            '/FirmwareVersion': {'value': '0.0.2-alpha', 'type': dbus.String, 'required': True, 'description': 'Firmware Version'},
+            '/HardwareVersion': {'value': 0, 'type': dbus.Int32, 'required': True, 'description': 'Hardware Version'},
+            '/Connected': {'value': 0, 'type': dbus.Int32, 'required': True, 'description': 'Connected'},
 
             # PV paths (core for solar charger)
-            '/Pv/0/V': {'value': None, 'required': True, 'description': 'PV Input Voltage'},
-            '/Pv/0/I': {'value': None, 'required': True, 'description': 'PV Input Current'},
-            '/Pv/0/P': {'value': None, 'required': True, 'description': 'PV Input Power'},
-            '/Yield/Power': {'value': None, 'required': True, 'description': 'PV Power Yield'},
+            '/Pv/0/V': {'value': None, 'type': dbus.Double, 'resolution': 0.1, 'required': True, 'description': 'PV Input Voltage'},
+            '/Pv/0/I': {'value': None, 'type': dbus.Double, 'resolution': 0.1, 'required': True, 'description': 'PV Input Current'},
+            '/Pv/0/P': {'value': None, 'type': dbus.Double, 'resolution': 1, 'required': True, 'description': 'PV Input Power'},
+            '/Yield/Power': {'value': None, 'type': dbus.Double, 'resolution': 1, 'required': True, 'description': 'PV Power Yield'},
 
             # Operating state
-            '/State': {'value': 0, 'required': True, 'description': 'Charger State'},
-            '/MppOperationMode': {'value': 0, 'required': True, 'description': 'MPPT Operation Mode'},
-            '/Mode': {'value': 1, 'required': True, 'description': 'Charger Mode'},  # 1=On
+            '/State': {'value': 0, 'type': dbus.Int32, 'required': True, 'description': 'Charger State'},
+            '/MppOperationMode': {'value': 0, 'type': dbus.Int32, 'required': True, 'description': 'MPPT Operation Mode'},
+            '/Mode': {'value': 1, 'type': dbus.Int32, 'required': True, 'description': 'Charger Mode'},  # 1=On
         }
 
     def _define_battery_paths(self):
@@ -176,24 +261,24 @@ class DbusHelper:
         """
         self._battery_paths = {
             # Management paths
-            '/Mgmt/ProcessName': {'value': 'dbus-mppsolar-battery', 'required': True, 'description': 'Process Name'},
-            '/Mgmt/ProcessVersion': {'value': '0.0.2-alpha', 'required': True, 'description': 'Process Version'},
-            '/Mgmt/Connection': {'value': 'Serial USB', 'required': True, 'description': 'Connection Type'},
+            '/Mgmt/ProcessName': {'value': 'dbus-mppsolar-battery', 'type': dbus.String, 'required': True, 'description': 'Process Name'},
+            '/Mgmt/ProcessVersion': {'value': '0.0.2-alpha', 'type': dbus.String, 'required': True, 'description': 'Process Version'},
+            '/Mgmt/Connection': {'value': 'Serial USB', 'type': dbus.String, 'required': True, 'description': 'Connection Type'},
 
             # Identification paths
-            '/DeviceInstance': {'value': self.device_instance, 'required': True, 'description': 'Device Instance'},
-            '/ProductId': {'value': PRODUCT_ID, 'required': True, 'description': 'Product ID'},
-            '/ProductName': {'value': 'MPP Solar Battery', 'required': True, 'description': 'Product Name'},
-            '/Connected': {'value': 0, 'required': True, 'description': 'Connected'},
+            '/DeviceInstance': {'value': self.device_instance, 'type': dbus.Int32, 'required': True, 'description': 'Device Instance'},
+            '/ProductId': {'value': PRODUCT_ID, 'type': dbus.Int32, 'required': True, 'description': 'Product ID'},
+            '/ProductName': {'value': 'MPP Solar Battery', 'type': dbus.String, 'required': True, 'description': 'Product Name'},
+            '/Connected': {'value': 0, 'type': dbus.Int32, 'required': True, 'description': 'Connected'},
 
             # Battery core paths
-            '/Dc/0/Voltage': {'value': None, 'required': True, 'description': 'Battery Voltage'},
-            '/Dc/0/Current': {'value': None, 'required': True, 'description': 'Battery Current'},
-            '/Dc/0/Power': {'value': None, 'required': True, 'description': 'Battery Power'},
-            '/Dc/0/Temperature': {'value': None, 'required': False, 'description': 'Battery Temperature'},
-            '/Soc': {'value': None, 'required': True, 'description': 'State of Charge'},
-            '/Info/MaxChargeCurrent': {'value': None, 'required': False, 'description': 'Maximum Charge Current'},
-            '/Info/MaxDischargeCurrent': {'value': None, 'required': False, 'description': 'Maximum Discharge Current'},
+            '/Dc/0/Voltage': {'value': None, 'type': dbus.Double, 'resolution': 0.01, 'required': True, 'description': 'Battery Voltage'},
+            '/Dc/0/Current': {'value': None, 'type': dbus.Double, 'resolution': 0.1, 'required': True, 'description': 'Battery Current'},
+            '/Dc/0/Power': {'value': None, 'type': dbus.Double, 'resolution': 1, 'required': True, 'description': 'Battery Power'},
+            '/Dc/0/Temperature': {'value': None, 'type': dbus.Double, 'resolution': 0.1, 'required': False, 'description': 'Battery Temperature'},
+            '/Soc': {'value': None, 'type': dbus.Double, 'resolution': 1, 'required': True, 'description': 'State of Charge'},
+            '/Info/MaxChargeCurrent': {'value': None, 'type': dbus.Double, 'resolution': 0.1, 'required': False, 'description': 'Maximum Charge Current'},
+            '/Info/MaxDischargeCurrent': {'value': None, 'type': dbus.Double, 'resolution': 0.1, 'required': False, 'description': 'Maximum Discharge Current'},
         }
 
     def assess_capabilities_and_create_services(self) -> bool:
@@ -239,6 +324,8 @@ class DbusHelper:
             logger.info(f"Skipping battery service creation - battery data will be published by Multi service")
             # Note: In Venus OS, Multi inverters publish battery data directly, separate battery service not needed
 
+            self._compile_routes()
+
             logger.info("D-Bus services created successfully")
             return True
 
@@ -246,6 +333,21 @@ class DbusHelper:
             logger.error(f"Error assessing capabilities and creating services: {e}")
             return False
 
+    @staticmethod
+    def _path_args(path: str, config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Build the VeDbusService.add_paths entry for a path definition.
+
+        Args:
+            path: D-Bus path
+            config: Path definition from one of the _define_*_paths methods
+
+        Returns:
+            dict: add_path keyword arguments, including the declared D-Bus type and resolution
+        """
+        return {'path': path, 'value': config['value'], 'description': config['description'],
+                'dbustype': config['type'], 'resolution': config.get('resolution')}
+
     def _create_multi_service(self, capabilities: Dict[str, bool]) -> bool:
         """
         Create the Multi service with appropriate paths based on capabilities.
@@ -258,23 +360,21 @@ class DbusHelper:
         """
         try:
             # Create the Multi D-Bus service (defer registration until main loop starts)
-            import dbus
             # Use system bus for Multi service
             bus = dbus.SystemBus()
             self.multi_service = VeDbusService(self.multi_service_name, bus=bus, register=False)
+            self._tap_export = DebugTapExport(bus, tap)
 
-            # Add paths based on capabilities
+            # Add paths based on capabilities, registered in one pass
+            paths = []
             for path, config in self._multi_paths.items():
-                # Always add required paths
-                if config['required']:
-                    self.multi_service.add_path(path, config['value'], description=config['description'])
-                    logger.debug(f"Added required Multi path: {path}")
-                # Add conditional paths only if capability exists
-                elif self._should_add_path(path, capabilities):
-                    self.multi_service.add_path(path, config['value'], description=config['description'])
-                    logger.debug(f"Added conditional Multi path: {path}")
+                # Always add required paths, conditional paths only if capability exists
+                if config['required'] or self._should_add_path(path, capabilities):
+                    paths.append(self._path_args(path, config))
                 else:
                     logger.debug(f"Skipped Multi path (no capability): {path}")
+            self.multi_service.add_paths(paths)
+            logger.debug(f"Added {len(paths)} Multi paths")
 
             logger.info(f"Multi service created (not yet registered): {self.multi_service_name}")
             return True
@@ -294,16 +394,15 @@ class DbusHelper:
             bool: True if service created successfully
         """
         try:
-            # Create the Solar Charger D-Bus service with separate bus to avoid conflicts
-            import dbus
-            # Use a separate system bus connection for Solar service
+            # Create the Solar Charger D-Bus service (defer registration until main loop starts)
+            # Use system bus for Solar service
             bus = dbus.SystemBus()
             self.solar_service = VeDbusService(self.solar_service_name, bus=bus, register=False)
 
             # Add all solar paths (PV data is required for this service to exist)
-            for path, config in self._solar_paths.items():
-                self.solar_service.add_path(path, config['value'], description=config['description'])
-                logger.debug(f"Added Solar path: {path}")
+            self.solar_service.add_paths(
+                self._path_args(path, config) for path, config in self._solar_paths.items())
+            logger.debug(f"Added {len(self._solar_paths)} Solar paths")
 
             logger.info(f"Solar Charger service created (not yet registered): {self.solar_service_name}")
             return True
@@ -328,9 +427,9 @@ class DbusHelper:
             self.battery_service = VeDbusService(self.battery_service_name, register=True)
 
             # Add all battery paths (battery data is required for this service to exist)
-            for path, config in self._battery_paths.items():
-                self.battery_service.add_path(path, config['value'], description=config['description'])
-                logger.debug(f"Added Battery path: {path}")
+            self.battery_service.add_paths(
+                self._path_args(path, config) for path, config in self._battery_paths.items())
+            logger.debug(f"Added {len(self._battery_paths)} Battery paths")
 
             # Register the service
             logger.info("Registering Battery service...")
@@ -344,6 +443,51 @@ class DbusHelper:
             logger.error(f"Battery service creation traceback: {traceback.format_exc()}")
             return False
 
+    def _compile_routes(self):
+        """
+        Compile the publish routing table for the created services.
+
+        Maps each D-Bus path to the resolution quantizer of its items, its
+        publish filter and rate limit (see policy.py) and the pre-bound
+        _local_set_value setters of the items that own it, so publish_data
+        needs no membership tests. Paths that were not added to a service
+        (missing capability) get no route.
+        """
+        services = []
+        routes = {}
+        quantizers = {}
+        solar_state_routes = {}
+
+        def add_routes(index, service, paths, table):
+            for path in paths:
+                item = service._dbusobjects.get(path)
+                if item is not None:
+                    table[path] = table.get(path, ()) + ((index, item._local_set_value),)
+                    quantizers.setdefault(path, item._quantize)
+
+        if self.multi_service:
+            add_routes(len(services), self.multi_service, self._multi_paths, routes)
+            services.append(self.multi_service)
+
+        if self.solar_service:
+            index = len(services)
+            add_routes(index, self.solar_service,
+                       [path for path in self._solar_paths if path not in SOLAR_STATE_PATHS], routes)
+            add_routes(index, self.solar_service, SOLAR_STATE_PATHS, solar_state_routes)
+            services.append(self.solar_service)
+
+        filters = compile_filters(routes)
+        rate_limits = compile_rate_limits(routes)
+        self._route_services = tuple(services)
+        self._routes = {path: (quantizers[path], filters.get(path), rate_limits.get(path), setters)
+                        for path, setters in routes.items()}
+        self._rate_limited = tuple((path, rate_limit, filters.get(path), routes[path])
+                                   for path, rate_limit in rate_limits.items())
+        self._solar_state_routes = solar_state_routes
+        self._last_values = {}
+        logger.info(f"Compiled publish routes for {len(routes) + len(solar_state_routes)} paths "
+                    f"on {len(services)} service(s)")
+
     def register_services(self) -> bool:
         """
         Register all created D-Bus services on the bus.
@@ -358,6 +502,9 @@ class DbusHelper:
         try:
             success = True
             
+            # Static identification is written once, before the services appear on the bus
+            self.publish_identity()
+
             if self.multi_service:
                 logger.info(f"Registering Multi service: {self.multi_service_name}")
                 self.multi_service.register()
@@ -380,6 +527,33 @@ class DbusHelper:
             logger.error(f"Error registering services: {e}")
             return False
 
+    def publish_identity(self):
+        """
+        Publish the static VRM Portal identification paths.
+
+        Called at registration and on reconnect, as these values only change
+        when the device is identified again, never from one poll to the next.
+        """
+        if not self.multi_service:
+            return
+
+        identity = {
+            '/CustomName': self.inverter.custom_name(),
+            '/Serial': self.inverter.serial_number,
+            '/Info/Manufacturer': 'MPP Solar',
+            '/Info/Model': self.inverter.product_name(),
+            '/Info/Connection': f'Serial USB ({self.inverter.port})',
+        }
+
+        try:
+            with self.multi_service as service:
+                for path, value in identity.items():
+                    if value is not None and path in self.multi_service:
+                        service[path] = value
+            logger.info(f"Published identification: {identity['/Info/Model']} ({identity['/Serial']})")
+        except Exception as e:
+            logger.error(f"Error publishing identification: {e}")
+
     def _should_add_path(self, path: str, capabilities: Dict[str, bool]) -> bool:
         """
         Determine if a conditional path should be added based on device capabilities.
@@ -407,14 +581,14 @@ class DbusHelper:
         if 'Temperature' in path:
             return capabilities.get('has_temperature', False)
 
+        # Second PV tracker paths
+        if path.startswith('/Pv/1/'):
+            return capabilities.get('has_pv2_data', False)
+
         # PV paths
         if path.startswith('/Pv/') or path == '/Yield/Power':
             return capabilities.get('has_pv_data', False)
 
-        # Custom paths - add if data might be available
-        if path in ['/BusVoltage', '/Ac/Out/LoadPercentage']:
-            return True  # These are custom paths, add them if they might have data
-
         return False
 
     def map_mpp_values_to_dbus(self, mpp_data: Dict[str, Any], capabilities: Dict[str, bool]) -> Dict[str, Any]:
@@ -430,14 +604,7 @@ class DbusHelper:
         """
         mapping = {}
 
-        # VRM Portal identification paths (always available)
-        mapping.update({
-            '/CustomName': self.inverter.custom_name(),
-            '/Serial': self.inverter.serial_number,
-            '/Info/Manufacturer': 'MPP Solar',
-            '/Info/Model': self.inverter.product_name(),
-            '/Info/Connection': f'Serial USB ({self.inverter.port})',
-        })
+        # Identification paths are static, see publish_identity
 
         # Multi service mappings
         if self.multi_service:
@@ -448,7 +615,6 @@ class DbusHelper:
                     '/Ac/Out/L1/P': mpp_data.get('ac_power'),
                     '/Ac/Out/L1/S': mpp_data.get('ac_apparent_power'),
                     '/Ac/Out/L1/I': mpp_data.get('ac_current'),
-                    '/Ac/Out/LoadPercentage': mpp_data.get('ac_load_percentage'),
                 })
 
             # AC input (conditional)
@@ -488,82 +654,47 @@ class DbusHelper:
             # Temperature (conditional)
             if capabilities['has_temperature']:
                 temp = mpp_data.get('heat_sink_temp')
-                if temp and 0 <= temp <= 100:
+                if temp and self._temp_min <= temp <= self._temp_max:
                     mapping['/Dc/0/Temperature'] = temp
 
-            # System data
-            mapping['/BusVoltage'] = mpp_data.get('bus_voltage')
+            # Alarms (only the paths that changed since the last QPIWS decode)
+            mapping.update(mpp_data.get('alarms', {}))
 
-            # Operating state for Multi service
-            multi_state = self._derive_operating_state(mpp_data)
-            mapping.update(multi_state)
+            # Operating state for Multi service, only when the QMOD mode byte changed
+            mode = mpp_data.get('mode')
+            if mode != self._mode:
+                state = MODE_STATES.get(mode)
+                if state is not None:
+                    mapping.update(state)
+                    logger.debug(f"Operating state for mode {mode}: {state}")
+                self._mode = mode
 
         # PV data under Multi service
         if capabilities['has_pv_data']:
+            pv_power = mpp_data.get('pv_power')
             mapping.update({
                 '/Pv/0/V': mpp_data.get('pv_voltage'),
                 '/Pv/0/I': mpp_data.get('pv_current'),
-                '/Pv/0/P': mpp_data.get('pv_power'),
-                '/Yield/Power': mpp_data.get('pv_power'),
+                '/Pv/0/P': pv_power,
+                '/Yield/Power': pv_power,
             })
 
+            # Second tracker (dual-tracker models), yield is the sum of both trackers
+            if capabilities.get('has_pv2_data'):
+                pv2_power = mpp_data.get('pv2_power')
+                mapping.update({
+                    '/Pv/1/V': mpp_data.get('pv2_voltage'),
+                    '/Pv/1/I': mpp_data.get('pv2_current'),
+                    '/Pv/1/P': pv2_power,
+                })
+                if pv_power is not None and pv2_power is not None:
+                    mapping['/Yield/Power'] = pv_power + pv2_power
+
         # Battery service mappings
         # Note: Battery data is published by the Multi service in Venus OS Multi inverters
 
         return mapping
 
-    def _derive_operating_state(self, mpp_data: Dict[str, Any]) -> Dict[str, Any]:
-        """
-        Derive operating state for Multi service from MPP Solar status.
-
-        Args:
-            mpp_data: MPP Solar data
-
-        Returns:
-            dict: State mappings
-        """
-        state_mapping = {}
-
-        # Check if device is actually producing AC power (primary indicator)
-        ac_voltage = mpp_data.get('ac_voltage', 0)
-        ac_power = mpp_data.get('ac_power', 0)
-
-        logger.debug(f"Operating state check: AC voltage={ac_voltage}, AC power={ac_power}")
-
-        if ac_voltage > 180 and ac_power > 10:  # Device is actively inverting
-            state_mapping['/Mode'] = 3  # On
-            state_mapping['/State'] = 9  # Inverting
-            state_mapping['/Status'] = 9  # Inverting
-            logger.debug("Setting operating state: Mode=3 (On), State=9 (Inverting), Status=9 (Inverting)")
-        else:
-            # Fallback to the reported switch state
-            if mpp_data.get('is_switched_on') is False:
-                state_mapping['/Mode'] = 4  # Off
-                state_mapping['/State'] = 0  # Off
-                state_mapping['/Status'] = 0  # Off
-                logger.debug("Setting operating state: Mode=4 (Off), State=0 (Off), Status=0 (Off) - device reports not switched on")
-            else:
-                state_mapping['/Mode'] = 3  # On
-                state_mapping['/State'] = 9  # Inverting
-                state_mapping['/Status'] = 9  # Inverting
-                logger.debug("Setting operating state: Mode=3 (On), State=9 (Inverting), Status=9 (Inverting) - fallback")
-
-        # Check charging status for more detailed state (if applicable)
-        is_charging = mpp_data.get('is_charging_on', False)
-        is_scc_charging = mpp_data.get('is_scc_charging_on', False)
-
-        if is_charging or is_scc_charging:
-            if mpp_data.get('is_charging_to_float', False):
-                state_mapping['/State'] = 5  # Float charging
-                state_mapping['/Status'] = 5  # Float charging
-                logger.debug("Adjusting state to 5 (Float charging)")
-            else:
-                state_mapping['/State'] = 3  # Bulk charging
-                state_mapping['/Status'] = 3  # Bulk charging
-                logger.debug("Adjusting state to 3 (Bulk charging)")
-
-        return state_mapping
-
     def _derive_solar_state(self, mpp_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Derive operating state for Solar Charger service.
@@ -603,88 +734,60 @@ class DbusHelper:
         Returns:
             bool: True if publishing successful
         """
-        print(f"DEBUG: publish_data called with mpp_data: {mpp_data is not None}, mapping keys: {list(dbus_mapping.keys())}")
-        with open('/tmp/debug.log', 'a') as f:
-            f.write(f"publish_data called with mpp_data: {mpp_data is not None}, mapping has Mode: {'/Mode' in dbus_mapping}, State: {'/State' in dbus_mapping}, Status: {'/Status' in dbus_mapping}\n")
-            if '/Mode' in dbus_mapping:
-                f.write(f"Mode value: {dbus_mapping['/Mode']}\n")
-            if '/State' in dbus_mapping:
-                f.write(f"State value: {dbus_mapping['/State']}\n")
-            if '/Status' in dbus_mapping:
-                f.write(f"Status value: {dbus_mapping['/Status']}\n")
         try:
             success = True
-
-            # Update Multi service
-            if self.multi_service:
-                # Get the correct operating state for Multi service
-                multi_state = {}
-                if mpp_data is not None:
-                    multi_state = self._derive_operating_state(mpp_data)
-                    logger.debug(f"Multi state derived: {multi_state}")
-                else:
-                    logger.debug("mpp_data is None")
-
-                for path, value in dbus_mapping.items():
-                    if path in self._multi_paths:
-                        # Use service-specific state for Mode/State/Status paths
-                        if path in ['/Mode', '/State', '/Status']:
-                            print(f"DEBUG: Processing {path}, value from mapping: {value}, multi_state: {multi_state}")
-                            if path in multi_state:
-                                actual_value = multi_state[path]
-                                print(f"DEBUG: Using multi-specific {path} = {actual_value}")
-                            else:
-                                actual_value = value
-                                print(f"DEBUG: Using mapping value for {path} = {actual_value}")
-                        else:
-                            actual_value = value
-
-                        if actual_value is not None:
-                            # Only publish if the path was actually added to the service
-                            if path in self.multi_service._dbusobjects:
-                                try:
-                                    self.multi_service[path] = actual_value
-                                    logger.debug(f"Updated Multi {path} = {actual_value}")
-                                except Exception as e:
-                                    logger.error(f"Error publishing data to D-Bus: '{path}' = {actual_value}, error: {e}")
-                                    success = False
-                            else:
-                                logger.debug(f"Skipped Multi {path} (not in service)")
-                        else:
-                            logger.debug(f"Skipped Multi {path} (value is None)")
-                    elif path in self._multi_paths and value is None:
-                        logger.debug(f"Skipped Multi {path} (value is None)")
-
-            # Update Solar service
-            if self.solar_service:
-                # Get the correct operating state for Solar service
-                solar_state = {}
-                if mpp_data is not None:
-                    solar_state = self._derive_solar_state(mpp_data)
-
-                for path, value in dbus_mapping.items():
-                    if path in self._solar_paths:
-                        # Use service-specific state for Mode/State/MppOperationMode paths
-                        if path in ['/Mode', '/State', '/MppOperationMode'] and path in solar_state:
-                            actual_value = solar_state[path]
-                        else:
-                            actual_value = value
-
-                        if actual_value is not None:
-                            # Only publish if the path was actually added to the service
-                            if path in self.solar_service._dbusobjects:
-                                try:
-                                    self.solar_service[path] = actual_value
-                                    logger.debug(f"Updated Solar {path} = {actual_value}")
-                                except Exception as e:
-                                    logger.error(f"Error publishing data to D-Bus: '{path}' = {actual_value}, error: {e}")
-                                    success = False
-                            else:
-                                logger.debug(f"Skipped Solar {path} (not in service)")
-                        else:
-                            logger.debug(f"Skipped Solar {path} (value is None)")
-                    elif path in self._solar_paths and value is None:
-                        logger.debug(f"Skipped Solar {path} (value is None)")
+            changes = [{} for _ in self._route_services]
+            last_values = self._last_values
+
+            # Single pass over the mapping, skipping values that did not change
+            # or stay within the deadband of their publish filter. Values over
+            # their rate limit are held back for the trailing flush. Values are
+            # rounded to the resolution of their items first, so a change that
+            # the items would drop neither passes the filter nor holds a value.
+            routes = self._routes
+            now = time.monotonic()
+            for path, value in dbus_mapping.items():
+                if value is None:
+                    continue
+                route = routes.get(path)
+                if route is None:
+                    continue
+                quantize, path_filter, rate_limit, setters = route
+                if quantize is not None:
+                    value = quantize(value)
+                if not admit(value, last_values.get(path), path_filter, rate_limit, now):
+                    if rate_limit is not None and rate_limit.has_pending:
+                        self._schedule_flush(rate_limit.next_at - now)
+                    continue
+                if path_filter is not None:
+                    path_filter.commit(value, now)
+                last_values[path] = value
+                for index, setter in setters:
+                    try:
+                        change = setter(value)
+                    except Exception as e:
+                        logger.error(f"Error publishing data to D-Bus: '{path}' = {value}, error: {e}")
+                        success = False
+                        continue
+                    if change is not None:
+                        changes[index][path] = change
+
+            # Solar Charger operating state is derived per service
+            if self._solar_state_routes and mpp_data is not None:
+                for path, value in self._derive_solar_state(mpp_data).items():
+                    for index, setter in self._solar_state_routes.get(path, ()):
+                        change = setter(value)
+                        if change is not None:
+                            changes[index][path] = change
+
+            if tap.enabled:
+                tap.record('publish', paths=len(dbus_mapping),
+                           changed=[sorted(service_changes) for service_changes in changes],
+                           mode=dbus_mapping.get('/Mode'), state=dbus_mapping.get('/State'),
+                           status=dbus_mapping.get('/Status'))
+
+            # One ItemsChanged signal per service for the whole cycle
+            self._send_changes(changes)
 
             # Update Battery service
             # Note: Battery data is published by Multi service, no separate battery service
@@ -695,6 +798,70 @@ class DbusHelper:
             logger.error(f"Error publishing data to D-Bus: {e}")
             return False
 
+    def _send_changes(self, changes):
+        """
+        Commit the cycle and send the collected changes as one ItemsChanged signal per service.
+
+        Readers of a service are served from its committed value table, so
+        they see either the previous or this cycle as a whole, never a mix.
+
+        Args:
+            changes: Per-service change dicts in routing index order
+        """
+        for service, service_changes in zip(self._route_services, changes):
+            if service_changes:
+                service.commit()
+                service.root.ItemsChanged(service_changes)
+
+    def _schedule_flush(self, delay: float):
+        """
+        Schedule the trailing flush of rate-limited values.
+
+        Args:
+            delay: Time in seconds until the earliest window ends
+        """
+        if self._flush_timer is None:
+            self._flush_timer = gobject.timeout_add(max(1, int(delay * 1000) + 1), self._flush_pending)
+
+    def _flush_pending(self) -> bool:
+        """
+        Publish the most recent held back value of each rate-limited path whose window ended.
+
+        Reschedules itself while later windows still hold values.
+
+        Returns:
+            bool: Always False (one-shot GLib timeout)
+        """
+        self._flush_timer = None
+        try:
+            now = time.monotonic()
+            changes = [{} for _ in self._route_services]
+            next_due = None
+
+            for path, rate_limit, path_filter, setters in self._rate_limited:
+                if not rate_limit.has_pending:
+                    continue
+                if now < rate_limit.next_at:
+                    delay = rate_limit.next_at - now
+                    next_due = delay if next_due is None else min(next_due, delay)
+                    continue
+                value = rate_limit.release(now)
+                if path_filter is not None:
+                    path_filter.commit(value, now)
+                self._last_values[path] = value
+                for index, setter in setters:
+                    change = setter(value)
+                    if change is not None:
+                        changes[index][path] = change
+
+            self._send_changes(changes)
+            if next_due is not None:
+                self._schedule_flush(next_due)
+
+        except Exception as e:
+            logger.error(f"Error flushing rate-limited values to D-Bus: {e}")
+        return False
+
     def update_connection_status(self, online: bool):
         """
         Update connection status on all services.
@@ -705,6 +872,11 @@ class DbusHelper:
         try:
             connected_value = 1 if online else 0
 
+            # Identification may have changed while the device was offline
+            if online and self._connected is False:
+                self.publish_identity()
+            self._connected = online
+
             if self.multi_service:
                 self.multi_service['/Connected'] = connected_value
                 # /Status is now set in publish_data based on operating state
@@ -719,29 +891,25 @@ class DbusHelper:
 
     def log_data_mapping(self, mpp_data: Dict[str, Any], dbus_mapping: Dict[str, Any], capabilities: Dict[str, bool]):
         """
-        Comprehensive logging of data mapping process.
+        Record the data mapping of a poll cycle in the debug tap.
+
+        Runs every poll, so it never writes to the log; the record is only
+        built while the tap is enabled.
 
         Args:
             mpp_data: Raw MPP Solar data
             dbus_mapping: D-Bus path mappings
             capabilities: Device capabilities
         """
-        if not logger.isEnabledFor(logging.DEBUG):
+        if not tap.enabled:
             return
 
-        logger.debug("=== MPP Solar Data Mapping ===")
-        logger.debug(f"Capabilities: {capabilities}")
-        logger.debug(f"Raw MPP data keys: {list(mpp_data.keys())}")
-
-        # Log published paths
-        published = {k: v for k, v in dbus_mapping.items() if v is not None}
-        logger.debug(f"Publishing {len(published)} paths: {list(published.keys())}")
-
-        # Log services being updated
         services = []
         if self.multi_service:
             services.append("Multi")
         if self.solar_service:
             services.append("Solar")
         # Battery service not used - data published by Multi service
-        logger.debug(f"Updating services: {services}")
\ No newline at end of file
+        tap.record('mapping', capabilities=capabilities, mpp_keys=list(mpp_data),
+                   published=[path for path, value in dbus_mapping.items() if value is not None],
+                   services=services)
\ No newline at end of file
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Debug tap for the poll/publish hot path
+In-memory ring buffer of recent cycle records, dumped on demand over D-Bus
+"""
+
+import json
+import time
+from collections import deque
+from typing import List
+
+from .utils import DEBUG_TAP_SIZE
+
+# Ring buffer size used when the tap is enabled at runtime without a size
+DEFAULT_TAP_SIZE = 200
+
+
+class DebugTap:
+    """
+    Ring buffer of recent hot-path records.
+
+    Disabled by default. Callers check `enabled` before building a record,
+    so a disabled tap costs a single attribute lookup per call site and
+    never formats strings or touches the file system.
+    """
+
+    def __init__(self, size: int = 0):
+        """
+        Initialize the tap.
+
+        Args:
+            size: Number of records to keep, 0 leaves the tap disabled
+        """
+        self.enabled = size > 0
+        self._records = deque(maxlen=size if size > 0 else DEFAULT_TAP_SIZE)
+
+    def record(self, event: str, **fields):
+        """
+        Append a record to the ring buffer.
+
+        Values are stored as-is and only serialized by dump().
+
+        Args:
+            event: Record type (e.g. 'publish', 'QPIGS')
+            **fields: Record data
+        """
+        self._records.append((time.time(), event, fields))
+
+    def enable(self, size: int = 0):
+        """
+        Enable the tap, or disable it with a size below zero.
+
+        Args:
+            size: New ring buffer size, 0 keeps the current size
+        """
+        if size < 0:
+            self.enabled = False
+            self._records.clear()
+            return
+        if size and size != self._records.maxlen:
+            self._records = deque(self._records, maxlen=size)
+        self.enabled = True
+
+    def clear(self):
+        """
+        Drop all buffered records.
+        """
+        self._records.clear()
+
+    def dump(self) -> List[str]:
+        """
+        Serialize the buffered records, oldest first.
+
+        Returns:
+            list: One JSON object per record with 'time', 'event' and the record fields
+        """
+        return [json.dumps(dict(fields, time=round(timestamp, 3), event=event), default=str)
+                for timestamp, event, fields in list(self._records)]
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+# Process-wide tap shared by the inverter and the D-Bus helper
+tap = DebugTap(DEBUG_TAP_SIZE)
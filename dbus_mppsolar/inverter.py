@@ -43,7 +43,11 @@ except ImportError as e:
     print("Please run: git submodule update --init --recursive")
     MPP = None
 
-from .utils import logger
+from .utils import logger, PROTOCOL, WARNING_POLL_INTERVAL, MODE_POLL_INTERVAL
+from .alarms import AlarmDecoder
+from .profiles import GENERIC_PI30, ModelProfile, select_profile
+from .protocols import CODECS, PROBE_ORDER, ProtocolCodec, first_value, get_codec
+from .debugtap import tap
 
 class Inverter(ABC):
     """
@@ -54,7 +58,7 @@ class Inverter(ABC):
     Venus OS D-Bus services for inverter monitoring and control.
     """
 
-    def __init__(self, port: str = None, baud: int = 2400, address: str = None):
+    def __init__(self, port: str = None, baud: int = 2400, address: str = None, protocol: str = None):
         """
         Initialize MPP Solar inverter instance.
 
@@ -64,11 +68,20 @@ class Inverter(ABC):
             port: Serial port path (default: /dev/ttyUSB0)
             baud: Baud rate for serial communication (default: 2400)
             address: Device address (optional)
+            protocol: Protocol codec name or AUTO to probe (default: PROTOCOL from config)
         """
         self.port = port or "/dev/ttyUSB0"  # Serial port for inverter connection
         self.baud_rate = baud  # Communication baud rate
         self.address = address  # Device address (if applicable)
-        self.protocol = "PI30"  # MPP Solar protocol version
+
+        # Protocol codec (see protocols.py), probed in test_connection when set to AUTO
+        protocol = (protocol or PROTOCOL or 'PI30').upper()
+        self._auto_protocol = protocol == 'AUTO'
+        codec = get_codec(PROBE_ORDER[0] if self._auto_protocol else protocol)
+        if codec is None:
+            logger.warning(f"Unknown protocol {protocol}, using PI30")
+            codec = CODECS['PI30']
+        self._set_codec(codec)
 
         # MPP Solar device instance (initialized in _init_device)
         self.mpp_device = None
@@ -79,6 +92,15 @@ class Inverter(ABC):
 
         # Device identification
         self.serial_number = None  # Device serial number for uniqueness
+        self.protocol_id = None  # Protocol ID reported by QPI
+        self.model_name = None  # Model name reported by QMN (if supported)
+        self.firmware_version = None  # Firmware version reported by QVFW (if supported)
+
+        # Model profile, selected once at connect time (see _identify_model)
+        self.profile = GENERIC_PI30
+        self._heat_sink_temp_scale = GENERIC_PI30.field_scales['heat_sink_temp']
+        self._heat_sink_temp_limit = GENERIC_PI30.valid_ranges['heat_sink_temp'][1]
+        self._ac_voltage_min, self._ac_voltage_max = GENERIC_PI30.valid_ranges['ac_voltage']
 
         # Device capabilities (determined during capability assessment)
         self.capabilities = {
@@ -86,6 +108,7 @@ class Inverter(ABC):
             'has_ac_input': False,
             'has_battery_data': False,
             'has_pv_data': False,
+            'has_pv2_data': False,
             'has_temperature': False,
             'minimum_requirements_met': False
         }
@@ -101,6 +124,8 @@ class Inverter(ABC):
         self._battery_voltage = None     # Actual battery voltage from inverter
         self._battery_current = None     # Actual battery discharge current from inverter
         self._battery_soc = None         # Battery state of charge (if available)
+        self._battery_charging_current = None     # Raw charging current as decoded
+        self._battery_discharging_current = None  # Raw discharge current as decoded
 
         # Inverter-specific parameters
         self.ac_voltage = None  # AC output voltage
@@ -119,6 +144,11 @@ class Inverter(ABC):
         self.pv_current = None
         self.pv_power = None
 
+        # Second PV tracker (QPIGS2, dual-tracker models only)
+        self.pv2_voltage = None
+        self.pv2_current = None
+        self.pv2_power = None
+
         # System parameters
         self.bus_voltage = None
         self.heat_sink_temp = None
@@ -127,6 +157,19 @@ class Inverter(ABC):
         self.charge_fet = None  # Charge FET status (always enabled for inverters)
         self.discharge_fet = None  # Discharge FET status
 
+        # Device mode byte from QMOD (P, S, L, B, F, H or D), None until first read
+        self.mode = None
+
+        # Warning status (QPIWS), polled on a slower cadence than QPIGS
+        self.alarm_decoder = AlarmDecoder()
+        self.alarm_changes = {}  # /Alarms paths changed since the last publish
+
+        # Next due time per slow-cadence command (time.monotonic seconds)
+        self._next_poll = {}
+
+        # Whether QPIGS2 is sent each cycle (set from the capability assessment)
+        self._poll_pv2 = False
+
         # Initialize the MPP Solar device connection
         self._init_device()
 
@@ -142,8 +185,9 @@ class Inverter(ABC):
                 return
 
             # Initialize MPP Solar device
-            self.mpp_device = MPP(port=self.port, baud=self.baud_rate, protocol=self.protocol)
-            logger.info(f"MPP Solar device initialized on {self.port} at {self.baud_rate} baud")
+            self.mpp_device = MPP(port=self.port, baud=self.baud_rate, protocol=self.codec.mpp_protocol)
+            logger.info(f"MPP Solar device initialized on {self.port} at {self.baud_rate} baud "
+                        f"using {self.codec.name}")
 
         except Exception as e:
             logger.error(f"Failed to initialize MPP Solar device: {e}")
@@ -166,25 +210,26 @@ class Inverter(ABC):
             'has_ac_input': False,
             'has_battery_data': False,
             'has_pv_data': False,
+            'has_pv2_data': False,
             'has_temperature': False,
             'minimum_requirements_met': False
         }
 
         try:
-            # Connection already tested in main(), assume it's connected
-            logger.info("Using fallback capabilities for MPP Solar device (connection already verified)")
-
-            # For capability assessment, use fallback assumptions since QPI worked
+            # Connection already tested in main(), capabilities come from the model profile
             # This avoids hanging on QPIGS timeouts during startup
-            logger.info("Using fallback capabilities for MPP Solar device (QPI successful)")
-            capabilities['has_ac_output'] = True  # Assume AC output capability
-            capabilities['has_battery_data'] = True  # Assume battery data available
-            capabilities['has_pv_data'] = True  # Assume PV data available
-            capabilities['has_temperature'] = True  # Assume temperature available
-            capabilities['minimum_requirements_met'] = True  # Allow service to start
+            logger.info(f"Using capabilities from model profile: {self.profile.name}")
+            capabilities.update(self.profile.capabilities())
+
+            # Second MPPT tracker support is unknown for generic models, probe it once
+            if 'QPIGS2' in self.profile.probe_commands:
+                capabilities['has_pv2_data'] = self._probe_pv2()
 
             # Update instance capabilities
             self.capabilities = capabilities
+            self._poll_pv2 = (capabilities['has_pv2_data'] and bool(self.codec.pv2_fields)
+                              and self.codec.supports('QPIGS2')
+                              and ('QPIGS2' in self.profile.commands or 'QPIGS2' in self.profile.probe_commands))
 
             logger.info(f"Capability assessment complete: {capabilities}")
 
@@ -216,14 +261,22 @@ class Inverter(ABC):
 
         try:
             # Query device for basic information using QPI command (matching DarkZeros)
-            result = self.mpp_device.run_command("QPI")
-            if result and "ERROR" not in str(result):
+            result = self._probe_protocol() if self._auto_protocol else self._run("QPI")
+            if result is not None:
                 self.online = True
                 self.connection_info = f"Connected to {self.port}"
                 # Store serial number if available
-                if isinstance(result, dict) and 'Protocol ID' in result:
-                    self.serial_number = result.get('Protocol ID', [None])[0]
-                logger.info("MPP Solar device connection successful")
+                protocol_id = first_value(result)
+                if protocol_id:
+                    # PI17/PI18 report only the protocol number
+                    if protocol_id.isdigit():
+                        protocol_id = f"PI{protocol_id}"
+                    self.serial_number = protocol_id
+                    self.protocol_id = protocol_id
+                logger.info(f"MPP Solar device connection successful ({self.codec.name})")
+
+                # Select the model profile once, before any data is polled
+                self._identify_model()
                 return True
             else:
                 self.online = False
@@ -235,6 +288,132 @@ class Inverter(ABC):
             self.connection_info = f"Error: {str(e)}"
             return False
 
+    def _probe_protocol(self):
+        """
+        Find the protocol the device answers by trying each codec in PROBE_ORDER.
+
+        The current codec is tried first, the one that answers the protocol
+        ID query is kept.
+
+        Returns:
+            dict: Validated protocol ID response, None if no protocol answered
+        """
+        order = (self.codec.name,) + tuple(name for name in PROBE_ORDER if name != self.codec.name)
+        for name in order:
+            codec = CODECS[name]
+            if codec is not self.codec:
+                self._set_codec(codec)
+                self._init_device()
+                if self.mpp_device is None:
+                    continue
+            try:
+                result = self._run("QPI")
+            except Exception as e:
+                logger.debug(f"{name} probe failed: {e}")
+                continue
+            if result is not None:
+                logger.info(f"Protocol detected: {name}")
+                return result
+        logger.warning(f"No protocol answered, tried {', '.join(PROBE_ORDER)}")
+        return None
+
+    def _set_codec(self, codec: ProtocolCodec):
+        """
+        Select the protocol codec and precompute its hot-path lookups.
+
+        Args:
+            codec: Protocol codec to use
+        """
+        self.codec = codec
+        self.protocol = codec.name  # MPP Solar protocol version
+        self._heat_sink_temp_key = codec.heat_sink_temp_key
+        status_attrs = {field[1] for field in codec.status_fields}
+        pv2_attrs = status_attrs | {field[1] for field in codec.pv2_fields}
+        # Protocols without power fields only report voltage and current
+        self._derive_pv_power = 'pv_power' not in status_attrs
+        self._derive_pv2_power = 'pv2_power' not in pv2_attrs
+
+    def _run(self, command: str):
+        """
+        Send a driver command through the protocol codec.
+
+        Args:
+            command: Driver command (PI30 name, e.g. QPIGS)
+
+        Returns:
+            dict: Validated response, None if unsupported, failed or rejected
+        """
+        codec = self.codec
+        if not codec.supports(command):
+            return None
+        result = self.mpp_device.run_command(codec.encode(command))
+        if tap.enabled:
+            tap.record(command, result=result)
+        return result if codec.validate(result) else None
+
+    def _query_identity(self, command: str) -> str:
+        """
+        Run an identification command and return its first value.
+
+        Used for QMN and QVFW, which older firmwares do not support.
+
+        Args:
+            command: Identification command (e.g. QMN, QVFW)
+
+        Returns:
+            str: Reported value, empty string if unavailable
+        """
+        try:
+            result = self._run(command)
+            if result is not None:
+                return first_value(result) or ''
+        except Exception as e:
+            logger.debug(f"{command} query failed: {e}")
+        return ''
+
+    def _identify_model(self):
+        """
+        Identify the device model and apply its profile.
+
+        Queries QMN and QVFW once, selects the matching profile from the
+        registry and applies it.
+        """
+        self.model_name = self._query_identity("QMN") or None
+        self.firmware_version = self._query_identity("QVFW") or None
+
+        profile = select_profile(self.protocol_id or '', self.model_name or '', self.firmware_version or '')
+        logger.info(f"Identified QPI={self.protocol_id} QMN={self.model_name} QVFW={self.firmware_version}, "
+                    f"using profile: {profile.name}")
+        self.apply_profile(profile)
+
+    def apply_profile(self, profile: ModelProfile):
+        """
+        Apply a model profile and precompute its hot-path constants.
+
+        Switches the protocol codec when the profile needs a different one,
+        but only if the protocol was probed (PROTOCOL = AUTO) or the profile's
+        codec is a refinement of the configured one (PI30 -> PI30MAX). An
+        explicitly configured protocol is never replaced by a more generic one.
+
+        Args:
+            profile: Model profile to apply
+        """
+        self.profile = profile
+        self._heat_sink_temp_scale = profile.field_scales['heat_sink_temp']
+        self._heat_sink_temp_limit = profile.valid_ranges['heat_sink_temp'][1]
+        self._ac_voltage_min, self._ac_voltage_max = profile.valid_ranges['ac_voltage']
+        self.capacity = profile.capacity
+
+        codec = get_codec(profile.protocol)
+        if codec is None or codec is self.codec:
+            return
+        if self._auto_protocol or isinstance(codec, type(self.codec)):
+            logger.info(f"Switching protocol from {self.protocol} to {codec.name}")
+            self._set_codec(codec)
+            self._init_device()
+        else:
+            logger.warning(f"Profile {profile.name} uses {codec.name}, keeping configured protocol {self.protocol}")
+
     def refresh_data(self) -> bool:
         """
         Refresh data from MPP Solar inverter.
@@ -250,12 +429,22 @@ class Inverter(ABC):
 
         try:
             # Get general status from the inverter using QPIGS command
-            result = self.mpp_device.run_command("QPIGS")
-            logger.debug(f"QPIGS command result: {result}")
+            result = self._run("QPIGS")
 
-            if result and "ERROR" not in str(result).upper() and "Error" not in str(result):
+            if result is not None:
                 # run_command already returns parsed data, no need for to_json
                 self._parse_status_data(result)
+
+                # Second tracker is part of the same multi-command cycle
+                if self._poll_pv2:
+                    self._refresh_pv2()
+
+                # Slow-cadence queries share the same poll cycle, for the commands the model supports
+                commands = self.profile.commands
+                if "QMOD" in commands and self._command_due("QMOD", MODE_POLL_INTERVAL):
+                    self._refresh_mode()
+                if "QPIWS" in commands and self._command_due("QPIWS", WARNING_POLL_INTERVAL):
+                    self._refresh_warnings()
                 return True
             else:
                 logger.warning("Failed to get status from MPP Solar inverter")
@@ -266,103 +455,173 @@ class Inverter(ABC):
             self.online = False
             return False
 
-    def _parse_status_data(self, status_data):
+    def _command_due(self, command: str, interval_ms: int) -> bool:
         """
-        Parse status data from MPP Solar inverter.
+        Check whether a slow-cadence command should be sent this cycle.
 
-        Extracts all relevant parameters from the inverter response and updates
-        instance variables. Handles data conversion and validation.
+        Schedules the next run when the command is due, so each command
+        is sent at most once per interval regardless of POLL_INTERVAL.
 
         Args:
-            status_data: Parsed status data from MPP Solar inverter (dict with list values)
+            command: Command name used as the schedule key (e.g. QPIWS)
+            interval_ms: Minimum time between two runs in milliseconds
+
+        Returns:
+            bool: True if the command should be sent now
+        """
+        now = time.monotonic()
+        if now < self._next_poll.get(command, 0):
+            return False
+        self._next_poll[command] = now + interval_ms / 1000.0
+        return True
+
+    def _probe_pv2(self) -> bool:
+        """
+        Check whether the device answers QPIGS2 (second PV tracker).
+
+        Single-tracker models reject the command, so they never send it again.
+
+        Returns:
+            bool: True if QPIGS2 returned second tracker data
         """
+        if self.mpp_device is None:
+            return False
+
+        if not self.codec.pv2_fields:
+            return False
+
         try:
-            logger.debug(f"Parsing status data keys: {list(status_data.keys())}")
+            result = self._run("QPIGS2")
+            supported = result is not None and self.codec.pv2_fields[0][0] in result
+        except Exception as e:
+            logger.debug(f"QPIGS2 probe failed: {e}")
+            supported = False
 
-            # Extract AC Output parameters
-            if 'AC Output Voltage' in status_data:
-                self.ac_voltage = float(status_data['AC Output Voltage'][0])
+        logger.info(f"Second PV tracker (QPIGS2): {'supported' if supported else 'not supported'}")
+        return supported
 
-            if 'AC Output Frequency' in status_data:
-                self.frequency = float(status_data['AC Output Frequency'][0])
+    def _refresh_pv2(self):
+        """
+        Query QPIGS2 and update the second PV tracker values.
+        """
+        try:
+            result = self._run("QPIGS2")
+            if result is None:
+                logger.warning("Failed to get second PV tracker status from MPP Solar inverter")
+                return
 
-            if 'AC Output Active Power' in status_data:
-                self.ac_power = float(status_data['AC Output Active Power'][0])
+            self.codec.decode_pv2(result, self)
 
-            if 'AC Output Apparent Power' in status_data:
-                self.ac_apparent_power = float(status_data['AC Output Apparent Power'][0])
+        except Exception as e:
+            logger.error(f"Error refreshing second PV tracker: {e}")
 
-            if 'AC Output Load' in status_data:
-                self.ac_load_percentage = float(status_data['AC Output Load'][0])
+    def _refresh_mode(self):
+        """
+        Query the QMOD device mode and store its mode byte.
 
-            # Calculate AC current from power and voltage if not directly available
-            if self.ac_power and self.ac_voltage and self.ac_voltage > 0:
-                self.ac_current = self.ac_power / self.ac_voltage
+        The codec maps the protocol's working mode onto the PI30 mode byte.
+        The previous mode is kept when the query fails.
+        """
+        try:
+            result = self._run("QMOD")
+            mode = self.codec.decode_mode(result) if result is not None else None
 
-            # Extract AC Input parameters
-            if 'AC Input Voltage' in status_data:
-                self.ac_input_voltage = float(status_data['AC Input Voltage'][0])
+            if mode is None:
+                logger.warning("Failed to get device mode from MPP Solar inverter")
+            elif mode != self.mode:
+                logger.info(f"Device mode changed: {self.mode} -> {mode}")
+                self.mode = mode
 
-            if 'AC Input Frequency' in status_data:
-                self.ac_input_frequency = float(status_data['AC Input Frequency'][0])
+        except Exception as e:
+            logger.error(f"Error refreshing device mode: {e}")
 
-            # Extract Battery parameters
-            if 'Battery Voltage' in status_data:
-                self._battery_voltage = float(status_data['Battery Voltage'][0])
+    def _refresh_warnings(self):
+        """
+        Query the QPIWS warning status and decode it into alarm levels.
 
-            if 'Battery Capacity' in status_data:
-                self._battery_soc = float(status_data['Battery Capacity'][0])
+        Changed /Alarms paths are accumulated in alarm_changes until the
+        D-Bus helper picks them up, so nothing is published while the
+        warning state stays the same.
+        """
+        try:
+            result = self._run("QPIWS")
+            bits = self.codec.decode_warnings(result) if result is not None else None
+            if bits is None:
+                logger.warning("Failed to get warning status from MPP Solar inverter")
+                return
+
+            changes = self.alarm_decoder.decode(bits)
+            if changes:
+                logger.info(f"Alarm state changed: {changes}")
+                self.alarm_changes.update(changes)
+
+        except Exception as e:
+            logger.error(f"Error refreshing warning status: {e}")
 
-            # Handle battery current (charging vs discharging)
-            battery_charging_current = None
-            battery_discharging_current = None
+    def pop_alarm_changes(self) -> dict:
+        """
+        Return and clear the /Alarms paths changed since the last call.
+
+        Returns:
+            dict: Changed /Alarms paths mapped to their level (0=ok, 1=warning, 2=alarm)
+        """
+        changes = self.alarm_changes
+        self.alarm_changes = {}
+        return changes
 
-            if 'Battery Charging Current' in status_data:
-                battery_charging_current = float(status_data['Battery Charging Current'][0])
+    def _parse_status_data(self, status_data):
+        """
+        Parse status data from MPP Solar inverter.
 
-            if 'Battery Discharge Current' in status_data:
-                battery_discharging_current = float(status_data['Battery Discharge Current'][0])
+        Extracts all relevant parameters from the inverter response and updates
+        instance variables. Handles data conversion and validation.
+
+        Args:
+            status_data: Parsed status data from MPP Solar inverter (dict with list values)
+        """
+        try:
+            # Decode all table-driven fields straight into this instance
+            self.codec.decode_status(status_data, self)
+
+            # Calculate AC current from power and voltage if not directly available
+            if self.ac_power and self.ac_voltage and self.ac_voltage > 0:
+                self.ac_current = self.ac_power / self.ac_voltage
 
             # Net battery current: positive for charging, negative for discharging
+            battery_charging_current = self._battery_charging_current
+            battery_discharging_current = self._battery_discharging_current
             if battery_charging_current and battery_charging_current > 0:
                 self._battery_current = battery_charging_current
             elif battery_discharging_current and battery_discharging_current > 0:
                 self._battery_current = -battery_discharging_current  # Negative for discharging
             else:
-                self._battery_current = 0
-
-            # Extract PV parameters
-            if 'PV Input Voltage' in status_data:
-                self.pv_voltage = float(status_data['PV Input Voltage'][0])
-
-            if 'PV Input Current for Battery' in status_data:
-                self.pv_current = float(status_data['PV Input Current for Battery'][0])
-
-            if 'PV Input Power' in status_data:
-                self.pv_power = float(status_data['PV Input Power'][0])
-
-            # Extract System parameters
-            if 'BUS Voltage' in status_data:
-                self.bus_voltage = float(status_data['BUS Voltage'][0])
-
-            if 'Inverter Heat Sink Temperature' in status_data:
-                temp = float(status_data['Inverter Heat Sink Temperature'][0])
-                # Handle temperature scaling (MPP Solar often returns temperature * 10)
-                if temp > 100:  # Likely scaled
-                    temp = temp / 10
+                self._battery_current = battery_charging_current or 0  # Signed (PI17) or idle
+
+            # Derive PV power for protocols that only report voltage and current
+            if self._derive_pv_power and self.pv_voltage is not None and self.pv_current is not None:
+                self.pv_power = self.pv_voltage * self.pv_current
+            if self._derive_pv2_power and self.pv2_voltage is not None and self.pv2_current is not None:
+                self.pv2_power = self.pv2_voltage * self.pv2_current
+
+            temp = status_data.get(self._heat_sink_temp_key)
+            if temp is not None:
+                temp = float(temp[0])
+                # Readings above the valid range come from firmwares reporting temperature * 10
+                if temp > self._heat_sink_temp_limit:
+                    temp *= self._heat_sink_temp_scale
                 self.heat_sink_temp = temp
 
             # Set basic inverter values (placeholders for D-Bus compatibility)
             self.soc = 100  # Inverters always show 100% "charge"
-            self.capacity = 10000  # Placeholder capacity in Wh
 
             # Set FET status (inverters are always "enabled")
             self.charge_fet = True
             self.discharge_fet = True
 
-            logger.debug(f"Parsed data: AC={self.ac_voltage}V/{self.ac_power}W, "
-                        f"Battery={self._battery_voltage}V/{self._battery_current}A, "
-                        f"PV={self.pv_voltage}V/{self.pv_power}W")
+            if tap.enabled:
+                tap.record('status', ac_voltage=self.ac_voltage, ac_power=self.ac_power,
+                           battery_voltage=self._battery_voltage, battery_current=self._battery_current,
+                           pv_voltage=self.pv_voltage, pv_power=self.pv_power)
 
         except Exception as e:
             logger.error(f"Error parsing status data: {e}")
@@ -466,14 +725,14 @@ class Inverter(ABC):
         """
         Validate that we have reasonable data.
 
-        Checks if AC voltage is within expected range.
+        Checks if AC voltage is within the range of the model profile.
 
         Returns:
             bool: True if data is valid, False otherwise
         """
         if self.ac_voltage is None:
             return False
-        if self.ac_voltage < 180 or self.ac_voltage > 280:
+        if self.ac_voltage < self._ac_voltage_min or self.ac_voltage > self._ac_voltage_max:
             logger.warning(f"AC voltage out of range: {self.ac_voltage}V")
             return False
         return True
\ No newline at end of file
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Publish policy for D-Bus values
+Per-path deadband, hysteresis and heartbeat, configured in the [PUBLISH] section,
+and per-path maximum publish rate, configured in the [PUBLISH_RATE] section
+"""
+
+import configparser
+from typing import Dict, Iterable, Optional
+
+from .utils import config, logger, PUBLISH_HEARTBEAT
+
+
+class PathFilter:
+    """
+    Deadband and hysteresis filter for a single D-Bus path.
+
+    A value is published when it moves more than the deadband away from
+    the last published value. The deadband is the larger of an absolute
+    change and a percentage of the last published value. A move in the
+    opposite direction of the previous published change needs an extra
+    hysteresis margin, so a value dithering around a step does not flip
+    back and forth. Held back values are still published once the
+    heartbeat (max silence) has elapsed.
+    """
+
+    __slots__ = ('absolute', 'relative', 'hysteresis', 'heartbeat', 'value', 'direction', 'published_at')
+
+    def __init__(self, absolute: float = 0.0, relative: float = 0.0, hysteresis: float = 0.0,
+                 heartbeat: float = 0.0):
+        """
+        Initialize the filter.
+
+        Args:
+            absolute: Minimum absolute change to publish
+            relative: Minimum change in percent of the last published value
+            hysteresis: Extra change required when the direction reverses
+            heartbeat: Maximum time in seconds a changed value is held back (0 = no limit)
+        """
+        self.absolute = absolute
+        self.relative = relative / 100.0
+        self.hysteresis = hysteresis
+        self.heartbeat = heartbeat
+        self.value = None  # Last published value
+        self.direction = 0  # Sign of the last published change
+        self.published_at = 0.0  # Time of the last publish (time.monotonic)
+
+    def accept(self, value, now: float) -> bool:
+        """
+        Decide whether a new value should be published.
+
+        Does not change the filter state; call commit() once the value
+        has actually been published.
+
+        Args:
+            value: New value for the path
+            now: Current time (time.monotonic)
+
+        Returns:
+            bool: True if the value should be published
+        """
+        last = self.value
+        if last is None or not isinstance(value, (int, float)) or not isinstance(last, (int, float)):
+            return value != last
+        delta = value - last
+        threshold = max(self.absolute, self.relative * abs(last))
+        if delta * self.direction < 0:
+            threshold += self.hysteresis
+        return abs(delta) > threshold or bool(
+            delta != 0 and self.heartbeat and now - self.published_at >= self.heartbeat)
+
+    def commit(self, value, now: float):
+        """
+        Record a published value as the new reference of the filter.
+
+        Args:
+            value: Published value
+            now: Time of the publish (time.monotonic)
+        """
+        last = self.value
+        if last is None or not isinstance(value, (int, float)) or not isinstance(last, (int, float)):
+            self.direction = 0
+        else:
+            delta = value - last
+            self.direction = (delta > 0) - (delta < 0)
+        self.value = value
+        self.published_at = now
+
+    def __repr__(self) -> str:
+        return (f"PathFilter(absolute={self.absolute}, relative={self.relative * 100.0}%, "
+                f"hysteresis={self.hysteresis}, heartbeat={self.heartbeat})")
+
+
+class RateLimit:
+    """
+    Maximum publish rate for a single D-Bus path.
+
+    Values arriving within the minimum interval after the last publish are
+    held back; the most recent one is published at the end of the window
+    (trailing edge), so the last value is never lost.
+    """
+
+    __slots__ = ('interval', 'next_at', 'pending', 'has_pending')
+
+    def __init__(self, max_rate: float):
+        """
+        Initialize the rate limit.
+
+        Args:
+            max_rate: Maximum number of publishes per second
+        """
+        self.interval = 1.0 / max_rate  # Minimum time between two publishes in seconds
+        self.next_at = 0.0  # Earliest time of the next publish (time.monotonic)
+        self.pending = None  # Most recent held back value
+        self.has_pending = False
+
+    def hold(self, value, now: float) -> bool:
+        """
+        Check the rate limit for a new value.
+
+        Held back values replace any earlier pending value. A value that
+        passes opens a new window.
+
+        Args:
+            value: New value for the path
+            now: Current time (time.monotonic)
+
+        Returns:
+            bool: True if the value was held back for the trailing flush
+        """
+        if now < self.next_at:
+            self.pending = value
+            self.has_pending = True
+            return True
+        self.next_at = now + self.interval
+        self.has_pending = False
+        return False
+
+    def discard(self):
+        """
+        Drop the pending value, keeping the current window.
+
+        Used when a newer sample supersedes the held back value without
+        being published itself.
+        """
+        self.pending = None
+        self.has_pending = False
+
+    def release(self, now: float):
+        """
+        Take the pending value at the end of the window.
+
+        Args:
+            now: Current time (time.monotonic)
+
+        Returns:
+            The pending value, which the caller must publish
+        """
+        value = self.pending
+        self.pending = None
+        self.has_pending = False
+        self.next_at = now + self.interval
+        return value
+
+    def __repr__(self) -> str:
+        return f"RateLimit(max_rate={1.0 / self.interval:g}/s)"
+
+
+def admit(value, last, path_filter: Optional[PathFilter], rate_limit: Optional[RateLimit], now: float) -> bool:
+    """
+    Decide whether a new sample of a path is published now.
+
+    Samples equal to the last published value or within the deadband of the
+    path filter are dropped, samples over the rate limit are held back for
+    the trailing flush. Every sample supersedes the value held back by an
+    earlier one, so a path that returns to its published value within the
+    window does not publish a stale held value at the end of it.
+
+    The path filter is only consulted; the caller commits it once the value
+    is actually published, directly or by the trailing flush.
+
+    Args:
+        value: New value for the path
+        last: Last published value for the path (None if never published)
+        path_filter: Publish filter of the path, if any
+        rate_limit: Rate limit of the path, if any
+        now: Current time (time.monotonic)
+
+    Returns:
+        bool: True if the value must be published now
+    """
+    if value == last or (path_filter is not None and not path_filter.accept(value, now)):
+        if rate_limit is not None:
+            rate_limit.discard()
+        return False
+    return rate_limit is None or not rate_limit.hold(value, now)
+
+
+def parse_filter(spec: str, heartbeat: float = PUBLISH_HEARTBEAT) -> Optional[PathFilter]:
+    """
+    Parse a [PUBLISH] entry of the form '<absolute>[, <relative %>[, <hysteresis>]]'.
+
+    Args:
+        spec: Configuration value
+        heartbeat: Maximum silence in seconds for the path
+
+    Returns:
+        PathFilter: Parsed filter, None if the entry is invalid
+    """
+    try:
+        values = [float(part) for part in spec.split(',')]
+    except ValueError:
+        return None
+    if not 1 <= len(values) <= 3 or any(value < 0 for value in values):
+        return None
+    return PathFilter(*values, heartbeat=heartbeat)
+
+
+def compile_filters(paths: Iterable[str], section: str = 'PUBLISH') -> Dict[str, PathFilter]:
+    """
+    Build one filter per published path from the [PUBLISH] configuration.
+
+    configparser lowercases option names, so paths are matched without case.
+    Paths without an entry get no filter and are published on every change.
+
+    Args:
+        paths: D-Bus paths that can be published
+        section: Configuration section holding the per-path entries
+
+    Returns:
+        dict: D-Bus path -> PathFilter for the configured paths
+    """
+    entries = _path_entries(section)
+    filters = {}
+    for path in paths:
+        spec = entries.pop(path.lower(), None)
+        if spec is None:
+            continue
+        path_filter = parse_filter(spec)
+        if path_filter is None:
+            logger.warning(f"Ignoring invalid publish policy for {path}: {spec}")
+            continue
+        filters[path] = path_filter
+
+    for key in entries:
+        logger.debug(f"Publish policy for unknown path ignored: {key}")
+    return filters
+
+
+def compile_rate_limits(paths: Iterable[str], section: str = 'PUBLISH_RATE') -> Dict[str, RateLimit]:
+    """
+    Build one rate limit per published path from the [PUBLISH_RATE] configuration.
+
+    Entries have the form '<D-Bus path> = <max publishes per second>'.
+
+    Args:
+        paths: D-Bus paths that can be published
+        section: Configuration section holding the per-path entries
+
+    Returns:
+        dict: D-Bus path -> RateLimit for the configured paths
+    """
+    entries = _path_entries(section)
+    limits = {}
+    for path in paths:
+        spec = entries.pop(path.lower(), None)
+        if spec is None:
+            continue
+        try:
+            max_rate = float(spec)
+        except ValueError:
+            max_rate = 0
+        if max_rate <= 0:
+            logger.warning(f"Ignoring invalid publish rate for {path}: {spec}")
+            continue
+        limits[path] = RateLimit(max_rate)
+
+    for key in entries:
+        logger.debug(f"Publish rate for unknown path ignored: {key}")
+    return limits
+
+
+def _path_entries(section: str) -> Dict[str, str]:
+    """
+    Return the D-Bus path entries of a configuration section.
+
+    Args:
+        section: Configuration section
+
+    Returns:
+        dict: Lowercased D-Bus path -> configured value, empty if the section is missing
+    """
+    try:
+        return {key: value for key, value in config.items(section) if key.startswith('/')}
+    except configparser.NoSectionError:
+        return {}
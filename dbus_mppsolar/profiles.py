@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Model profiles for MPP Solar inverters
+Selected once at connect time from the QPI/QMN/QVFW identification
+"""
+
+from typing import Dict, Tuple
+
+# Capability flags (path sets) known to the D-Bus helper
+ALL_PATH_SETS = (
+    'has_ac_output',
+    'has_ac_input',
+    'has_battery_data',
+    'has_pv_data',
+    'has_pv2_data',
+    'has_temperature',
+)
+
+# Commands every PI30-family model answers
+BASE_COMMANDS = frozenset({'QPIGS', 'QMOD', 'QPIWS'})
+
+
+class ModelProfile:
+    """
+    Model-specific constants for an MPP Solar inverter family.
+
+    A profile is matched against the protocol ID (QPI), model name (QMN) and
+    firmware version (QVFW) reported by the device, and supplies everything
+    that used to be decided per sample: protocol, supported commands, field
+    scales, valid ranges and the D-Bus path sets to create.
+    """
+
+    def __init__(self, name: str, protocol: str = 'PI30',
+                 protocol_ids: Tuple[str, ...] = ('PI30',),
+                 model_prefixes: Tuple[str, ...] = (),
+                 firmware_prefixes: Tuple[str, ...] = (),
+                 commands: frozenset = BASE_COMMANDS,
+                 probe_commands: frozenset = frozenset(),
+                 field_scales: Dict[str, float] = None,
+                 valid_ranges: Dict[str, Tuple[float, float]] = None,
+                 path_sets: Tuple[str, ...] = ('has_ac_output', 'has_battery_data', 'has_pv_data', 'has_temperature'),
+                 capacity: int = 10000):
+        """
+        Initialize a model profile.
+
+        Args:
+            name: Human-readable profile name (used in logs)
+            protocol: mpp-solar protocol used to talk to this model
+            protocol_ids: QPI protocol IDs this profile applies to
+            model_prefixes: QMN model name prefixes (empty matches any model)
+            firmware_prefixes: QVFW firmware prefixes (empty matches any firmware)
+            commands: Commands the model is known to support; others are never polled
+            probe_commands: Commands whose support is unknown and must be probed once
+            field_scales: Multiplier per field. heat_sink_temp is required and applies to
+                readings above the heat_sink_temp valid range (firmwares reporting * 10)
+            valid_ranges: (min, max) per field used for data validation
+            path_sets: Capability flags whose D-Bus paths are created
+            capacity: Placeholder capacity in Wh
+        """
+        self.name = name
+        self.protocol = protocol
+        self.protocol_ids = protocol_ids
+        self.model_prefixes = model_prefixes
+        self.firmware_prefixes = firmware_prefixes
+        self.commands = commands
+        self.probe_commands = probe_commands
+        self.field_scales = dict(field_scales or {})
+        self.valid_ranges = {'ac_voltage': (180.0, 280.0), 'heat_sink_temp': (0.0, 100.0)}
+        self.valid_ranges.update(valid_ranges or {})
+        self.path_sets = frozenset(path_sets)
+        self.capacity = capacity
+
+    def matches(self, protocol_id: str, model_name: str, firmware: str) -> bool:
+        """
+        Check whether this profile applies to the identified device.
+
+        Args:
+            protocol_id: QPI protocol ID (e.g. 'PI30')
+            model_name: QMN model name, empty if not reported
+            firmware: QVFW firmware version, empty if not reported
+
+        Returns:
+            bool: True if all configured criteria match
+        """
+        if self.protocol_ids and protocol_id not in self.protocol_ids:
+            return False
+        if self.model_prefixes and not model_name.upper().startswith(self.model_prefixes):
+            return False
+        if self.firmware_prefixes and not firmware.startswith(self.firmware_prefixes):
+            return False
+        return True
+
+    def capabilities(self) -> Dict[str, bool]:
+        """
+        Return the capability flags implied by this profile's path sets.
+
+        Returns:
+            dict: Capability flags, including minimum_requirements_met
+        """
+        capabilities = {flag: flag in self.path_sets for flag in ALL_PATH_SETS}
+        capabilities['minimum_requirements_met'] = capabilities['has_ac_output']
+        return capabilities
+
+    def __repr__(self) -> str:
+        return f"ModelProfile({self.name!r}, protocol={self.protocol!r})"
+
+
+# Heat sink temperature scales. Some PI30 firmwares report the temperature
+# * 10, which shows as a reading above the valid range; PI17/PI18 always
+# report degrees
+PI30_SCALES = {'heat_sink_temp': 0.1}
+PI1X_SCALES = {'heat_sink_temp': 1.0}
+
+# Fallback for any PI30 device without a more specific profile. QPIGS2
+# support is probed once.
+GENERIC_PI30 = ModelProfile(
+    'Generic PI30',
+    protocol_ids=(),
+    field_scales=PI30_SCALES,
+    probe_commands=frozenset({'QPIGS2'}),
+)
+
+# Registry in match order, most specific first
+PROFILES = [
+    ModelProfile(
+        'PI30 MAX (dual MPPT)',
+        protocol='PI30MAX',
+        model_prefixes=('MAX', 'PIP-MAX'),
+        commands=BASE_COMMANDS | {'QPIGS2'},
+        field_scales=PI30_SCALES,
+        path_sets=('has_ac_output', 'has_battery_data', 'has_pv_data', 'has_pv2_data', 'has_temperature'),
+    ),
+    ModelProfile(
+        'PI18 (InfiniSolar)',
+        protocol='PI18',
+        protocol_ids=('PI18',),
+        field_scales=PI1X_SCALES,
+        path_sets=('has_ac_output', 'has_battery_data', 'has_pv_data', 'has_pv2_data', 'has_temperature'),
+    ),
+    ModelProfile(
+        'PI17 (InfiniSolar hybrid)',
+        protocol='PI17',
+        protocol_ids=('PI17',),
+        field_scales=PI1X_SCALES,
+        path_sets=('has_ac_output', 'has_battery_data', 'has_pv_data', 'has_pv2_data', 'has_temperature'),
+    ),
+    ModelProfile(
+        'PI30 LV (120 V output)',
+        model_prefixes=('LV',),
+        field_scales=PI30_SCALES,
+        valid_ranges={'ac_voltage': (90.0, 140.0)},
+    ),
+    GENERIC_PI30,
+]
+
+
+def select_profile(protocol_id: str, model_name: str = '', firmware: str = '') -> ModelProfile:
+    """
+    Select the model profile for an identified device.
+
+    Args:
+        protocol_id: QPI protocol ID (e.g. 'PI30')
+        model_name: QMN model name, empty if not reported
+        firmware: QVFW firmware version, empty if not reported
+
+    Returns:
+        ModelProfile: First matching profile, GENERIC_PI30 if none matches
+    """
+    for profile in PROFILES:
+        if profile.matches(protocol_id or '', model_name or '', firmware or ''):
+            return profile
+    return GENERIC_PI30
@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""
+Protocol codecs for MPP Solar inverters
+One codec per protocol family (PI30, PI30 MAX, PI18, PI17), all exposing the
+same command vocabulary to the inverter so mixed fleets share one code base
+"""
+
+from abc import ABC
+from typing import Dict, Optional, Tuple
+
+from .alarms import INVERTER_FAULT_BIT, PI30_WARNING_FLAGS, extract_warning_bits
+
+# Field table entry: (mpp-solar response key, Inverter attribute, scale)
+FieldTable = Tuple[Tuple[str, str, float], ...]
+
+# Commands are named after their PI30 equivalent throughout the driver:
+# QPI (protocol ID), QMN (model), QVFW (firmware), QPIGS (status),
+# QPIGS2 (second PV tracker), QMOD (device mode), QPIWS (warnings)
+
+# Working mode reported by PI17/PI18 MOD -> PI30 mode byte
+PI1X_MODE_CODES = {
+    '00': 'P', 'Power on mode': 'P',
+    '01': 'S', 'Standby mode': 'S',
+    '02': 'L', 'Bypass mode': 'L',
+    '03': 'B', 'Battery mode': 'B',
+    '04': 'F', 'Fault mode': 'F',
+    '05': 'L', 'Hybrid mode(Line mode, Grid mode)': 'L', 'Hybrid mode (Line mode, Grid mode)': 'L',
+}
+
+
+def first_value(result) -> Optional[str]:
+    """
+    Return the first data value of a decoded mpp-solar response.
+
+    Skips metadata keys ('_command', 'raw_response', ...).
+
+    Args:
+        result: Decoded response (dict with list values)
+
+    Returns:
+        str: First value as a stripped string, None if there is none
+    """
+    for key, value in result.items():
+        if key.startswith('_') or key == 'raw_response':
+            continue
+        return str(value[0] if isinstance(value, (list, tuple)) else value).strip()
+    return None
+
+
+def raw_payload(result) -> Optional[str]:
+    """
+    Return the raw response payload after the leading '(' if mpp-solar included it.
+
+    Args:
+        result: Decoded response (dict with list values)
+
+    Returns:
+        str: Raw payload without the start byte, None if not available
+    """
+    raw = result.get('raw_response')
+    if not raw:
+        return None
+    raw = raw[0] if isinstance(raw, (list, tuple)) else raw
+    if isinstance(raw, bytes):
+        raw = raw.decode('ascii', 'ignore')
+    return raw[raw.find('(') + 1:]
+
+
+class ProtocolCodec(ABC):
+    """
+    Base class for an MPP Solar protocol codec.
+
+    A codec encodes driver commands into the protocol's wire commands,
+    validates decoded frames and decodes them into Inverter attributes.
+    Field tables are compiled into tuples at class creation, so decoding
+    a sample is a single pass over the table writing straight into the
+    target object, without building intermediate dictionaries.
+    """
+
+    name = None  # Registry key, also used in config (PROTOCOL)
+    mpp_protocol = None  # Protocol ID passed to mpp-solar
+    commands: Dict[str, str] = {}  # Driver command -> wire command
+    status_fields: FieldTable = ()  # QPIGS response fields
+    pv2_fields: FieldTable = ()  # QPIGS2 response fields
+    heat_sink_temp_key = None  # Raw heat sink temperature field (scaled by the profile)
+    mode_codes: Dict[str, str] = {}  # Decoded mode value -> PI30 mode byte
+    warning_flags: Dict[str, int] = PI30_WARNING_FLAGS  # Warning flag name -> QPIWS bit
+    fault_key = None  # Fault code field that maps onto the inverter fault bit
+
+    def supports(self, command: str) -> bool:
+        """
+        Check whether the protocol has an equivalent for a driver command.
+
+        Args:
+            command: Driver command (PI30 name)
+
+        Returns:
+            bool: True if the command can be encoded
+        """
+        return command in self.commands
+
+    def encode(self, command: str) -> str:
+        """
+        Encode a driver command into the protocol's wire command.
+
+        Args:
+            command: Driver command (PI30 name)
+
+        Returns:
+            str: Command to pass to mpp-solar
+
+        Raises:
+            KeyError: If the protocol has no equivalent command
+        """
+        return self.commands[command]
+
+    def validate(self, result) -> bool:
+        """
+        Check that a decoded response is a valid, non-error frame.
+
+        mpp-solar already verifies CRC and length; this rejects its error
+        results and NAK replies without stringifying the whole response.
+
+        Args:
+            result: Decoded response from mpp-solar
+
+        Returns:
+            bool: True if the response can be decoded
+        """
+        if not isinstance(result, dict) or not result or 'ERROR' in result:
+            return False
+        payload = raw_payload(result)
+        return payload is None or not payload.startswith('NAK')
+
+    @staticmethod
+    def decode_fields(fields: FieldTable, result, target):
+        """
+        Decode the fields of a table into attributes of the target.
+
+        Fields missing from the response keep their previous value.
+
+        Args:
+            fields: Compiled field table
+            result: Decoded response (dict with list values)
+            target: Object receiving the values (the Inverter)
+        """
+        get = result.get
+        for key, attr, scale in fields:
+            value = get(key)
+            if value is not None:
+                setattr(target, attr, float(value[0]) * scale)
+
+    def decode_status(self, result, target):
+        """
+        Decode a status (QPIGS equivalent) response into the target.
+
+        Args:
+            result: Decoded response
+            target: Object receiving the values (the Inverter)
+        """
+        self.decode_fields(self.status_fields, result, target)
+
+    def decode_pv2(self, result, target):
+        """
+        Decode a second tracker (QPIGS2 equivalent) response into the target.
+
+        Args:
+            result: Decoded response
+            target: Object receiving the values (the Inverter)
+        """
+        self.decode_fields(self.pv2_fields, result, target)
+
+    def decode_mode(self, result) -> Optional[str]:
+        """
+        Decode a device mode response into a PI30 mode byte.
+
+        Args:
+            result: Decoded response
+
+        Returns:
+            str: Mode byte (P, S, L, B, F, H or D), None if unknown
+        """
+        value = first_value(result)
+        mode = self.mode_codes.get(value)
+        if mode is None:
+            payload = raw_payload(result)
+            if payload:
+                mode = self.mode_codes.get(payload[:1]) or self.mode_codes.get(payload[:2])
+        return mode
+
+    def decode_warnings(self, result) -> Optional[str]:
+        """
+        Decode a warning status response into a QPIWS-ordered bitmap.
+
+        Args:
+            result: Decoded response
+
+        Returns:
+            str: Bitmap of '0'/'1' characters in PI30 bit order, None if unusable
+        """
+        bits = extract_warning_bits(result, self.warning_flags)
+        if bits is not None and self.fault_key is not None:
+            fault = result.get(self.fault_key)
+            if fault is not None and str(fault[0]).strip() not in ('0', '00', 'No fault'):
+                bits = bits[:INVERTER_FAULT_BIT] + '1' + bits[INVERTER_FAULT_BIT + 1:]
+        return bits
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.name!r})"
+
+
+class PI30Codec(ProtocolCodec):
+    """
+    PI30 protocol (Axpert, MKS, VM and most MPP Solar PIP models).
+    """
+
+    name = 'PI30'
+    mpp_protocol = 'PI30'
+    commands = {
+        'QPI': 'QPI',
+        'QMN': 'QMN',
+        'QVFW': 'QVFW',
+        'QPIGS': 'QPIGS',
+        'QPIGS2': 'QPIGS2',
+        'QMOD': 'QMOD',
+        'QPIWS': 'QPIWS',
+    }
+    status_fields = (
+        ('AC Output Voltage', 'ac_voltage', 1.0),
+        ('AC Output Frequency', 'frequency', 1.0),
+        ('AC Output Active Power', 'ac_power', 1.0),
+        ('AC Output Apparent Power', 'ac_apparent_power', 1.0),
+        ('AC Output Load', 'ac_load_percentage', 1.0),
+        ('AC Input Voltage', 'ac_input_voltage', 1.0),
+        ('AC Input Frequency', 'ac_input_frequency', 1.0),
+        ('Battery Voltage', '_battery_voltage', 1.0),
+        ('Battery Capacity', '_battery_soc', 1.0),
+        ('Battery Charging Current', '_battery_charging_current', 1.0),
+        ('Battery Discharge Current', '_battery_discharging_current', 1.0),
+        ('PV Input Voltage', 'pv_voltage', 1.0),
+        ('PV Input Current for Battery', 'pv_current', 1.0),
+        ('PV Input Power', 'pv_power', 1.0),
+        ('BUS Voltage', 'bus_voltage', 1.0),
+    )
+    pv2_fields = (
+        ('PV2 Input Voltage', 'pv2_voltage', 1.0),
+        ('PV2 Input Current', 'pv2_current', 1.0),
+        ('PV2 Charging Power', 'pv2_power', 1.0),
+    )
+    heat_sink_temp_key = 'Inverter Heat Sink Temperature'
+    mode_codes = {
+        'P': 'P', 'Power on': 'P',
+        'S': 'S', 'Standby': 'S',
+        'L': 'L', 'Line': 'L',
+        'B': 'B', 'Battery': 'B',
+        'F': 'F', 'Fault': 'F',
+        'H': 'H', 'Power saving': 'H',
+        'D': 'D', 'Shutdown': 'D',
+    }
+
+
+class PI30MaxCodec(PI30Codec):
+    """
+    PI30 MAX variant (dual MPPT models), which may name the first tracker PV1.
+    """
+
+    name = 'PI30MAX'
+    mpp_protocol = 'PI30MAX'
+    # Missing fields are skipped, so both namings can share one table
+    status_fields = PI30Codec.status_fields + (
+        ('PV1 Input Voltage', 'pv_voltage', 1.0),
+        ('PV1 Input Current', 'pv_current', 1.0),
+        ('PV1 Charging Power', 'pv_power', 1.0),
+    )
+
+
+class PI18Codec(ProtocolCodec):
+    """
+    PI18 protocol (InfiniSolar), '^P005GS' style framing handled by mpp-solar.
+
+    Both PV trackers are part of the general status, so no QPIGS2 is needed.
+    """
+
+    name = 'PI18'
+    mpp_protocol = 'PI18'
+    commands = {
+        'QPI': 'PI',
+        'QVFW': 'VFW',
+        'QPIGS': 'GS',
+        'QMOD': 'MOD',
+        'QPIWS': 'FWS',
+    }
+    status_fields = (
+        ('AC output voltage', 'ac_voltage', 1.0),
+        ('AC output frequency', 'frequency', 1.0),
+        ('AC output active power', 'ac_power', 1.0),
+        ('AC output apparent power', 'ac_apparent_power', 1.0),
+        ('Output load percent', 'ac_load_percentage', 1.0),
+        ('Grid voltage', 'ac_input_voltage', 1.0),
+        ('Grid frequency', 'ac_input_frequency', 1.0),
+        ('Battery voltage', '_battery_voltage', 1.0),
+        ('Battery capacity', '_battery_soc', 1.0),
+        ('Battery charging current', '_battery_charging_current', 1.0),
+        ('Battery discharge current', '_battery_discharging_current', 1.0),
+        ('PV1 Input voltage', 'pv_voltage', 1.0),
+        ('PV1 Input power', 'pv_power', 1.0),
+        ('PV2 Input voltage', 'pv2_voltage', 1.0),
+        ('PV2 Input power', 'pv2_power', 1.0),
+    )
+    heat_sink_temp_key = 'Inverter heat sink temperature'
+    mode_codes = PI1X_MODE_CODES
+    warning_flags = {
+        'Line fail': 5,
+        'Output circuit short': 6,
+        'Inverter over temperature': 9,
+        'Fan lock': 10,
+        'Battery voltage high': 11,
+        'Battery low': 12,
+        'Battery under': 14,
+        'Over load': 16,
+        'Eeprom fail': 17,
+        'Power limit': 25,
+        'MPPT1 overload warning': 28,
+        'MPPT2 overload warning': 28,
+        'Battery too low to charge for SCC1': 29,
+        'Battery too low to charge for SCC2': 29,
+    }
+    fault_key = 'Fault code'
+
+
+class PI17Codec(ProtocolCodec):
+    """
+    PI17 protocol (InfiniSolar three phase / hybrid), '^P003GS' style framing.
+    """
+
+    name = 'PI17'
+    mpp_protocol = 'PI17'
+    commands = {
+        'QPI': 'PI',
+        'QVFW': 'VFW',
+        'QPIGS': 'GS',
+        'QMOD': 'MOD',
+        'QPIWS': 'WS',
+    }
+    status_fields = (
+        ('AC output voltage R', 'ac_voltage', 1.0),
+        ('AC output frequency', 'frequency', 1.0),
+        ('AC output current R', 'ac_current', 1.0),
+        ('AC input voltage R', 'ac_input_voltage', 1.0),
+        ('AC input frequency', 'ac_input_frequency', 1.0),
+        ('Battery voltage', '_battery_voltage', 1.0),
+        ('Battery capacity', '_battery_soc', 1.0),
+        ('Battery current', '_battery_charging_current', 1.0),
+        ('Solar input voltage 1', 'pv_voltage', 1.0),
+        ('Solar input current 1', 'pv_current', 1.0),
+        ('Solar input voltage 2', 'pv2_voltage', 1.0),
+        ('Solar input current 2', 'pv2_current', 1.0),
+    )
+    heat_sink_temp_key = 'Inner temperature'
+    mode_codes = PI1X_MODE_CODES
+    warning_flags = {
+        'AC input voltage loss': 5,
+        'Over temperature': 9,
+        'Battery voltage too higher': 11,
+        'Battery low': 12,
+        'Battery under': 14,
+        'Over load': 16,
+        'Battery open': 22,
+    }
+
+
+# Registry of codec instances keyed by protocol name
+CODECS = {codec.name: codec for codec in (PI30Codec(), PI30MaxCodec(), PI18Codec(), PI17Codec())}
+
+# Order in which protocols are probed when PROTOCOL = AUTO. PI30 MAX answers
+# plain PI30 and is selected later from the model profile.
+PROBE_ORDER = ('PI30', 'PI18', 'PI17')
+
+
+def get_codec(name: str) -> Optional[ProtocolCodec]:
+    """
+    Look up a codec by protocol name.
+
+    Args:
+        name: Protocol name (case-insensitive, e.g. 'PI30', 'pi18')
+
+    Returns:
+        ProtocolCodec: Registered codec, None if unknown or AUTO
+    """
+    return CODECS.get((name or '').upper())
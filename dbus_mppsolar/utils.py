@@ -151,9 +151,17 @@ BAUD_RATE = int(get_config_value('BAUD_RATE', default=2400))
 PROTOCOL = get_config_value('PROTOCOL', default='PI30')
 TIMEOUT = int(get_config_value('TIMEOUT', default=5))
 POLL_INTERVAL = int(get_config_value('POLL_INTERVAL', default=1000))
+# Slow cadence for the QPIWS warning status query
+WARNING_POLL_INTERVAL = int(get_config_value('WARNING_POLL_INTERVAL', default=10000))
+# Cadence for the QMOD device mode query
+MODE_POLL_INTERVAL = int(get_config_value('MODE_POLL_INTERVAL', default=5000))
+# Maximum time in seconds a changed value may be held back by its publish deadband
+PUBLISH_HEARTBEAT = float(get_config_value('HEARTBEAT', 'PUBLISH', 60))
 
 # Debug configuration
 DEBUG_ENABLED = get_bool_from_config('DEBUG', 'MPPSOLAR', default=False)
+# Ring buffer size of the debug tap (0 = disabled)
+DEBUG_TAP_SIZE = int(get_config_value('DEBUG_TAP_SIZE', default=0))
 
 # D-Bus constants - updated for Multi/Solar Charger/Battery architecture
 # Primary service: Multi (inverter/charger functionality)
@@ -198,6 +206,9 @@ def publish_config_variables(dbusservice):
         'PROTOCOL': PROTOCOL,
         'TIMEOUT': TIMEOUT,
         'POLL_INTERVAL': POLL_INTERVAL,
+        'WARNING_POLL_INTERVAL': WARNING_POLL_INTERVAL,
+        'MODE_POLL_INTERVAL': MODE_POLL_INTERVAL,
+        'PUBLISH_HEARTBEAT': PUBLISH_HEARTBEAT,
         'DBUS_SERVICE_NAME': DBUS_SERVICE_NAME,
         'DEVICE_INSTANCE': DEVICE_INSTANCE,
         'PRODUCT_NAME': PRODUCT_NAME,
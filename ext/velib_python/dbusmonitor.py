@@ -21,7 +21,8 @@ import dbus
 import dbus.service
 import logging
 import os
-from collections import defaultdict
+import time
+from collections import defaultdict, deque
 from functools import partial
 
 # our own packages
@@ -33,6 +34,9 @@ VE_INTERFACE = "com.victronenergy.BusItem"
 # For lookups where None is a valid result
 notfound = object()
 
+# Default number of services AsyncDbusMonitor scans at the same time
+SCAN_CONCURRENCY = 8
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 class SystemBus(dbus.bus.BusConnection):
@@ -80,18 +84,37 @@ class Service(object):
 	def service_class(self):
 		return '.'.join(self.name.split('.')[:3])
 
+## Tracks an async scan. Services are started with startscan(progress, service), at most
+# concurrency at a time (0 for no limit), and the time each scan took is stored in timings.
 class ScanProgress(object):
-	def __init__(self, onfinish):
+	def __init__(self, onfinish, startscan=None, concurrency=0, timings=None):
 		self.services = set()
 		self.errors = set()
 		self.onfinish = onfinish
+		self.startscan = startscan
+		self.concurrency = concurrency
+		self.queue = deque()
+		self.running = {}  # service -> time.monotonic() when its scan started
+		self.timings = {} if timings is None else timings
 
 	def add(self, service):
 		self.services.add(service)
+		self.queue.append(service)
+
+	def run(self):
+		while self.queue and (not self.concurrency or len(self.running) < self.concurrency):
+			service = self.queue.popleft()
+			self.running[service] = time.monotonic()
+			self.startscan(self, service)
 
 	def complete(self, service):
+		started = self.running.pop(service, None)
+		if started is not None:
+			self.timings[service] = time.monotonic() - started
 		self.services.discard(service)
-		if not self.services and self.onfinish is not None:
+		if self.queue:
+			self.run()
+		elif not self.services and self.onfinish is not None:
 			# services is empty now
 			self.onfinish(list(self.errors))
 
@@ -103,11 +126,22 @@ class DbusMonitor(object):
 	## Constructor
 	def __init__(self, dbusTree, valueChangedCallback=None,
 			deviceAddedCallback=None, deviceRemovedCallback=None,
-			namespace="com.victronenergy", ignoreServices=[]):
+			namespace="com.victronenergy", ignoreServices=[], valuesChangedCallback=None):
 		# valueChangedCallback is the callback that we call when something has changed.
 		# def value_changed_on_dbus(dbusServiceName, dbusPath, options, changes, deviceInstance):
 		# in which changes is a tuple with GetText() and GetValue()
 		self.valueChangedCallback = valueChangedCallback
+
+		# valuesChangedCallback is the batch-aware alternative, called once per mainloop iteration
+		# with all changes since the previous call, in the order they arrived:
+		# def values_changed_on_dbus(changes):
+		# in which changes is a list of (dbusServiceName, dbusPath, options, changes, deviceInstance)
+		# tuples. When set, it is called instead of valueChangedCallback.
+		self.valuesChangedCallback = valuesChangedCallback
+
+		# Changes waiting for the idle callback that delivers them, and whether it is scheduled
+		self._pending_changes = []
+		self._dispatch_scheduled = False
 		self.deviceAddedCallback = deviceAddedCallback
 		self.deviceRemovedCallback = deviceRemovedCallback
 		self.dbusTree = dbusTree
@@ -126,6 +160,9 @@ class DbusMonitor(object):
 		# Keep track of any additional watches placed on items
 		self.serviceWatches = defaultdict(list)
 
+		# Signal match rules per service name, as (serviceId, [matches])
+		self.serviceMatches = {}
+
 		# For a PC, connect to the SessionBus
 		# For a CCGX, connect to the SystemBus
 		self.dbusConn = SessionBus() if 'DBUS_SESSION_BUS_ADDRESS' in os.environ else SystemBus()
@@ -137,17 +174,8 @@ class DbusMonitor(object):
 
 		add_name_owner_changed_receiver(standardBus, self.dbus_name_owner_changed)
 
-		# Subscribe to PropertiesChanged for all services
-		self.dbusConn.add_signal_receiver(self.handler_value_changes,
-			dbus_interface='com.victronenergy.BusItem',
-			signal_name='PropertiesChanged', path_keyword='path',
-			sender_keyword='senderId')
-
-		# Subscribe to ItemsChanged for all services
-		self.dbusConn.add_signal_receiver(self.handler_item_changes,
-			dbus_interface='com.victronenergy.BusItem',
-			signal_name='ItemsChanged', path='/',
-			sender_keyword='senderId')
+		# PropertiesChanged and ItemsChanged are subscribed to per service, see add_service_matches,
+		# so that dbus-daemon does not deliver the changes of services we do not monitor.
 
 		logger.info('===== Scanning dbus... =====')
 		self._scan_dbus()
@@ -188,6 +216,7 @@ class DbusMonitor(object):
 		elif name in self.servicesByName:
 			# it disappeared, we need to remove it.
 			logger.info("%s disappeared from the dbus. Removing it from our lists" % name)
+			self.remove_service_matches(name)
 			service = self.servicesByName[name]
 			del self.servicesById[service.id]
 			del self.servicesByName[name]
@@ -207,16 +236,45 @@ class DbusMonitor(object):
 	def wanted_service_names(self):
 		return [s for s in self.dbusConn.list_names() if self.service_wanted(s)]
 
+	## Subscribes to the changes of one service. The match rules carry the unique name of the service,
+	# so dbus-daemon filters out the traffic of all other services. Two rules per service, whatever
+	# the number of monitored paths, keep the connection well below the match rule limit of the
+	# daemon (max_match_rules_per_connection); paths that are not monitored are dropped in
+	# _handler_value_changes. Installed before the values are fetched, so no change is missed.
+	def add_service_matches(self, serviceName, serviceId):
+		current = self.serviceMatches.get(serviceName)
+		if current is not None:
+			if current[0] == serviceId:
+				return
+			self.remove_service_matches(serviceName)
+
+		matches = [
+			self.dbusConn.add_signal_receiver(self.handler_item_changes,
+				dbus_interface=VE_INTERFACE, signal_name='ItemsChanged', path='/',
+				bus_name=serviceId, sender_keyword='senderId'),
+			self.dbusConn.add_signal_receiver(self.handler_value_changes,
+				dbus_interface=VE_INTERFACE, signal_name='PropertiesChanged',
+				bus_name=serviceId, path_keyword='path', sender_keyword='senderId'),
+		]
+		self.serviceMatches[serviceName] = (serviceId, matches)
+
+	def remove_service_matches(self, serviceName):
+		_, matches = self.serviceMatches.pop(serviceName, (None, ()))
+		for match in matches:
+			match.remove()
+
 	def scan_dbus_service(self, serviceName):
 		# make it a normal string instead of dbus string
 		serviceName = str(serviceName)
 		try:
-			return self.scan_dbus_service_inner(serviceName)
+			if self.scan_dbus_service_inner(serviceName):
+				return True
 		except:
 			logger.error("Ignoring %s because of error while scanning:" % (serviceName))
 			import traceback
 			traceback.print_exc()
-			return False
+		self.remove_service_matches(serviceName)
+		return False
 
 			# Errors 'org.freedesktop.DBus.Error.ServiceUnknown' and
 			# 'org.freedesktop.DBus.Error.Disconnected' seem to happen when the service
@@ -227,6 +285,9 @@ class DbusMonitor(object):
 	# it to our list of monitored D-Bus services.
 	def scan_dbus_service_inner(self, serviceName):
 		logger.info("Found: %s, scanning and storing items" % serviceName)
+		serviceId = self.dbusConn.get_name_owner(serviceName)
+		self.add_service_matches(serviceName, serviceId)
+
 		# Try to fetch everything with a GetItems, then fall back to older
 		# methods if that fails
 		try:
@@ -234,7 +295,6 @@ class DbusMonitor(object):
 		except dbus.exceptions.DBusException:
 			logger.info("GetItems failed, trying legacy methods")
 		else:
-			serviceId = self.dbusConn.get_name_owner(serviceName)
 			return self.scan_dbus_service_getitems_done(serviceName, serviceId, values) is not None
 
 		return self.scan_dbus_service_legacy(serviceName)
@@ -256,6 +316,7 @@ class DbusMonitor(object):
 
 		logger.info("       %s has device instance %s" % (serviceName, di))
 		serviceId = self.dbusConn.get_name_owner(serviceName)
+		self.add_service_matches(serviceName, serviceId)
 		service = self.make_service(serviceId, serviceName, di)
 
 		# Let's try to fetch everything in one go
@@ -401,19 +462,32 @@ class DbusMonitor(object):
 		a.value = value
 		a.text = text
 
-		# And do the rest of the processing in on the mainloop
-		if self.valueChangedCallback is not None:
-			GLib.idle_add(exit_on_error, self._execute_value_changes, service.name, path, {
-				'Value': value, 'Text': text}, a.options)
-
-	def _execute_value_changes(self, serviceName, objectPath, changes, options):
-		# double check that the service still exists, as it might have
+		# And do the rest of the processing in on the mainloop. All changes that arrive before
+		# it gets there, for example all entries of one ItemsChanged, share one idle callback.
+		if self.valueChangedCallback is not None or self.valuesChangedCallback is not None:
+			self._pending_changes.append((service.name, path, {
+				'Value': value, 'Text': text}, a.options))
+			if not self._dispatch_scheduled:
+				self._dispatch_scheduled = True
+				GLib.idle_add(exit_on_error, self._execute_value_changes)
+
+	def _execute_value_changes(self):
+		pending = self._pending_changes
+		self._pending_changes = []
+		self._dispatch_scheduled = False
+
+		# double check that the services still exist, as they might have
 		# disappeared between scheduling-for and executing this function.
-		if serviceName not in self.servicesByName:
-			return
+		batch = [(serviceName, objectPath, options, changes, self.get_device_instance(serviceName))
+			for serviceName, objectPath, changes, options in pending
+			if serviceName in self.servicesByName]
 
-		self.valueChangedCallback(serviceName, objectPath,
-			options, changes, self.get_device_instance(serviceName))
+		if self.valuesChangedCallback is not None:
+			if batch:
+				self.valuesChangedCallback(batch)
+		else:
+			for args in batch:
+				self.valueChangedCallback(*args)
 
 	# Gets the value for a certain servicename and path
 	# The default_value is returned when:
@@ -547,12 +621,25 @@ class DbusMonitor(object):
 		self.deviceAddedCallback = callback
 
 class AsyncDbusMonitor(DbusMonitor):
-	def __init__(self, *args, scanCompleteCallback=None, **kwargs):
+	def __init__(self, *args, scanCompleteCallback=None, scanConcurrency=SCAN_CONCURRENCY,
+			legacyScan=False, **kwargs):
+		# The initial scan starts from the DbusMonitor constructor, so set these up first
+		self.scanConcurrency = scanConcurrency
+
+		# Services that support neither GetItems nor GetValue on the root are only scanned, path
+		# by path and blocking the main loop, when legacyScan is set. Otherwise they are ignored.
+		self.legacyScan = legacyScan
+
+		# Duration in seconds of the last scan of each service, indexed by service name
+		self.scanTimings = {}
+
 		super().__init__(*args, **kwargs)
 		self.scanCompleteCallback = scanCompleteCallback
 
 	def _scan_dbus(self):
-		# Pass True, this is an initial scan triggered at startup
+		# Pass True, this is an initial scan triggered at startup. Scans of services that appear
+		# later do not touch the start time, so the duration logged at the end stays right.
+		self._startupScanStarted = time.monotonic()
 		self.scan_dbus_services_async(callback=partial(
 			self._async_scan_callback, True))
 
@@ -561,25 +648,40 @@ class AsyncDbusMonitor(DbusMonitor):
 			callback=partial(self._async_scan_callback, False))
 
 	def _async_scan_callback(self, startup, errors):
-		# Do a legacy scan on services that could not be scanned with GetItems
+		# Services that could not be scanned with GetItems nor with GetValue on the root
 		for name in errors:
-			logging.info(f"Doing legacy scan on {name}")
-			if self.scan_dbus_service_legacy(name) and \
-						  self.deviceAddedCallback is not None:
+			if not self.legacyScan:
+				logger.info(f"Ignoring {name}, it supports neither GetItems nor GetValue on /")
+				self.remove_service_matches(name)
+				continue
+			logger.info(f"Doing legacy scan on {name}")
+			if not self.scan_dbus_service_legacy(name):
+				self.remove_service_matches(name)
+			elif self.deviceAddedCallback is not None:
 				self.deviceAddedCallback(name, self.get_device_instance(name))
 
 		if startup:
 			logger.info('===== Async scan complete =====')
+			if self.scanTimings:
+				slowest = max(self.scanTimings, key=self.scanTimings.get)
+				logger.info("Scanned %d services in %.2fs, slowest %s in %.2fs" % (
+					len(self.scanTimings), time.monotonic() - self._startupScanStarted,
+					slowest, self.scanTimings[slowest]))
 			if self.scanCompleteCallback is not None:
 				self.scanCompleteCallback(self)
 
-	# Async scan, starting with GetNameOwner and then GetItems
+	# Async scan, starting with GetNameOwner and then GetItems. At most scanConcurrency
+	# services are scanned at the same time.
 	def scan_dbus_services_async(self, services=None, callback=None):
-		progress = ScanProgress(callback)
+		progress = ScanProgress(callback, self._scan_service_async,
+			self.scanConcurrency, self.scanTimings)
 		for serviceName in services if services else self.wanted_service_names():
-			# Start by getting nameowner
 			progress.add(serviceName)
-			self.get_name_owner_async(progress, serviceName)
+		progress.run()
+
+	def _scan_service_async(self, progress, serviceName):
+		# Start by getting nameowner
+		self.get_name_owner_async(progress, serviceName)
 
 	def scan_async_error(error, progress, serviceName, exc):
 		logger.error("Ignoring %s because of error while scanning:" % (serviceName))
@@ -596,6 +698,7 @@ class AsyncDbusMonitor(DbusMonitor):
 			partial(self.scan_async_error, progress, serviceName))
 
 	def get_name_owner_async_done(self, progress, serviceName, owner):
+		self.add_service_matches(serviceName, owner)
 		self.dbusConn.call_async(serviceName, '/', VE_INTERFACE,
 			'GetItems', '', [],
 			partial(self.get_items_async_done, progress, serviceName, owner),
@@ -611,8 +714,32 @@ class AsyncDbusMonitor(DbusMonitor):
 			progress.error(serviceName)
 
 	def get_items_async_error(self, progress, serviceName, owner, exc):
-		# Fall back to fetching deviceinstance, and GetValue/GetText
-		# Store item, so it can be scanned later
+		# Fall back to the legacy GetValue and GetText on the root, which return
+		# all values and texts in one call each.
+		self.dbusConn.call_async(serviceName, '/', VE_INTERFACE,
+			'GetValue', '', [],
+			partial(self.get_values_async_done, progress, serviceName, owner),
+			partial(self.get_values_async_error, progress, serviceName))
+
+	def get_values_async_done(self, progress, serviceName, owner, values):
+		if not isinstance(values, dict):
+			progress.error(serviceName)
+			return
+		self.dbusConn.call_async(serviceName, '/', VE_INTERFACE,
+			'GetText', '', [],
+			partial(self.get_texts_async_done, progress, serviceName, owner, values),
+			partial(self.get_values_async_error, progress, serviceName))
+
+	def get_texts_async_done(self, progress, serviceName, owner, values, texts):
+		if not isinstance(texts, dict):
+			texts = {}
+		# Subtree results have paths relative to the root, convert them to the GetItems format
+		items = {'/' + path: {'Value': value, 'Text': texts.get(path)}
+			for path, value in values.items()}
+		self.get_items_async_done(progress, serviceName, owner, items)
+
+	def get_values_async_error(self, progress, serviceName, exc):
+		# Store item, so it can be scanned later with the per path legacy scan if enabled
 		progress.error(serviceName)
 
 
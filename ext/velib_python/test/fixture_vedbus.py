@@ -13,7 +13,7 @@ import os
 # our own packages
 sys.path.insert(1, os.path.join(os.path.dirname(__file__), '../'))
 from gi.repository import GLib
-from vedbus import VeDbusItemExport
+from vedbus import VeDbusItemExport, VeDbusService
 
 # Dictionary containing all objects exported to dbus
 dbusObjects = {}
@@ -27,6 +27,13 @@ def changerequest(path, newvalue):
 def gettext(path, value):
 	return 'gettexted %s %s' % (path, value)
 
+gettextcalls = 0
+
+def gettextcounter(path, value):
+	global gettextcalls
+	gettextcalls += 1
+	return '%s (request %d)' % (value, gettextcalls)
+
 def main(argv):
 		global dbusObjects
 
@@ -47,6 +54,7 @@ def main(argv):
 		dbusObjects['int'] = VeDbusItemExport(dbusConn, '/Int', 40000)
 		dbusObjects['negativeInt'] = VeDbusItemExport(dbusConn, '/NegativeInt', -10)
 		dbusObjects['float'] = VeDbusItemExport(dbusConn, '/Float', 1.5)
+		dbusObjects['typed'] = VeDbusItemExport(dbusConn, '/TypedDouble', 230, dbustype=dbus.Double)
 		dbusObjects['invalid'] = VeDbusItemExport(dbusConn, '/Invalid', None)
 		dbusObjects['byte'] = VeDbusItemExport(dbusConn, '/Byte', dbus.Byte(84))
 		dbusObjects['writeable'] = VeDbusItemExport(dbusConn, '/Writeable', 'original', writeable=True)
@@ -58,6 +66,23 @@ def main(argv):
 		dbusObjects['gettextcallback'] = VeDbusItemExport(dbusConn, '/Gettextcallback',
 			'10', gettextcallback=gettext, writeable=True)
 
+		dbusObjects['gettextcounter'] = VeDbusItemExport(dbusConn, '/GettextCounter',
+			5, gettextcallback=gettextcounter)
+
+		# A service with tree nodes that are only created on first use, see VeDbusService.add_paths.
+		# It gets its own connection, so its root object does not clash with the items above.
+		serviceConn = dbus.SessionBus(private=True) if 'DBUS_SESSION_BUS_ADDRESS' in os.environ \
+			else dbus.SystemBus(private=True)
+		service = VeDbusService('com.victronenergy.dbusexample.service', bus=serviceConn, register=False)
+		service.add_paths([
+			('/Ac/L1/Power', 100),
+			('/Ac/L1/Voltage', 230),
+			{'path': '/Ac/Frequency', 'value': 50.0, 'dbustype': dbus.Double},
+			('/Serial', 'HQ1234'),
+		])
+		service.register()
+		dbusObjects['service'] = service
+
 		mainloop = GLib.MainLoop()
 		print("up and running")
 		sys.stdout.flush()
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Python
+import logging
+import os
+import sys
+import unittest
+from collections import deque
+from unittest import mock
+
+import dbus
+
+# Local
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), '../'))
+import dbusmonitor
+from dbusmonitor import DbusMonitor, AsyncDbusMonitor, ScanProgress, VE_INTERFACE
+from ve_utils import wrap_dbus_value
+import mock_gobject
+
+dummy = {'code': None, 'whenToLog': 'configChange', 'accessLevel': None}
+
+TREE = {
+	'com.victronenergy.vebus': {
+		'/DeviceInstance': dummy,
+		'/Mode': dummy,
+		'/Ac/Out/L1/P': dummy,
+	},
+}
+
+def unknown_method():
+	return dbus.exceptions.DBusException('No such method',
+		name='org.freedesktop.DBus.Error.UnknownMethod')
+
+class FakeMatch(object):
+	def __init__(self, bus, handler, rule):
+		self.bus = bus
+		self.handler = handler
+		self.rule = rule
+
+	def remove(self):
+		self.bus.matches.remove(self)
+
+## Stands in for the connection of the monitor. Answers the calls DbusMonitor makes from the
+# services given to it, records the signal receivers, and queues async calls until step() or
+# run() delivers them.
+class FakeBus(object):
+	def __init__(self):
+		self.services = {}
+		self.matches = []
+		self.calls = deque()
+		self.delivered = []
+
+	def add_service(self, name, owner, values, getitems=True, rootvalues=True):
+		self.services[name] = {'owner': owner, 'values': values, 'getitems': getitems,
+			'rootvalues': rootvalues}
+
+	def list_names(self):
+		return list(self.services)
+
+	def get_name_owner(self, name):
+		return self.services[name]['owner']
+
+	def add_signal_receiver(self, handler, **rule):
+		match = FakeMatch(self, handler, rule)
+		self.matches.append(match)
+		return match
+
+	def call_blocking(self, name, path, interface, method, signature, args):
+		if name == 'org.freedesktop.DBus' and method == 'GetNameOwner':
+			return self.get_name_owner(args[0])
+		service = self.services[name]
+		values = service['values']
+		if method == 'GetItems':
+			if not service['getitems']:
+				raise unknown_method()
+			return {p: {'Value': wrap_dbus_value(v), 'Text': str(v)} for p, v in values.items()}
+		if path == '/':
+			if not service['rootvalues']:
+				raise unknown_method()
+			if method == 'GetValue':
+				return {p[1:]: wrap_dbus_value(v) for p, v in values.items()}
+			return {p[1:]: str(v) for p, v in values.items()}
+		if path not in values:
+			raise dbus.exceptions.DBusException('No such object',
+				name='org.freedesktop.DBus.Error.UnknownObject')
+		return wrap_dbus_value(values[path]) if method == 'GetValue' else str(values[path])
+
+	def call_async(self, name, path, interface, method, signature, args, reply_handler, error_handler):
+		self.calls.append((name, path, method, args, reply_handler, error_handler))
+
+	## Delivers the oldest queued async call
+	def step(self):
+		name, path, method, args, reply_handler, error_handler = self.calls.popleft()
+		self.delivered.append((name, path, method))
+		try:
+			result = self.call_blocking(name, path, VE_INTERFACE, method, '', args)
+		except dbus.exceptions.DBusException as e:
+			error_handler(e)
+		else:
+			reply_handler(result)
+
+	def run(self):
+		while self.calls:
+			self.step()
+
+class MockGLib(object):
+	pass
+
+class DbusMonitorTestBase(unittest.TestCase):
+	# DbusMonitor talks to a FakeBus instead of the D-Bus, and its idle callbacks run on the
+	# mock_gobject timer manager.
+
+	def setUp(self):
+		self.bus = FakeBus()
+		self.bus.add_service('com.victronenergy.vebus.ttyO1', ':1.10',
+			{'/DeviceInstance': 257, '/Mode': 3, '/Ac/Out/L1/P': 1200.0})
+		self.bus.add_service('com.victronenergy.other', ':1.11', {'/DeviceInstance': 0})
+
+		glib = MockGLib()
+		mock_gobject.patch_gobject(glib)
+		mock_gobject.timer_manager.reset()
+		patches = (
+			mock.patch.object(dbusmonitor, 'SessionBus', lambda: self.bus),
+			mock.patch.object(dbusmonitor, 'SystemBus', lambda: self.bus),
+			mock.patch.object(dbusmonitor.dbus, 'SessionBus', lambda: None),
+			mock.patch.object(dbusmonitor.dbus, 'SystemBus', lambda: None),
+			mock.patch.object(dbusmonitor, 'add_name_owner_changed_receiver', lambda bus, callback: None),
+			mock.patch.object(dbusmonitor, 'GLib', glib),
+		)
+		for p in patches:
+			p.start()
+			self.addCleanup(p.stop)
+
+	def idle_callbacks(self):
+		return len(mock_gobject.timer_manager._resources)
+
+	def run_idle(self):
+		mock_gobject.timer_manager.run()
+
+class DbusMonitorChangesTests(DbusMonitorTestBase):
+	def setUp(self):
+		DbusMonitorTestBase.setUp(self)
+		self.batches = []
+		self.changes = []
+		self.service = 'com.victronenergy.vebus.ttyO1'
+
+	def test_changes_batched_per_idle(self):
+		m = DbusMonitor(TREE, valuesChangedCallback=self.batches.append)
+		m.handler_item_changes({
+			'/Mode': {'Value': wrap_dbus_value(1), 'Text': 'Charger only'},
+			'/Ac/Out/L1/P': {'Value': wrap_dbus_value(1300.0), 'Text': '1300 W'},
+			'/NotMonitored': {'Value': wrap_dbus_value(1), 'Text': '1'},
+		}, senderId=':1.10')
+		m.handler_value_changes({'Value': wrap_dbus_value(1400.0), 'Text': '1400 W'},
+			path='/Ac/Out/L1/P', senderId=':1.10')
+
+		# Stored right away, delivered from a single idle callback
+		self.assertEqual(1400.0, m.get_value(self.service, '/Ac/Out/L1/P'))
+		self.assertEqual(3, len(m._pending_changes))
+		self.assertEqual(1, self.idle_callbacks())
+		self.assertEqual([], self.batches)
+
+		self.run_idle()
+		self.assertEqual(1, len(self.batches))
+		self.assertEqual([
+			(self.service, '/Mode', dummy, {'Value': 1, 'Text': 'Charger only'}, 257),
+			(self.service, '/Ac/Out/L1/P', dummy, {'Value': 1300.0, 'Text': '1300 W'}, 257),
+			(self.service, '/Ac/Out/L1/P', dummy, {'Value': 1400.0, 'Text': '1400 W'}, 257),
+		], self.batches[0])
+		self.assertEqual([], m._pending_changes)
+		self.assertFalse(m._dispatch_scheduled)
+
+		# The next change schedules a new callback
+		m.handler_value_changes({'Value': wrap_dbus_value(2)}, path='/Mode', senderId=':1.10')
+		self.assertEqual(1, self.idle_callbacks())
+		self.run_idle()
+		self.assertEqual([(self.service, '/Mode', dummy, {'Value': 2, 'Text': '2'}, 257)], self.batches[1])
+
+	def test_unchanged_and_unknown_not_queued(self):
+		m = DbusMonitor(TREE, valuesChangedCallback=self.batches.append)
+		m.handler_value_changes({'Value': wrap_dbus_value(3)}, path='/Mode', senderId=':1.10')
+		m.handler_value_changes({'Value': wrap_dbus_value(1)}, path='/Mode', senderId=':1.99')
+		m.handler_value_changes({'Text': 'no value'}, path='/Mode', senderId=':1.10')
+		self.assertEqual([], m._pending_changes)
+		self.assertEqual(0, self.idle_callbacks())
+
+	def test_value_changed_callback_per_change(self):
+		m = DbusMonitor(TREE, lambda *args: self.changes.append(args))
+		m.handler_item_changes({
+			'/Mode': {'Value': wrap_dbus_value(1), 'Text': 'Charger only'},
+			'/Ac/Out/L1/P': {'Value': wrap_dbus_value(1300.0), 'Text': '1300 W'},
+		}, senderId=':1.10')
+		self.assertEqual(1, self.idle_callbacks())
+		self.run_idle()
+		self.assertEqual([
+			(self.service, '/Mode', dummy, {'Value': 1, 'Text': 'Charger only'}, 257),
+			(self.service, '/Ac/Out/L1/P', dummy, {'Value': 1300.0, 'Text': '1300 W'}, 257),
+		], self.changes)
+
+	def test_values_changed_callback_preferred(self):
+		m = DbusMonitor(TREE, lambda *args: self.changes.append(args),
+			valuesChangedCallback=self.batches.append)
+		m.handler_value_changes({'Value': wrap_dbus_value(1)}, path='/Mode', senderId=':1.10')
+		self.run_idle()
+		self.assertEqual([], self.changes)
+		self.assertEqual(1, len(self.batches))
+
+	def test_changes_of_removed_service_dropped(self):
+		m = DbusMonitor(TREE, valuesChangedCallback=self.batches.append)
+		m.handler_value_changes({'Value': wrap_dbus_value(1)}, path='/Mode', senderId=':1.10')
+		m._process_name_owner_changed(self.service, ':1.10', '')
+		self.run_idle()
+		self.assertEqual([], self.batches)
+
+class DbusMonitorMatchTests(DbusMonitorTestBase):
+	def service_rules(self, owner):
+		return sorted((m.rule['signal_name'], m.rule.get('path')) for m in self.bus.matches
+			if m.rule.get('bus_name') == owner)
+
+	def test_one_match_per_signal_per_service(self):
+		m = DbusMonitor(TREE)
+		self.assertEqual([('ItemsChanged', '/'), ('PropertiesChanged', None)], self.service_rules(':1.10'))
+		self.assertEqual(2, len(self.bus.matches))
+		self.assertEqual([':1.10'], [owner for owner, _ in m.serviceMatches.values()])
+
+		items, values = sorted(self.bus.matches, key=lambda match: match.rule['signal_name'])
+		self.assertEqual(m.handler_item_changes, items.handler)
+		self.assertEqual(m.handler_value_changes, values.handler)
+		self.assertEqual(VE_INTERFACE, values.rule['dbus_interface'])
+
+	def test_many_paths_still_two_matches(self):
+		tree = {'com.victronenergy.vebus': {'/Path%d' % i: dummy for i in range(50)}}
+		tree['com.victronenergy.vebus']['/DeviceInstance'] = dummy
+		DbusMonitor(tree)
+		self.assertEqual(2, len(self.bus.matches))
+
+	def test_add_service_matches(self):
+		m = DbusMonitor(TREE)
+		m.add_service_matches(self.service_name(), ':1.10')
+		self.assertEqual(2, len(self.bus.matches))
+
+		# A new owner replaces the rules of the previous one
+		m.add_service_matches(self.service_name(), ':1.20')
+		self.assertEqual([], self.service_rules(':1.10'))
+		self.assertEqual([('ItemsChanged', '/'), ('PropertiesChanged', None)], self.service_rules(':1.20'))
+
+	def test_remove_service_matches(self):
+		m = DbusMonitor(TREE)
+		m.remove_service_matches(self.service_name())
+		self.assertEqual([], self.bus.matches)
+		self.assertEqual({}, m.serviceMatches)
+		# Removing twice is harmless
+		m.remove_service_matches(self.service_name())
+
+	def test_matches_removed_with_service(self):
+		m = DbusMonitor(TREE)
+		m._process_name_owner_changed(self.service_name(), ':1.10', '')
+		self.assertEqual([], self.bus.matches)
+
+	def test_matches_removed_when_scan_fails(self):
+		self.bus.add_service('com.victronenergy.vebus.ttyO1', ':1.10', {'/Mode': 3})
+		m = DbusMonitor(TREE)
+		self.assertEqual({}, m.servicesByName)
+		self.assertEqual([], self.bus.matches)
+
+	def service_name(self):
+		return 'com.victronenergy.vebus.ttyO1'
+
+class ScanProgressTests(unittest.TestCase):
+	def setUp(self):
+		self.started = []
+		self.finished = []
+
+	def test_bounded_queue(self):
+		progress = ScanProgress(self.finished.append, lambda p, s: self.started.append(s), 2)
+		for service in ('a', 'b', 'c', 'd', 'e'):
+			progress.add(service)
+		progress.run()
+		self.assertEqual(['a', 'b'], self.started)
+		self.assertEqual(2, len(progress.running))
+
+		progress.complete('a')
+		self.assertEqual(['a', 'b', 'c'], self.started)
+		progress.error('b')
+		progress.complete('c')
+		self.assertEqual(['a', 'b', 'c', 'd', 'e'], self.started)
+		self.assertEqual([], self.finished)
+		progress.complete('d')
+		progress.complete('e')
+		self.assertEqual([['b']], self.finished)
+		self.assertEqual({'a', 'b', 'c', 'd', 'e'}, set(progress.timings))
+
+	def test_unbounded(self):
+		progress = ScanProgress(self.finished.append, lambda p, s: self.started.append(s))
+		for service in ('a', 'b', 'c'):
+			progress.add(service)
+		progress.run()
+		self.assertEqual(['a', 'b', 'c'], self.started)
+
+class AsyncDbusMonitorTests(DbusMonitorTestBase):
+	def setUp(self):
+		DbusMonitorTestBase.setUp(self)
+		self.added = []
+		self.completed = []
+
+	def monitor(self, **kwargs):
+		return AsyncDbusMonitor(TREE, deviceAddedCallback=lambda *args: self.added.append(args),
+			scanCompleteCallback=self.completed.append, **kwargs)
+
+	def test_scan_concurrency(self):
+		for i in range(5):
+			self.bus.add_service('com.victronenergy.vebus.ttyUSB%d' % i, ':1.%d' % (20 + i),
+				{'/DeviceInstance': i})
+		m = self.monitor(scanConcurrency=2)
+
+		# Two scans in flight, one call each, the other services wait in the queue
+		self.assertEqual(2, len(self.bus.calls))
+		while self.bus.calls:
+			self.assertLessEqual(len(self.bus.calls), 2)
+			self.bus.step()
+
+		self.assertEqual([m], self.completed)
+		self.assertEqual(6, len(m.servicesByName))
+		self.assertEqual(6, len(m.scanTimings))
+
+	def test_default_concurrency(self):
+		for i in range(20):
+			self.bus.add_service('com.victronenergy.vebus.ttyUSB%d' % i, ':1.%d' % (20 + i),
+				{'/DeviceInstance': i})
+		m = self.monitor()
+		self.assertEqual(dbusmonitor.SCAN_CONCURRENCY, m.scanConcurrency)
+		self.assertEqual(dbusmonitor.SCAN_CONCURRENCY, len(self.bus.calls))
+		self.bus.run()
+		self.assertEqual(21, len(m.servicesByName))
+
+	def test_root_fallback(self):
+		self.bus.add_service('com.victronenergy.vebus.ttyO1', ':1.10',
+			{'/DeviceInstance': 257, '/Mode': 3, '/Ac/Out/L1/P': 1200.0}, getitems=False)
+		m = self.monitor()
+		self.bus.run()
+
+		service = 'com.victronenergy.vebus.ttyO1'
+		self.assertEqual([
+			('org.freedesktop.DBus', '/org/freedesktop/DBus', 'GetNameOwner'),
+			(service, '/', 'GetItems'),
+			(service, '/', 'GetValue'),
+			(service, '/', 'GetText'),
+		], self.bus.delivered)
+		self.assertIn((service, 257), self.added)
+		self.assertEqual(3, m.get_value(service, '/Mode'))
+		self.assertEqual(1200.0, m.get_value(service, '/Ac/Out/L1/P'))
+		self.assertEqual('3', m.servicesByName[service].paths['/Mode'].text)
+		self.assertTrue(m.seen(service, '/Mode'))
+		self.assertEqual([m], self.completed)
+
+	def test_no_per_path_fallback(self):
+		self.bus.add_service('com.victronenergy.vebus.ttyO1', ':1.10',
+			{'/DeviceInstance': 257, '/Mode': 3}, getitems=False, rootvalues=False)
+		m = self.monitor()
+		self.bus.run()
+
+		service = 'com.victronenergy.vebus.ttyO1'
+		self.assertNotIn(service, m.servicesByName)
+		self.assertNotIn(service, m.serviceMatches)
+		self.assertNotIn((service, 257), self.added)
+		self.assertIn('com.victronenergy.other', m.servicesByName)
+		self.assertEqual([m], self.completed)
+
+	def test_per_path_fallback(self):
+		self.bus.add_service('com.victronenergy.vebus.ttyO1', ':1.10',
+			{'/DeviceInstance': 257, '/Mode': 3}, getitems=False, rootvalues=False)
+		m = self.monitor(legacyScan=True)
+		self.bus.run()
+
+		service = 'com.victronenergy.vebus.ttyO1'
+		self.assertIn((service, 257), self.added)
+		self.assertEqual(3, m.get_value(service, '/Mode'))
+		self.assertIsNone(m.get_value(service, '/Ac/Out/L1/P'))
+		self.assertFalse(m.seen(service, '/Ac/Out/L1/P'))
+		self.assertEqual([m], self.completed)
+
+	def test_new_owner_keeps_startup_time(self):
+		m = self.monitor()
+		self.bus.run()
+		started = m._startupScanStarted
+
+		service = 'com.victronenergy.vebus.ttyUSB0'
+		self.bus.add_service(service, ':1.20', {'/DeviceInstance': 0})
+		with mock.patch.object(dbusmonitor.time, 'monotonic', lambda: started + 10):
+			m._process_newowner(service)
+			self.bus.run()
+
+		self.assertEqual(started, m._startupScanStarted)
+		self.assertIn((service, 0), self.added)
+		self.assertIn(service, m.scanTimings)
+		# The startup scan completed once, scans of new owners do not complete it again
+		self.assertEqual([m], self.completed)
+
+
+if __name__ == "__main__":
+	logging.basicConfig(stream=sys.stderr)
+	logging.getLogger('').setLevel(logging.WARNING)
+	unittest.main()
@@ -9,6 +9,7 @@ import unittest
 import subprocess
 import time
 import dbus
+import dbus.bus
 import threading
 import fcntl
 from dbus.mainloop.glib import DBusGMainLoop
@@ -94,6 +95,12 @@ class VeDbusItemExportTests(unittest.TestCase):
 		self.assertIs(type(v), dbus.Double)
 		self.assertEqual(self.dbusConn.get_object('com.victronenergy.dbusexample', '/Float').GetText(), '1.5')
 
+	def test_get_value_typed(self):
+		v = self.dbusConn.get_object('com.victronenergy.dbusexample', '/TypedDouble').GetValue()
+		self.assertEqual(v, 230)
+		self.assertIs(type(v), dbus.Double)
+		self.assertEqual(self.dbusConn.get_object('com.victronenergy.dbusexample', '/TypedDouble').GetText(), '230')
+
 	def test_get_text_byte(self):
 		v = self.dbusConn.get_object('com.victronenergy.dbusexample', '/Byte').GetText()
 		self.assertEqual('84', v)
@@ -118,6 +125,20 @@ class VeDbusItemExportTests(unittest.TestCase):
 	def test_gettextcallback(self):
 		self.assertEqual('gettexted /Gettextcallback 10', self.dbusConn.get_object('com.victronenergy.dbusexample', '/Gettextcallback').GetText())
 
+	def test_cached_text_follows_value(self):
+		o = self.dbusConn.get_object('com.victronenergy.dbusexample', '/Gettextcallback')
+		self.assertEqual('gettexted /Gettextcallback 10', o.GetText())
+		self.assertEqual(0, o.SetValue(60))
+		self.assertEqual(60, o.GetValue())
+		self.assertEqual('gettexted /Gettextcallback 60', o.GetText())
+		self.assertEqual(60, o.GetValue())
+
+	def test_gettextcallback_not_cached(self):
+		o = self.dbusConn.get_object('com.victronenergy.dbusexample', '/GettextCounter')
+		first = o.GetText()
+		self.assertEqual(5, o.GetValue())
+		self.assertNotEqual(first, o.GetText())
+
 	def waitandkill(self, seconds=5):
 		time.sleep(seconds)
 		self.process.kill()
@@ -162,6 +183,354 @@ class VeDbusItemExportTests(unittest.TestCase):
 
 		thread.join()
 
+class VeDbusServiceFallbackTests(unittest.TestCase):
+	# The service in fixture_vedbus.py adds its paths with add_paths, so none of its tree nodes
+	# is exported up front. Calls for those node paths reach the root, a fallback object.
+
+	service = 'com.victronenergy.dbusexample.service'
+
+	def setUp(self):
+		self.sp = subprocess.Popen([sys.executable, "fixture_vedbus.py"], stdout=subprocess.PIPE)
+		self.dbusConn = dbus.SessionBus() if 'DBUS_SESSION_BUS_ADDRESS' in os.environ else dbus.SystemBus()
+
+		while (self.sp.stdout.readline().rstrip() != b'up and running'):
+			pass
+
+	def tearDown(self):
+		self.sp.kill()
+		self.sp.wait()
+		self.sp.stdout.close()
+
+	def object(self, path):
+		return self.dbusConn.get_object(self.service, path, introspect=False)
+
+	def test_get_value_unexported_node(self):
+		self.assertEqual({'L1/Power': 100, 'L1/Voltage': 230, 'Frequency': 50.0}, self.object('/Ac').GetValue())
+		self.assertEqual({'Power': 100, 'Voltage': 230}, self.object('/Ac/L1').GetValue())
+
+	def test_get_text_unexported_node(self):
+		self.assertEqual({'Power': '100', 'Voltage': '230'}, self.object('/Ac/L1').GetText())
+
+	def test_get_value_root_and_item(self):
+		v = self.object('/').GetValue()
+		self.assertEqual(4, len(v))
+		self.assertEqual('HQ1234', v['Serial'])
+		self.assertEqual(230, self.object('/Ac/L1/Voltage').GetValue())
+
+	def test_get_value_unknown_path(self):
+		for path in ('/Nope', '/Ac/Nope', '/Serial/Nope'):
+			with self.assertRaises(dbus.exceptions.DBusException) as cm:
+				self.object(path).GetValue()
+			self.assertEqual('org.freedesktop.DBus.Error.UnknownObject', cm.exception.get_dbus_name())
+			with self.assertRaises(dbus.exceptions.DBusException):
+				self.object(path).GetText()
+
+	def test_get_items_only_on_root(self):
+		self.assertEqual(230, self.object('/').GetItems()['/Ac/L1/Voltage']['Value'])
+		with self.assertRaises(dbus.exceptions.DBusException):
+			self.object('/Ac').GetItems()
+
+	def test_introspect(self):
+		root = self.object('/').Introspect(dbus_interface=dbus.INTROSPECTABLE_IFACE)
+		self.assertIn('<node name="Ac"/>', root)
+		self.assertIn('<node name="Serial"/>', root)
+		self.assertIn('com.victronenergy.Debug', root)
+
+		# The lazily created node describes itself, not the root
+		node = self.object('/Ac').Introspect(dbus_interface=dbus.INTROSPECTABLE_IFACE)
+		self.assertIn('com.victronenergy.BusItem', node)
+		self.assertIn('<node name="L1"/>', node)
+		self.assertIn('<node name="Frequency"/>', node)
+		self.assertNotIn('com.victronenergy.Debug', node)
+
+
+class VeDbusServiceLocalTests(unittest.TestCase):
+	# VeDbusService is created in this process, on a private connection, and never registered, so
+	# no bus name is claimed and nothing commits by itself. The exported methods of its objects are
+	# called directly instead of over the dbus.
+
+	def setUp(self):
+		bustype = dbus.bus.BusConnection.TYPE_SESSION if 'DBUS_SESSION_BUS_ADDRESS' in os.environ \
+			else dbus.bus.BusConnection.TYPE_SYSTEM
+		self.service = VeDbusService('com.victronenergy.testservice', bus=dbus.bus.BusConnection(bustype),
+			register=False)
+
+	def tearDown(self):
+		self.service.__del__()
+
+	def test_getitems_patched_per_change(self):
+		s = self.service
+		s.add_path('/Ac/Power', 100)
+		s.add_path('/Dc/0/Voltage', 12.5)
+		s.commit()
+		items = s.root.GetItems()
+		self.assertEqual({
+			'/Ac/Power': {'Value': 100, 'Text': '100'},
+			'/Dc/0/Voltage': {'Value': 12.5, 'Text': '12.5'}}, items)
+
+		# Nothing changed, the same response is served again
+		s.commit()
+		self.assertIs(items, s.root.GetItems())
+
+		voltage = items['/Dc/0/Voltage']
+		s['/Ac/Power'] = 150
+		s.commit()
+		updated = s.root.GetItems()
+		self.assertEqual({'Value': 150, 'Text': '150'}, updated['/Ac/Power'])
+		# Only the changed entry is replaced, the previous response is left alone
+		self.assertIs(voltage, updated['/Dc/0/Voltage'])
+		self.assertEqual(100, items['/Ac/Power']['Value'])
+
+		del s['/Dc/0/Voltage']
+		s.commit()
+		self.assertEqual(['/Ac/Power'], list(s.root.GetItems()))
+
+	def test_snapshots_alternate(self):
+		s = self.service
+		s.add_path('/Ac/Power', 100)
+		s.add_path('/Ac/Voltage', 230)
+		s.commit()
+		first = s.root.GetItems()
+		s['/Ac/Power'] = 150
+		second = s.commit()
+		self.assertIsNot(first, second)
+
+		# The next commit reuses the previous table, after catching up with the one in between
+		s['/Ac/Voltage'] = 231
+		s.add_path('/Dc/0/Voltage', 12.5)
+		self.assertIs(first, s.commit())
+		self.assertEqual({'/Ac/Power': 150, '/Ac/Voltage': 231, '/Dc/0/Voltage': 12.5},
+			{path: entry['Value'] for path, entry in first.items()})
+		self.assertEqual(('/Dc/0/Voltage',), s._snapshot[1]['/Dc'])
+		self.assertEqual(230, second['/Ac/Voltage']['Value'])
+
+		del s['/Ac/Voltage']
+		self.assertIs(second, s.commit())
+		self.assertEqual({'/Ac/Power', '/Dc/0/Voltage'}, set(second))
+		self.assertEqual(('/Ac/Power',), s._snapshot[1]['/Ac'])
+		self.assertEqual({'Power': 150}, s._dbusnodes['/Ac'].GetValue())
+		self.assertEqual({'0/Voltage': 12.5}, s._dbusnodes['/Dc'].GetValue())
+
+	def test_subtree_index(self):
+		s = self.service
+		s.add_path('/Ac/L1/Power', 1)
+		s.add_path('/Ac/L10/Power', 10)
+		s.add_path('/Ac/Frequency', 50)
+		s.add_path('/Dc/0/Voltage', 12)
+		self.assertEqual({'/Ac/L1/Power', '/Ac/L10/Power', '/Ac/Frequency'}, set(s._subtrees['/Ac']))
+		self.assertEqual({'/Ac/L1/Power'}, set(s._subtrees['/Ac/L1']))
+		self.assertEqual({'/Dc/0/Voltage'}, set(s._subtrees['/Dc']))
+		self.assertNotIn('/Ac/Frequency', s._subtrees)
+
+		s.commit()
+		self.assertEqual({'L1/Power': 1, 'L10/Power': 10, 'Frequency': 50}, s._dbusnodes['/Ac'].GetValue())
+		self.assertEqual({'L1/Power': '1', 'L10/Power': '10', 'Frequency': '50'}, s._dbusnodes['/Ac'].GetText())
+		# A node whose name is a prefix of a sibling only gets its own items
+		self.assertEqual({'Power': 1}, s._dbusnodes['/Ac/L1'].GetValue())
+		self.assertEqual({'Voltage': 12}, s._dbusnodes['/Dc/0'].GetValue())
+		self.assertEqual(4, len(s.root.GetValue()))
+
+	def test_delete_prunes_empty_nodes(self):
+		s = self.service
+		s.add_path('/Ac/L1/Power', 1)
+		s.add_path('/Ac/L1/Voltage', 230)
+		s.add_path('/Ac/L2/Power', 2)
+
+		del s['/Ac/L1/Power']
+		self.assertIn('/Ac/L1', s._dbusnodes)
+		self.assertEqual({'/Ac/L1/Voltage'}, set(s._subtrees['/Ac/L1']))
+		self.assertEqual({'/Ac/L1/Voltage', '/Ac/L2/Power'}, set(s._subtrees['/Ac']))
+
+		# The node goes together with the last item below it
+		del s['/Ac/L1/Voltage']
+		self.assertNotIn('/Ac/L1', s._dbusnodes)
+		self.assertNotIn('/Ac/L1', s._subtrees)
+		self.assertEqual({'/Ac/L2/Power'}, set(s._subtrees['/Ac']))
+
+		del s['/Ac/L2/Power']
+		self.assertEqual({}, s._subtrees)
+		self.assertEqual(['/'], list(s._dbusnodes))
+
+	def test_delete_visits_ancestors_only(self):
+		class CountingDict(dict):
+			lookups = 0
+			def get(self, key, default=None):
+				self.lookups += 1
+				return dict.get(self, key, default)
+
+		s = self.service
+		for i in range(200):
+			s.add_path('/Group/Item%d' % i, i)
+		s.add_path('/A/B/C/Item', 0)
+		s._subtrees = CountingDict(s._subtrees)
+
+		del s['/A/B/C/Item']
+		self.assertEqual(3, s._subtrees.lookups)
+		del s['/Group/Item0']
+		self.assertEqual(4, s._subtrees.lookups)
+		self.assertEqual(199, len(s._subtrees['/Group']))
+
+	def test_del_tree(self):
+		s = self.service
+		s.add_path('/Ac/L1/Power', 1)
+		s.add_path('/Ac/L1/Voltage', 230)
+		s.add_path('/Ac/L2/Power', 2)
+		s.add_path('/Dc/0/Voltage', 12)
+		s.commit()
+
+		with s as ctx:
+			ctx.del_tree('/Ac/L1/')
+		self.assertEqual({'/Ac/L2/Power', '/Dc/0/Voltage'}, set(s._dbusobjects))
+		self.assertNotIn('/Ac/L1', s._dbusnodes)
+		self.assertEqual({'L2/Power': 2}, s._dbusnodes['/Ac'].GetValue())
+
+		# A path that is an item itself is deleted too
+		with s as ctx:
+			ctx.del_tree('/Dc/0/Voltage')
+		self.assertEqual({'/Ac/L2/Power'}, set(s._dbusobjects))
+		self.assertNotIn('/Dc', s._subtrees)
+
+	def test_add_paths(self):
+		s = self.service
+		items = s.add_paths([
+			('/Ac/L1/Power', 100, 'power'),
+			{'path': '/Ac/Frequency', 'value': 50, 'writeable': True},
+			('/Serial', 'HQ1234'),
+		])
+		self.assertEqual(['/Ac/L1/Power', '/Ac/Frequency', '/Serial'], [item._path for item in items])
+		self.assertIs(items[1], s._dbusobjects['/Ac/Frequency'])
+		self.assertEqual('power', items[0]._description)
+		self.assertTrue(items[1]._writeable)
+
+		# The tree nodes are indexed, but only exported on first use
+		self.assertEqual(['/'], list(s._dbusnodes))
+		self.assertEqual({'/Ac/L1/Power', '/Ac/Frequency'}, set(s._subtrees['/Ac']))
+		node = s._get_node('/Ac/L1')
+		self.assertIs(node, s._dbusnodes['/Ac/L1'])
+		self.assertIs(node, s._get_node('/Ac/L1'))
+		self.assertIsNone(s._get_node('/Serial'))
+		self.assertIsNone(s._get_node('/Nope'))
+
+		s.commit()
+		self.assertEqual({'Power': 100}, node.GetValue())
+		self.assertEqual(3, len(s.root.GetItems()))
+
+	def test_dbustype(self):
+		s = self.service
+		s.add_path('/Dc/0/Voltage', 12, dbustype=dbus.Double)
+		s.add_path('/Untyped', 12)
+		s.commit()
+		item = s._dbusobjects['/Dc/0/Voltage']
+		self.assertIs(dbus.Double, type(item.GetValue()))
+		self.assertIs(dbus.Int32, type(s._dbusobjects['/Untyped'].GetValue()))
+
+		changes = item._local_set_value(13)
+		self.assertIs(dbus.Double, type(changes['Value']))
+		self.assertEqual(1, changes['Value'].variant_level)
+
+		# Invalid is still an empty array, and a value the type does not take is probed
+		invalid = item._local_set_value(None)['Value']
+		self.assertIs(dbus.Array, type(invalid))
+		self.assertEqual(0, len(invalid))
+		self.assertIs(dbus.String, type(item._local_set_value('n/a')['Value']))
+
+	def test_resolution(self):
+		s = self.service
+		s.add_path('/Dc/0/Voltage', 49.99999, resolution=0.01)
+		s.add_path('/Ac/Power', 1234, resolution=10)
+		voltage = s._dbusobjects['/Dc/0/Voltage']
+		power = s._dbusobjects['/Ac/Power']
+		self.assertEqual(50.0, s['/Dc/0/Voltage'])
+		self.assertEqual('50.0', voltage._current_text())
+		self.assertEqual(1230, s['/Ac/Power'])
+
+		# A change below the resolution is no change at all
+		self.assertIsNone(voltage._local_set_value(50.004))
+		changes = voltage._local_set_value(50.006)
+		self.assertEqual(50.01, changes['Value'])
+		self.assertEqual('50.01', changes['Text'])
+		self.assertEqual(1240, power._local_set_value(1236)['Value'])
+
+		# Invalid and non-numeric values are stored as they are
+		self.assertIsNotNone(voltage._local_set_value(None))
+		self.assertIsNone(s['/Dc/0/Voltage'])
+		voltage._local_set_value('n/a')
+		self.assertEqual('n/a', s['/Dc/0/Voltage'])
+
+	def test_signal_rates(self):
+		s = self.service
+		s.add_path('/Ac/Power', 0)
+		s.add_path('/Ac/Voltage', 230)
+		s.add_path('/Serial', 'HQ1234')
+		s.reset_signal_rates()
+
+		# Three PropertiesChanged signals for one path, two ItemsChanged signals for both
+		for value in (1, 2, 3):
+			s['/Ac/Power'] = value
+		with s as ctx:
+			ctx['/Ac/Power'] = 4
+			ctx['/Ac/Voltage'] = 231
+		s.root.ItemsChanged({'/Ac/Voltage': {'Value': 232, 'Text': '232'}, '/Nope': {}})
+		s['/Ac/Power'] = 4  # Unchanged, nothing is sent
+
+		rates = s.root.GetSignalRates(10)
+		self.assertEqual([('/Ac/Power', 4), ('/Ac/Voltage', 2)], [(path, count) for path, count, _ in rates])
+		self.assertTrue(all(rate > 0 for _, _, rate in rates))
+		self.assertEqual(['/Ac/Power'], [path for path, _, _ in s.root.GetSignalRates(1)])
+
+		s.root.ResetSignalRates()
+		self.assertEqual([], s.root.GetSignalRates(10))
+		s['/Serial'] = 'HQ5678'
+		self.assertEqual([('/Serial', 1)], [(path, count) for path, count, _ in s.signal_rates()])
+
+	def test_commit_visibility(self):
+		s = self.service
+		s.add_path('/Ac/Power', 100)
+		s.add_path('/Ac/Voltage', 230)
+		s.commit()
+		item = s._dbusobjects['/Ac/Power']
+
+		# Written, but not committed yet: readers still see the previous cycle
+		self.assertIsNotNone(item._local_set_value(200))
+		s.add_path('/Ac/Current', 1)
+		self.assertEqual(100, item.GetValue())
+		self.assertEqual('100', item.GetText())
+		self.assertEqual(100, s.root.GetItems()['/Ac/Power']['Value'])
+		self.assertNotIn('/Ac/Current', s.root.GetItems())
+		self.assertEqual({'Power': 100, 'Voltage': 230}, s._dbusnodes['/Ac'].GetValue())
+		self.assertEqual(200, s['/Ac/Power'])
+
+		s.commit()
+		self.assertEqual(200, item.GetValue())
+		self.assertEqual('200', item.GetText())
+		self.assertEqual(200, s.root.GetItems()['/Ac/Power']['Value'])
+		self.assertEqual({'Power': 200, 'Voltage': 230, 'Current': 1}, s._dbusnodes['/Ac'].GetValue())
+
+	def test_service_context_commits_on_exit(self):
+		s = self.service
+		s.add_path('/Ac/Power', 100)
+		s.commit()
+		item = s._dbusobjects['/Ac/Power']
+
+		with s as ctx:
+			ctx['/Ac/Power'] = 300
+			self.assertEqual(100, item.GetValue())
+			self.assertEqual(100, s.root.GetItems()['/Ac/Power']['Value'])
+		self.assertEqual(300, item.GetValue())
+		self.assertEqual(300, s.root.GetItems()['/Ac/Power']['Value'])
+
+	def test_deleted_path_visible_until_commit(self):
+		s = self.service
+		s.add_path('/Ac/Power', 100)
+		s.add_path('/Ac/Voltage', 230)
+		s.commit()
+
+		del s['/Ac/Voltage']
+		self.assertEqual({'Power': 100, 'Voltage': 230}, s._dbusnodes['/Ac'].GetValue())
+		s.commit()
+		self.assertEqual({'Power': 100}, s._dbusnodes['/Ac'].GetValue())
+		self.assertNotIn('/Ac/Voltage', s.root.GetItems())
+
 """
 MVA 2014-08-30: this test of VEDbusItemImport doesn't work, since there is no gobject-mainloop.
 Probably making some automated functional test, using bash and some scripts, will work much
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+## Micro benchmark for ve_utils.unwrap_dbus_value on ItemsChanged payloads, comparing the
+# type dispatch with the plain isinstance checks. The latter are measured by emptying the
+# dispatch table, which only adds one failed dict lookup. Needs dbus-python, but no bus:
+#   python3 bench_unwrap.py
+#
+# No results are recorded for this tree yet. The dispatch table pays off if the values and
+# payload columns are below their (old) counterparts for every payload size; record the
+# output of a run on the target (a GX device) before relying on it.
+
+import dbus
+import os
+import sys
+import timeit
+
+# our own packages
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), '../'))
+import ve_utils
+from ve_utils import unwrap_dbus_value, wrap_dbus_value
+
+## An ItemsChanged payload of an inverter/charger publishing count paths: mostly doubles,
+# some integer states, a few strings and invalid values, each with its text.
+def make_payload(count):
+	values = []
+	for i in range(count):
+		kind = i % 10
+		if kind < 6:
+			values.append(230.0 + i / 10.0)
+		elif kind < 8:
+			values.append(i)
+		elif kind < 9:
+			values.append('Serial %d' % i)
+		else:
+			values.append(None)
+
+	return dbus.Dictionary({
+		'/Path/%d' % i: dbus.Dictionary({
+			'Value': wrap_dbus_value(v),
+			'Text': dbus.String('---' if v is None else str(v), variant_level=1) },
+			signature=dbus.Signature('sv'))
+		for i, v in enumerate(values) }, signature=dbus.Signature('sa{sv}'))
+
+def per_call(f, number):
+	return min(timeit.repeat(f, number=number, repeat=5)) / number * 1e6
+
+## Returns the time per call of unwrapping the value of every entry, like
+# DbusMonitor.handler_item_changes does, and of unwrapping the whole payload.
+def bench_payload(payload):
+	entries = list(payload.values())
+
+	def values():
+		for changes in entries:
+			unwrap_dbus_value(changes['Value'])
+
+	return per_call(values, 2000), per_call(lambda: unwrap_dbus_value(payload), 500)
+
+def main():
+	print("unwrap_dbus_value on ItemsChanged payloads (us/payload)")
+	print("%8s %14s %14s %14s %14s" % ("paths", "values", "values (old)", "payload", "payload (old)"))
+	for count in (10, 30, 100):
+		payload = make_payload(count)
+		values, whole = bench_payload(payload)
+
+		table = dict(ve_utils._unwrap_by_type)
+		ve_utils._unwrap_by_type.clear()
+		try:
+			values_old, whole_old = bench_payload(payload)
+		finally:
+			ve_utils._unwrap_by_type.update(table)
+
+		print("%8d %14.1f %14.1f %14.1f %14.1f" % (count, values, values_old, whole, whole_old))
+
+if __name__ == "__main__":
+	main()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from traceback import print_exc
+from decimal import Decimal
 from os import _exit as os_exit
 from os import statvfs
 from subprocess import check_output, CalledProcessError
@@ -231,19 +232,97 @@ def wrap_dbus_value(value):
 	return value
 
 
+def dbus_value_wrapper(dbustype=None):
+	"""Returns the wrap function for values of a path with a fixed D-Bus type, for example
+	dbus.Double. The returned function calls the constructor directly instead of probing the
+	type of every value like wrap_dbus_value does. None is still wrapped as invalid, and values
+	the constructor does not accept fall back to wrap_dbus_value."""
+	if dbustype is None:
+		return wrap_dbus_value
+
+	def wrap(value):
+		if value is None:
+			return VEDBUS_INVALID
+		try:
+			return dbustype(value, variant_level=1)
+		except (TypeError, ValueError, OverflowError):
+			return wrap_dbus_value(value)
+	return wrap
+
+
+def value_quantizer(resolution=None):
+	"""Returns a function that rounds numbers to a multiple of resolution, for example 0.01, so
+	that values which only differ below the resolution compare equal. Other values, such as None
+	and strings, are returned unchanged. Returns None when there is no resolution."""
+	if not resolution:
+		return None
+	# Decimals of the resolution, rounding to these drops the float noise of the multiplication
+	ndigits = max(0, -Decimal(str(resolution)).normalize().as_tuple().exponent)
+
+	def quantize(value):
+		if type(value) is float or type(value) is int:
+			return round(round(value / resolution) * resolution, ndigits)
+		return value
+	return quantize
+
+
 dbus_int_types = (dbus.Int32, dbus.UInt32, dbus.Byte, dbus.Int16, dbus.UInt16, dbus.UInt32, dbus.Int64, dbus.UInt64)
 
 
 def unwrap_dbus_value(val):
 	"""Converts D-Bus values back to the original type. For example if val is of type DBus.Double,
 	a float will be returned."""
+	unwrap = _unwrap_by_type.get(type(val))
+	if unwrap is not None:
+		return unwrap(val)
+	return _unwrap_by_isinstance(val)
+
+
+def _unwrap_array(val):
+	v = [unwrap_dbus_value(x) for x in val]
+	return None if len(v) == 0 else v
+
+
+def _unwrap_sequence(val):
+	return [unwrap_dbus_value(x) for x in val]
+
+
+def _unwrap_dict(val):
+	# Do not unwrap the keys, see comment in wrap_dbus_value
+	return {x: unwrap_dbus_value(y) for x, y in val.items()}
+
+
+# Unwrap function per exact type, so that the common types need a single dict lookup.
+# Anything else, such as subclasses and plain python values, goes through the
+# isinstance checks in _unwrap_by_isinstance.
+_unwrap_by_type = {
+	dbus.Double: float,
+	dbus.Int32: int,
+	dbus.UInt32: int,
+	dbus.Int16: int,
+	dbus.UInt16: int,
+	dbus.Int64: int,
+	dbus.UInt64: int,
+	dbus.Byte: int,
+	dbus.String: str,
+	dbus.Signature: str,
+	dbus.Boolean: bool,
+	dbus.Array: _unwrap_array,
+	dbus.Struct: _unwrap_sequence,
+	dbus.Dictionary: _unwrap_dict,
+	list: _unwrap_sequence,
+	tuple: _unwrap_sequence,
+	dict: _unwrap_dict,
+}
+
+
+def _unwrap_by_isinstance(val):
 	if isinstance(val, dbus_int_types):
 		return int(val)
 	if isinstance(val, dbus.Double):
 		return float(val)
 	if isinstance(val, dbus.Array):
-		v = [unwrap_dbus_value(x) for x in val]
-		return None if len(v) == 0 else v
+		return _unwrap_array(val)
 	if isinstance(val, (dbus.Signature, dbus.String)):
 		return str(val)
 	# Python has no byte type, so we convert to an integer.
@@ -252,10 +331,9 @@ def unwrap_dbus_value(val):
 	if isinstance(val, dbus.ByteArray):
 		return "".join([bytes(x) for x in val])
 	if isinstance(val, (list, tuple)):
-		return [unwrap_dbus_value(x) for x in val]
+		return _unwrap_sequence(val)
 	if isinstance(val, (dbus.Dictionary, dict)):
-		# Do not unwrap the keys, see comment in wrap_dbus_value
-		return dict([(x, unwrap_dbus_value(y)) for x, y in val.items()])
+		return _unwrap_dict(val)
 	if isinstance(val, dbus.Boolean):
 		return bool(val)
 	return val
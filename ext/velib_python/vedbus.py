@@ -4,9 +4,10 @@
 import dbus.service
 import logging
 import os
+import time
 import weakref
 from collections import defaultdict
-from ve_utils import wrap_dbus_value, unwrap_dbus_value
+from ve_utils import wrap_dbus_value, unwrap_dbus_value, dbus_value_wrapper, value_quantizer
 
 notset = object()
 
@@ -63,7 +64,27 @@ class VeDbusService(object):
 		# dict containing the VeDbusItemExport objects, with their path as the key.
 		self._dbusobjects = {}
 		self._dbusnodes = {}
+		# dict containing, for each tree node path, the items below it ({path: item}). Lets
+		# subtree reads visit only the items under the node instead of every path, and its
+		# size is the reference count that keeps the node alive.
+		self._subtrees = {}
 		self._ratelimiters = []
+		# Committed snapshot that readers are served from, (table, nodes): the value table
+		# {path: {'Value': value, 'Text': text}} and, per tree node, the tuple of paths below it.
+		# Two snapshots alternate. commit() patches the one readers are not served from with the
+		# changed paths and swaps it in with a single assignment, so a reader that takes the
+		# snapshot once gets exactly one committed cycle, even while the next one is being
+		# written. The other snapshot then lags behind by the paths and nodes of that commit, and
+		# is brought up to date by the next one. A commit so only touches the changed entries,
+		# whatever the number of paths. A reader must be done with a snapshot before the second
+		# commit after the one it was taken from, which holds for the D-Bus methods: they run on
+		# the mainloop, like the writer, and their reply is serialized before they return.
+		self._snapshot = None  # None until the first commit
+		self._spare = None  # The previous snapshot, None until the second commit
+		self._lag = ((), ())  # Paths and nodes by which _spare lags behind _snapshot
+		self._dirty = set()  # Paths added, changed or removed since the last commit
+		# Start of the period covered by the per path signal counters, see signal_rates
+		self._signalssince = time.monotonic()
 		self._dbusname = None
 		self.name = servicename
 
@@ -90,6 +111,7 @@ class VeDbusService(object):
 			self.register()
 
 	def register(self):
+		self.commit()
 		# Register ourselves on the dbus, trigger an error if already in use (do_not_queue)
 		self._dbusname = dbus.service.BusName(self.name, self._dbusconn, do_not_queue=True)
 		logging.info("registered ourselves on D-Bus as %s" % self.name)
@@ -113,25 +135,149 @@ class VeDbusService(object):
 	# @param callbackonchange	function that will be called when this value is changed. First parameter will
 	#							be the path of the object, second the new value. This callback should return
 	#							True to accept the change, False to reject it.
+	# @param dbustype	D-Bus type of the value, for example dbus.Double. Values are then wrapped with
+	#					a direct call to it instead of being probed on every change.
+	# @param resolution	Numbers are rounded to a multiple of this, for example 0.01, before they are
+	#					compared and stored. A change below the resolution then sends no signal.
 	def add_path(self, path, value, description="", writeable=False,
-					onchangecallback=None, gettextcallback=None, valuetype=None, itemtype=None):
+					onchangecallback=None, gettextcallback=None, valuetype=None, itemtype=None, dbustype=None,
+					resolution=None):
+		item = self._create_item(path, value, description, writeable,
+				onchangecallback, gettextcallback, valuetype, itemtype, dbustype, resolution)
 
+		spl = path.split('/')
+		for i in range(2, len(spl)):
+			self._get_node('/'.join(spl[:i]))
+		self._autocommit()
+		logging.debug('added %s with start value %s. Writeable is %s' % (path, value, writeable))
+		return item
+
+	## Adds several paths in one pass.
+	# @param paths	Iterable of add_path arguments, each a tuple of positional arguments or a
+	#				dict of keyword arguments, for example [('/Mode', 3, 'Mode', True, mode_changed),
+	#				{'path': '/Dc/0/Voltage', 'value': None, 'dbustype': dbus.Double}].
+	# Unlike add_path, the tree nodes above the paths are not exported here. The root
+	# node is a fallback object that receives the calls for those unexported node paths,
+	# and a node is only created when it is first introspected or queried.
+	# @return list of the created items, in the order of the paths.
+	def add_paths(self, paths):
+		items = [self._create_item(**args) if isinstance(args, dict) else self._create_item(*args)
+			for args in paths]
+		self._autocommit()
+		logging.debug('added %d paths, below %d tree nodes' % (len(items), len(self._subtrees)))
+		return items
+
+	def _create_item(self, path, value, description="", writeable=False,
+					onchangecallback=None, gettextcallback=None, valuetype=None, itemtype=None, dbustype=None,
+					resolution=None):
 		if onchangecallback is not None:
 			self._onchangecallbacks[path] = onchangecallback
 
 		itemtype = itemtype or VeDbusItemExport
 		item = itemtype(self._dbusconn, path, value, description, writeable,
-				self._value_changed, gettextcallback, deletecallback=self._item_deleted, valuetype=valuetype)
+				self._value_changed, gettextcallback, deletecallback=self._item_deleted, valuetype=valuetype,
+				dbustype=dbustype, resolution=resolution)
+		item._itemchangedcallback = self.root.invalidate
+		item._commitcallback = self._autocommit
+		self.root.invalidate(path)
 
 		spl = path.split('/')
 		for i in range(2, len(spl)):
-			subPath = '/'.join(spl[:i])
-			if subPath not in self._dbusnodes and subPath not in self._dbusobjects:
-				self._dbusnodes[subPath] = VeDbusTreeExport(self._dbusconn, subPath, self)
+			self._subtrees.setdefault('/'.join(spl[:i]), {})[path] = item
 		self._dbusobjects[path] = item
-		logging.debug('added %s with start value %s. Writeable is %s' % (path, value, writeable))
 		return item
 
+	## Returns the tree node for a path, creating it when there are items below the
+	# path. Returns None for paths that are not a tree node.
+	def _get_node(self, path):
+		node = self._dbusnodes.get(path)
+		if node is None and path in self._subtrees and path not in self._dbusobjects:
+			node = self._dbusnodes[path] = VeDbusTreeExport(self._dbusconn, path, self)
+		return node
+
+	## Publishes the changes since the previous commit to readers, and returns the new value
+	# table. Call it from the writer at the end of each cycle, before signalling the changes.
+	# Writes through local_set_value, __setitem__ and ServiceContext commit by themselves.
+	# Only the changed paths, and the node index entries of the ancestors of added or removed
+	# paths, are written, see _snapshot.
+	def commit(self):
+		snapshot = self._snapshot
+		if snapshot is not None and not self._dirty:
+			return snapshot[0]
+
+		dirty, self._dirty = self._dirty, set()
+		objects = self._dbusobjects
+		if snapshot is None:
+			table = {path: item._commit() for path, item in objects.items()}
+			nodes = {node: tuple(items) for node, items in self._subtrees.items()}
+			self._snapshot = (table, nodes)
+			self._spare = None
+			self._lag = ((), ())
+			return table
+
+		if self._spare is None:
+			table, nodes = dict(snapshot[0]), dict(snapshot[1])
+		else:
+			# Catch up with the current snapshot first
+			table, nodes = self._spare
+			current_table, current_nodes = snapshot
+			lagging_paths, lagging_nodes = self._lag
+			for path in lagging_paths:
+				entry = current_table.get(path)
+				if entry is None:
+					table.pop(path, None)
+				else:
+					table[path] = entry
+			for node in lagging_nodes:
+				paths = current_nodes.get(node)
+				if paths is None:
+					nodes.pop(node, None)
+				else:
+					nodes[node] = paths
+
+		changed_nodes = set()
+		for path in dirty:
+			item = objects.get(path)
+			if item is None:
+				if table.pop(path, None) is None:
+					continue
+			else:
+				added = path not in table
+				table[path] = item._commit()
+				if not added:
+					continue
+			spl = path.split('/')
+			changed_nodes.update('/'.join(spl[:i]) for i in range(2, len(spl)))
+		for node in changed_nodes:
+			paths = self._subtrees.get(node)
+			if paths:
+				nodes[node] = tuple(paths)
+			else:
+				nodes.pop(node, None)
+
+		self._spare = snapshot
+		self._lag = (dirty, changed_nodes)
+		self._snapshot = (table, nodes)
+		return table
+
+	## Commits single writes, except before registration, when nobody can read yet, and inside
+	# a "with service" block, which commits when it ends.
+	def _autocommit(self):
+		if self._dbusname is not None and not self._ratelimiters:
+			self.commit()
+
+	## Returns the committed snapshot, (value table, paths per tree node), for readers.
+	def _committed_snapshot(self):
+		snapshot = self._snapshot
+		if snapshot is None:
+			self.commit()
+			snapshot = self._snapshot
+		return snapshot
+
+	## Returns the committed value table, for readers.
+	def _committed_table(self):
+		return self._committed_snapshot()[0]
+
 	# Add the mandatory paths, as per victron dbus api doc
 	def add_mandatory_paths(self, processname, processversion, connection,
 			deviceinstance, productid, productname, firmwareversion, hardwareversion, connected):
@@ -155,16 +301,23 @@ class VeDbusService(object):
 
 		return self._onchangecallbacks[path](path, newvalue)
 
+	# Only the ancestors of the deleted path are visited, a tree node is removed together
+	# with the last item below it.
 	def _item_deleted(self, path):
 		self._dbusobjects.pop(path)
-		for np in list(self._dbusnodes.keys()):
-			if np != '/':
-				for ip in self._dbusobjects:
-					if ip.startswith(np + '/'):
-						break
-				else:
-					self._dbusnodes[np].__del__()
-					self._dbusnodes.pop(np)
+		self.root.invalidate(path)
+		spl = path.split('/')
+		for i in range(len(spl) - 1, 1, -1):
+			np = '/'.join(spl[:i])
+			subtree = self._subtrees.get(np)
+			if subtree is None:
+				continue
+			subtree.pop(path, None)
+			if not subtree:
+				del self._subtrees[np]
+				node = self._dbusnodes.pop(np, None)
+				if node is not None:
+					node.__del__()
 
 	def __getitem__(self, path):
 		return self._dbusobjects[path].local_get_value()
@@ -175,10 +328,25 @@ class VeDbusService(object):
 	def __delitem__(self, path):
 		self._dbusobjects[path].__del__()  # Invalidates and then removes the object path
 		assert path not in self._dbusobjects
+		self._autocommit()
 
 	def __contains__(self, path):
 		return path in self._dbusobjects
 
+	## Returns the paths that emitted the most changes since the counters were reset, as a
+	# list of (path, changes, changes per second) tuples, busiest first. A change counts once
+	# per PropertiesChanged or ItemsChanged signal that carries it.
+	def signal_rates(self, count=10):
+		elapsed = max(time.monotonic() - self._signalssince, 1e-3)
+		busiest = sorted(((item._signalcount, path) for path, item in self._dbusobjects.items()
+			if item._signalcount), reverse=True)[:count]
+		return [(path, signals, signals / elapsed) for signals, path in busiest]
+
+	def reset_signal_rates(self):
+		for item in self._dbusobjects.values():
+			item._signalcount = 0
+		self._signalssince = time.monotonic()
+
 	def __enter__(self):
 		l = ServiceContext(self)
 		self._ratelimiters.append(l)
@@ -212,23 +380,30 @@ class ServiceContext(object):
 		del self.parent[path]
 
 	def flush(self):
+		self.parent.commit()
 		if self.changes:
 			self.parent.root.ItemsChanged(self.changes)
 			self.changes.clear()
 
 	def add_path(self, path, value, *args, **kwargs):
 		self.parent.add_path(path, value, *args, **kwargs)
+		item = self.parent._dbusobjects[path]
 		self.changes[path] = {
-			'Value': wrap_dbus_value(value),
-			'Text': self.parent._dbusobjects[path].GetText()
+			'Value': item._current_value(),
+			'Text': item._current_text()
 		}
 
 	def del_tree(self, root):
 		root = root.rstrip('/')
-		for p in list(self.parent._dbusobjects.keys()):
-			if p == root or p.startswith(root + '/'):
-				self[p] = None
-				self.parent._dbusobjects[p].__del__()
+		if not root:
+			paths = list(self.parent._dbusobjects)
+		else:
+			paths = list(self.parent._subtrees.get(root, ()))
+			if root in self.parent._dbusobjects:
+				paths.append(root)
+		for p in paths:
+			self[p] = None
+			self.parent._dbusobjects[p].__del__()
 
 	def get_name(self):
 		return self.parent.get_name()
@@ -456,10 +631,17 @@ class VeDbusTreeExport(dbus.service.Object):
 		px = path
 		if not px.endswith('/'):
 			px += '/'
-		for p, item in self._service._dbusobjects.items():
-			if p.startswith(px):
-				v = item.GetText() if get_text else wrap_dbus_value(item.local_get_value())
-				r[p[len(px):]] = v
+		# Only visit the items below this node, the root node covers all of them. The paths
+		# and values all come from the same committed snapshot, so they belong to one cycle.
+		table, nodes = self._service._committed_snapshot()
+		key = 'Text' if get_text else 'Value'
+		n = len(px)
+		if px == '/':
+			for p, entry in table.items():
+				r[p[n:]] = entry[key]
+		else:
+			for p in nodes.get(px[:-1], ()):
+				r[p[n:]] = table[p][key]
 		logging.debug(r)
 		return r
 
@@ -475,19 +657,74 @@ class VeDbusTreeExport(dbus.service.Object):
 	def local_get_value(self):
 		return self._get_value_handler(self.path)
 
-class VeDbusRootExport(VeDbusTreeExport):
+## The root node. It is registered as a fallback object, so it also receives the calls
+# for node paths that have no object (yet), see VeDbusService.add_paths. Those are
+# passed on to the node, which is created on first use.
+class VeDbusRootExport(VeDbusTreeExport, dbus.service.FallbackObject):
+	def __init__(self, bus, objectPath, service):
+		dbus.service.FallbackObject.__init__(self, bus, objectPath)
+		self._path = objectPath
+		self._service = service
+
+	## Marks a path as changed, so the next commit of the service updates its entry.
+	# Called by the items of the service when a new value is accepted, and by the
+	# service when paths are added or removed.
+	def invalidate(self, path):
+		self._service._dirty.add(path)
+
 	@dbus.service.signal('com.victronenergy.BusItem', signature='a{sa{sv}}')
 	def ItemsChanged(self, changes):
-		pass
-
-	@dbus.service.method('com.victronenergy.BusItem', out_signature='a{sa{sv}}')
-	def GetItems(self):
-		return {
-			path: {
-				'Value': wrap_dbus_value(item.local_get_value()),
-				'Text': item.GetText() }
-			for path, item in self._service._dbusobjects.items()
-		}
+		objects = self._service._dbusobjects
+		for path in changes:
+			item = objects.get(path)
+			if item is not None:
+				item._signalcount += 1
+
+	## Debug method, returns the count busiest paths, see VeDbusService.signal_rates.
+	@dbus.service.method('com.victronenergy.Debug', in_signature='i', out_signature='a(sud)')
+	def GetSignalRates(self, count):
+		return self._service.signal_rates(count)
+
+	@dbus.service.method('com.victronenergy.Debug')
+	def ResetSignalRates(self):
+		self._service.reset_signal_rates()
+
+	## Returns the node for a path below the root, creating it if needed. Calls for paths
+	# that are neither the root nor a node fail like they would without a fallback.
+	def _node(self, path):
+		node = self._service._get_node(path)
+		if node is None:
+			raise dbus.exceptions.DBusException('No such object path ' + path,
+				name='org.freedesktop.DBus.Error.UnknownObject')
+		return node
+
+	@dbus.service.method(dbus.INTROSPECTABLE_IFACE, out_signature='s',
+			path_keyword='object_path', connection_keyword='connection')
+	def Introspect(self, object_path, connection):
+		if object_path == self._path or self._service._get_node(object_path) is None:
+			return dbus.service.Object.Introspect(self, object_path, connection)
+		return self._service._dbusnodes[object_path].Introspect(object_path, connection)
+
+	@dbus.service.method('com.victronenergy.BusItem', out_signature='v', path_keyword='path')
+	def GetValue(self, path='/'):
+		if path == self._path:
+			return VeDbusTreeExport.GetValue(self)
+		return self._node(path).GetValue()
+
+	@dbus.service.method('com.victronenergy.BusItem', out_signature='v', path_keyword='path')
+	def GetText(self, path='/'):
+		if path == self._path:
+			return VeDbusTreeExport.GetText(self)
+		return self._node(path).GetText()
+
+	## Returns all items of the service. This is the committed value table itself, which
+	# VeDbusService.commit patches for the changed paths only, so no table is built for a call.
+	@dbus.service.method('com.victronenergy.BusItem', out_signature='a{sa{sv}}', path_keyword='path')
+	def GetItems(self, path='/'):
+		if path != self._path:
+			raise dbus.exceptions.DBusException('GetItems is only available on the root',
+				name='org.freedesktop.DBus.Error.UnknownMethod')
+		return self._service._committed_table()
 
 
 class VeDbusItemExport(dbus.service.Object):
@@ -503,18 +740,37 @@ class VeDbusItemExport(dbus.service.Object):
 	# @param callback	  Function that will be called when someone else changes the value of this VeBusItem
 	#                     over the dbus. First parameter passed to callback will be our path, second the new
 	#					  value. This callback should return True to accept the change, False to reject it.
+	# @param dbustype	  D-Bus type of the value (dbus.Double, dbus.Int32, ...), None to derive it from each value.
+	# @param resolution	  Numbers are rounded to a multiple of this before they are compared and stored.
 	def __init__(self, bus, objectPath, value=None, description=None, writeable=False,
 					onchangecallback=None, gettextcallback=None, deletecallback=None,
-					valuetype=None):
+					valuetype=None, dbustype=None, resolution=None):
 		dbus.service.Object.__init__(self, bus, objectPath)
 		self._path = objectPath
 		self._onchangecallback = onchangecallback
 		self._gettextcallback = gettextcallback
-		self._value = value
+		self._quantize = value_quantizer(resolution)
+		self._value = value if self._quantize is None else self._quantize(value)
 		self._description = description
 		self._writeable = writeable
 		self._deletecallback = deletecallback
 		self._type = valuetype
+		self._wrap = dbus_value_wrapper(dbustype)
+
+		# Wrapped value and text, rendered on first use and dropped when the value changes
+		self._wrapped = None
+		self._text = None
+
+		# Called with our path when a new value is accepted, and to commit a single write (set by VeDbusService)
+		self._itemchangedcallback = None
+		self._commitcallback = None
+
+		# Value and text as of the last commit of the service, served to readers. None
+		# when not committed yet, or outside a service, then the current value is served.
+		self._committed = None
+
+		# Number of emitted changes of this path, see VeDbusService.signal_rates
+		self._signalcount = 0
 
 	# To force immediate deregistering of this dbus object, explicitly call __del__().
 	def __del__(self):
@@ -532,18 +788,47 @@ class VeDbusItemExport(dbus.service.Object):
 	def local_set_value(self, newvalue):
 		changes = self._local_set_value(newvalue)
 		if changes is not None:
+			if self._commitcallback is not None:
+				self._commitcallback()
 			self.PropertiesChanged(changes)
 
 	def _local_set_value(self, newvalue):
+		if self._quantize is not None:
+			newvalue = self._quantize(newvalue)
 		if self._value == newvalue:
 			return None
 
 		self._value = newvalue
+		self._wrapped = self._wrap(newvalue)
+		self._text = None
+		if self._itemchangedcallback is not None:
+			self._itemchangedcallback(self._path)
 		return {
-			'Value': wrap_dbus_value(newvalue),
-			'Text': self.GetText()
+			'Value': self._wrapped,
+			'Text': self._current_text()
 		}
 
+	## Takes the current value into the committed value table, see VeDbusService.commit.
+	def _commit(self):
+		self._committed = entry = {
+			'Value': self._current_value(),
+			'Text': self._current_text()
+		}
+		return entry
+
+	def _current_value(self):
+		if self._wrapped is None:
+			self._wrapped = self._wrap(self._value)
+		return self._wrapped
+
+	def _current_text(self):
+		# A gettextcallback may render more than the value, so its text is never cached
+		if self._gettextcallback is not None:
+			return self._render_text()
+		if self._text is None:
+			self._text = self._render_text()
+		return self._text
+
 	def local_get_value(self):
 		return self._value
 
@@ -598,13 +883,22 @@ class VeDbusItemExport(dbus.service.Object):
 	# @return the value when valid, and otherwise an empty array
 	@dbus.service.method('com.victronenergy.BusItem', out_signature='v')
 	def GetValue(self):
-		return wrap_dbus_value(self._value)
+		committed = self._committed
+		return committed['Value'] if committed is not None else self._current_value()
 
 	## Dbus exported method GetText
-	# Returns the value as string of the dbus-object-path.
+	# Returns the value as string of the dbus-object-path. The text is rendered once
+	# per value, _local_set_value drops it when the value changes. Items with a
+	# gettextcallback call it on every request.
 	# @return text A text-value. '---' when local value is invalid
 	@dbus.service.method('com.victronenergy.BusItem', out_signature='s')
 	def GetText(self):
+		committed = self._committed
+		if committed is None or self._gettextcallback is not None:
+			return self._current_text()
+		return committed['Text']
+
+	def _render_text(self):
 		if self._value is None:
 			return '---'
 
@@ -627,7 +921,7 @@ class VeDbusItemExport(dbus.service.Object):
 	# event when they want to track our state.
 	@dbus.service.signal('com.victronenergy.BusItem', signature='a{sv}')
 	def PropertiesChanged(self, changes):
-		pass
+		self._signalcount += 1
 
 ## This class behaves like a regular reference to a class method (eg. self.foo), but keeps a weak reference
 ## to the object which method is to be called.
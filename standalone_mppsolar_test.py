@@ -120,11 +120,11 @@ def test_data_refresh():
         'pv_voltage': inverter.pv_voltage,
         'pv_current': inverter.pv_current,
         'pv_power': inverter.pv_power,
+        'pv2_voltage': inverter.pv2_voltage,
+        'pv2_current': inverter.pv2_current,
+        'pv2_power': inverter.pv2_power,
         'bus_voltage': inverter.bus_voltage,
-        'is_switched_on': getattr(inverter, 'is_switched_on', True),
-        'is_charging_on': getattr(inverter, 'is_charging_on', False),
-        'is_scc_charging_on': getattr(inverter, 'is_scc_charging_on', False),
-        'is_charging_to_float': getattr(inverter, 'is_charging_to_float', False),
+        'mode': inverter.mode,
     }
 
     # Map to D-Bus paths
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for QPIWS warning decoding
+"""
+
+from dbus_mppsolar.alarms import (
+    ALARM_ALARM, ALARM_OK, ALARM_PATHS, ALARM_WARNING, PI30_WARNING_FLAGS, AlarmDecoder, extract_warning_bits,
+)
+
+
+def _bits(*positions):
+    """Build a 32 bit QPIWS bitmap with the given bits set."""
+    bits = ['0'] * 32
+    for position in positions:
+        bits[position] = '1'
+    return ''.join(bits)
+
+
+def test_extract_raw_response():
+    result = {'raw_response': ['(00000100000000000000000000000000\x9a\x0b\r', '']}
+    assert extract_warning_bits(result) == _bits(5)
+
+
+def test_extract_raw_response_bytes():
+    result = {'raw_response': [b'(00001000000000000000000000000000\xff\r']}
+    assert extract_warning_bits(result) == _bits(4)
+
+
+def test_extract_decoded_flags():
+    result = {
+        'Line fail warning': [1, ''],
+        'Over temperature fault': ['0', ''],
+        'Fan locked fault': ['disabled', ''],
+        'Battery low alarm warning': [1, ''],
+        'Unrelated key': [1, ''],
+    }
+    assert extract_warning_bits(result) == _bits(5, 12)
+
+
+def test_extract_decoded_flags_custom_map():
+    assert extract_warning_bits({'Grid lost': ['1', '']}, {'Grid lost': 5}) == _bits(5)
+
+
+def test_extract_prefers_raw_response():
+    result = {'raw_response': ['(' + _bits(16) + '\r'], 'Line fail warning': [1, '']}
+    assert extract_warning_bits(result) == _bits(16)
+
+
+def test_extract_nothing_usable():
+    assert extract_warning_bits(None) is None
+    assert extract_warning_bits({'raw_response': ['(NAK\r']}) is None
+    assert extract_warning_bits({'Unrelated key': [1, '']}) is None
+
+
+def test_flag_map_covers_table():
+    assert PI30_WARNING_FLAGS['Inverter fault'] == 1
+    assert PI30_WARNING_FLAGS['Battery too low to charge warning'] == 29
+
+
+def test_decode_first_bitmap_reports_all_paths():
+    decoder = AlarmDecoder()
+    changes = decoder.decode(_bits())
+    assert changes == dict.fromkeys(ALARM_PATHS, ALARM_OK)
+
+
+def test_decode_change_only():
+    decoder = AlarmDecoder()
+    decoder.decode(_bits())
+
+    assert decoder.decode(_bits(5)) == {'/Alarms/GridLost': ALARM_WARNING}
+    # Same bitmap again: nothing to publish
+    assert decoder.decode(_bits(5)) == {}
+    # A second bit on the same path at the same level is not a change
+    assert decoder.decode(_bits(12)) == {'/Alarms/GridLost': ALARM_OK, '/Alarms/LowBattery': ALARM_WARNING}
+    assert decoder.decode(_bits(12, 29)) == {}
+    assert decoder.decode(_bits()) == {'/Alarms/LowBattery': ALARM_OK}
+
+
+def test_decode_highest_severity_wins():
+    decoder = AlarmDecoder()
+    decoder.decode(_bits())
+    assert decoder.decode(_bits(12, 14)) == {'/Alarms/LowBattery': ALARM_ALARM}
+    assert decoder.levels['/Alarms/LowBattery'] == ALARM_ALARM
+
+
+def test_decode_escalates_on_inverter_fault():
+    decoder = AlarmDecoder()
+    decoder.decode(_bits())
+    assert decoder.decode(_bits(9)) == {'/Alarms/HighTemperature': ALARM_WARNING}
+    assert decoder.decode(_bits(1, 9)) == {
+        '/Alarms/InternalFailure': ALARM_ALARM,
+        '/Alarms/HighTemperature': ALARM_ALARM,
+    }
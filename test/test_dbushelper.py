@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for DbusHelper publishing, against fake D-Bus services
+"""
+
+import configparser
+import os
+
+import pytest
+
+pytest.importorskip('dbus')
+pytest.importorskip('gi')
+
+from dbus_mppsolar import dbushelper, policy  # noqa: E402
+from dbus_mppsolar.dbushelper import MODE_STATES, DbusHelper  # noqa: E402
+from dbus_mppsolar.profiles import GENERIC_PI30  # noqa: E402
+from ve_utils import value_quantizer  # noqa: E402  (on the path once dbushelper is imported)
+
+CAPABILITIES = {
+    'has_ac_output': True,
+    'has_ac_input': True,
+    'has_battery_data': True,
+    'has_pv_data': True,
+    'has_pv2_data': True,
+    'has_temperature': True,
+    'minimum_requirements_met': True,
+}
+
+
+class FakeItem:
+    """Stands in for VeDbusItemExport: rounds to the resolution and returns the change."""
+
+    def __init__(self, value, resolution=None):
+        self._quantize = value_quantizer(resolution)
+        self.value = value
+        self.writes = 0
+
+    def _local_set_value(self, value):
+        if self._quantize is not None:
+            value = self._quantize(value)
+        if value == self.value:
+            return None
+        self.value = value
+        self.writes += 1
+        return {'Value': value, 'Text': str(value)}
+
+
+class FakeService:
+    """Stands in for VeDbusService: records commits and the ItemsChanged signals of the root."""
+
+    def __init__(self, paths):
+        self._dbusobjects = {path: FakeItem(config['value'], config.get('resolution'))
+                             for path, config in paths.items()}
+        self.root = self
+        self.commits = 0
+        self.signals = []
+
+    def commit(self):
+        self.commits += 1
+
+    def ItemsChanged(self, changes):
+        self.signals.append(dict(changes))
+
+    def __contains__(self, path):
+        return path in self._dbusobjects
+
+    def __getitem__(self, path):
+        return self._dbusobjects[path].value
+
+    def __setitem__(self, path, value):
+        self._dbusobjects[path]._local_set_value(value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class FakeInverter:
+    profile = GENERIC_PI30
+    port = '/dev/ttyUSB0'
+
+    def __init__(self):
+        self.serial_number = '96342304100215'
+        self.model = 'MKS2-5600'
+
+    def custom_name(self):
+        return f"MPP Solar {self.model}"
+
+    def product_name(self):
+        return self.model
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeTimers:
+    """Stands in for GObject timeouts: records them until fire() runs them."""
+
+    def __init__(self):
+        self.pending = []
+
+    def timeout_add(self, interval, callback):
+        self.pending.append((interval, callback))
+        return len(self.pending)
+
+    def fire(self):
+        pending, self.pending = self.pending, []
+        for _, callback in pending:
+            callback()
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    """Empty configuration for the publish policy, filled in by the test."""
+    parser = configparser.ConfigParser()
+    monkeypatch.setattr(policy, 'config', parser)
+    return parser
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(dbushelper, 'time', fake)
+    return fake
+
+
+@pytest.fixture
+def timers(monkeypatch):
+    fake = FakeTimers()
+    monkeypatch.setattr(dbushelper, 'gobject', fake)
+    return fake
+
+
+def _helper(capabilities=CAPABILITIES, solar=False):
+    """DbusHelper with a fake Multi service holding the paths for the capabilities."""
+    helper = DbusHelper(FakeInverter(), device_instance=0)
+    helper.multi_service = FakeService({
+        path: config for path, config in helper._multi_paths.items()
+        if config['required'] or helper._should_add_path(path, capabilities)})
+    if solar:
+        helper.solar_service = FakeService(helper._solar_paths)
+    helper._compile_routes()
+    return helper
+
+
+def test_rate_limit_sees_quantized_values(settings, clock, timers):
+    settings.read_dict({'PUBLISH_RATE': {'/Ac/Out/L1/P': '1'}})
+    helper = _helper()
+    service = helper.multi_service
+
+    assert helper.publish_data({'/Ac/Out/L1/P': 1000.0})
+    assert service.signals == [{'/Ac/Out/L1/P': {'Value': 1000, 'Text': '1000'}}]
+
+    # Below the 1 W resolution: the same published value, nothing held, no flush timer
+    clock.now = 0.2
+    helper.publish_data({'/Ac/Out/L1/P': 1000.3})
+    assert not helper._routes['/Ac/Out/L1/P'][2].has_pending
+    assert timers.pending == []
+    assert helper._last_values['/Ac/Out/L1/P'] == 1000.0
+
+    # A real change within the window is held for the flush
+    clock.now = 0.4
+    helper.publish_data({'/Ac/Out/L1/P': 1010.4})
+    assert helper._routes['/Ac/Out/L1/P'][2].pending == 1010.0
+    assert len(timers.pending) == 1
+    assert len(service.signals) == 1
+
+
+def test_configured_policies_name_defined_paths():
+    parser = configparser.ConfigParser()
+    parser.read(os.path.join(os.path.dirname(dbushelper.__file__), 'config.default.ini'))
+    helper = DbusHelper(FakeInverter(), device_instance=0)
+    defined = {path.lower() for path in helper._multi_paths}
+    for section in ('PUBLISH', 'PUBLISH_RATE'):
+        paths = [key for key in parser[section] if key.startswith('/')]
+        assert paths
+        assert set(paths) <= defined, section
+
+
+def test_mapping_names_defined_paths():
+    helper = _helper()
+    mpp_data = {'ac_voltage': 230.0, 'ac_load_percentage': 12, 'bus_voltage': 380, 'mode': 'L',
+                'battery_voltage': 52.0, 'pv_power': 500, 'pv2_power': 300}
+    assert set(helper.map_mpp_values_to_dbus(mpp_data, CAPABILITIES)) <= set(helper._multi_paths)
+
+
+def test_unchanged_and_deadband_values_not_published(settings, clock, timers):
+    settings.read_dict({'PUBLISH': {'/Ac/Out/L1/V': '0.5, 0, 0.2'}})
+    helper = _helper()
+    service = helper.multi_service
+    item = service._dbusobjects['/Ac/Out/L1/V']
+
+    def publish(now, voltage, frequency=50.0):
+        clock.now = now
+        helper.publish_data({'/Ac/Out/L1/V': voltage, '/Ac/Out/L1/F': frequency})
+
+    publish(0.0, 230.0)
+    assert (item.value, item.writes, len(service.signals)) == (230.0, 1, 1)
+
+    # Unchanged, in the deadband, or below the resolution of an unfiltered path
+    publish(1.0, 230.0)
+    publish(2.0, 230.3)
+    publish(3.0, 230.0, 50.001)
+    assert (item.value, item.writes, len(service.signals)) == (230.0, 1, 1)
+    assert service._dbusobjects['/Ac/Out/L1/F'].writes == 1
+
+    # Out of the deadband
+    publish(4.0, 230.6)
+    assert (item.value, item.writes) == (230.6, 2)
+    assert service.signals[-1] == {'/Ac/Out/L1/V': {'Value': 230.6, 'Text': '230.6'}}
+
+    # Reversing needs the deadband plus the hysteresis
+    publish(5.0, 230.0)
+    assert (item.value, item.writes) == (230.6, 2)
+    publish(6.0, 229.8)
+    assert (item.value, item.writes) == (229.8, 3)
+    assert len(service.signals) == 3
+
+    # The heartbeat publishes a change held back by the deadband
+    publish(7.0, 229.9)
+    assert (item.value, item.writes) == (229.8, 3)
+    if policy.PUBLISH_HEARTBEAT:
+        publish(6.0 + policy.PUBLISH_HEARTBEAT, 229.9)
+        assert (item.value, item.writes) == (229.9, 4)
+    assert timers.pending == []
+
+
+def test_one_signal_per_service_per_cycle(settings, clock, timers):
+    helper = _helper(solar=True)
+    multi, solar = helper.multi_service, helper.solar_service
+    mpp_data = {'pv_voltage': 0.0, 'pv_power': 0.0}
+    mapping = {'/Ac/Out/L1/V': 230.0, '/Ac/Out/L1/P': 500.0, '/Pv/0/P': 300.0, '/Yield/Power': 300.0}
+
+    helper.publish_data(mapping, mpp_data)
+    assert (multi.commits, solar.commits) == (1, 1)
+    assert [set(signal) for signal in multi.signals] == [set(mapping)]
+    # The Solar Charger only signals the paths it owns and its derived state that changed (/Mode 1 -> 4)
+    assert [set(signal) for signal in solar.signals] == [{'/Pv/0/P', '/Yield/Power', '/Mode'}]
+
+    # Only the changed path, on the service that owns it
+    clock.now = 1.0
+    helper.publish_data(dict(mapping, **{'/Ac/Out/L1/P': 520.0}), mpp_data)
+    assert (multi.commits, solar.commits) == (2, 1)
+    assert multi.signals[1] == {'/Ac/Out/L1/P': {'Value': 520, 'Text': '520'}}
+    assert len(solar.signals) == 1
+
+    clock.now = 2.0
+    helper.publish_data(dict(mapping, **{'/Pv/0/P': 310.0}), mpp_data)
+    assert (multi.commits, solar.commits) == (3, 2)
+    assert multi.signals[2] == {'/Pv/0/P': {'Value': 310, 'Text': '310'}}
+    assert solar.signals[1] == {'/Pv/0/P': {'Value': 310, 'Text': '310'}}
+
+    # Nothing changed, nothing committed or sent
+    clock.now = 3.0
+    helper.publish_data(dict(mapping, **{'/Pv/0/P': 310.0}), mpp_data)
+    assert (multi.commits, solar.commits) == (3, 2)
+    assert (len(multi.signals), len(solar.signals)) == (3, 2)
+
+
+def test_trailing_flush_publishes_held_value(settings, clock, timers):
+    settings.read_dict({'PUBLISH_RATE': {'/Ac/Out/L1/P': '1'}})
+    helper = _helper()
+    service = helper.multi_service
+
+    helper.publish_data({'/Ac/Out/L1/P': 1000.0})
+    clock.now = 0.4
+    helper.publish_data({'/Ac/Out/L1/P': 1010.0})
+    clock.now = 0.6
+    helper.publish_data({'/Ac/Out/L1/P': 1020.0})
+
+    # One timer for the end of the window, the latest sample replaces the held one
+    assert [interval for interval, _ in timers.pending] == [601]
+    assert len(service.signals) == 1
+
+    clock.now = 1.0
+    timers.fire()
+    assert service.signals[1] == {'/Ac/Out/L1/P': {'Value': 1020, 'Text': '1020'}}
+    assert service.commits == 2
+    assert helper._last_values['/Ac/Out/L1/P'] == 1020
+    assert timers.pending == []
+    assert helper._flush_timer is None
+
+
+def test_trailing_flush_discards_after_deadband_sample(settings, clock, timers):
+    settings.read_dict({'PUBLISH': {'/Ac/Out/L1/P': '10'}, 'PUBLISH_RATE': {'/Ac/Out/L1/P': '1'}})
+    helper = _helper()
+    service = helper.multi_service
+
+    helper.publish_data({'/Ac/Out/L1/P': 1000.0})
+    clock.now = 0.4
+    helper.publish_data({'/Ac/Out/L1/P': 1020.0})
+    assert helper._routes['/Ac/Out/L1/P'][2].has_pending
+    assert len(timers.pending) == 1
+
+    # Back within the deadband of the published value: the held value is stale
+    clock.now = 0.6
+    helper.publish_data({'/Ac/Out/L1/P': 1005.0})
+    assert not helper._routes['/Ac/Out/L1/P'][2].has_pending
+
+    clock.now = 1.0
+    timers.fire()
+    assert len(service.signals) == 1
+    assert service.commits == 1
+    assert service['/Ac/Out/L1/P'] == 1000
+    assert timers.pending == []
+
+
+STATE_PATHS = ('/Mode', '/State', '/Status')
+
+
+@pytest.mark.parametrize('mode, state', [
+    ('P', (3, 0, 0)),
+    ('S', (4, 0, 0)),
+    ('L', (3, 8, 8)),
+    ('B', (3, 9, 9)),
+    ('F', (3, 2, 2)),
+    ('H', (3, 1, 1)),
+    ('D', (4, 0, 0)),
+])
+def test_mode_states(settings, clock, timers, mode, state):
+    assert tuple(MODE_STATES[mode][path] for path in STATE_PATHS) == state
+    helper = _helper()
+    service = helper.multi_service
+
+    mapping = helper.map_mpp_values_to_dbus({'mode': mode}, CAPABILITIES)
+    assert tuple(mapping[path] for path in STATE_PATHS) == state
+    helper.publish_data(mapping)
+    assert tuple(service[path] for path in STATE_PATHS) == state
+
+    # Only mapped again when the mode byte changes
+    mapping = helper.map_mpp_values_to_dbus({'mode': mode}, CAPABILITIES)
+    assert not set(STATE_PATHS) & set(mapping)
+
+
+def test_mode_change(settings, clock, timers):
+    helper = _helper()
+    service = helper.multi_service
+
+    helper.publish_data(helper.map_mpp_values_to_dbus({'mode': 'L'}, CAPABILITIES))
+    helper.publish_data(helper.map_mpp_values_to_dbus({'mode': 'B'}, CAPABILITIES))
+    # /Mode stays 3, only /State and /Status change
+    assert service.signals[-1] == {'/State': {'Value': 9, 'Text': '9'}, '/Status': {'Value': 9, 'Text': '9'}}
+
+
+@pytest.mark.parametrize('mode', [None, 'X', ''])
+def test_unknown_mode(settings, clock, timers, mode):
+    helper = _helper()
+    service = helper.multi_service
+    before = tuple(service[path] for path in STATE_PATHS)
+
+    mapping = helper.map_mpp_values_to_dbus({'mode': mode}, CAPABILITIES)
+    assert not set(STATE_PATHS) & set(mapping)
+    helper.publish_data(mapping)
+    assert tuple(service[path] for path in STATE_PATHS) == before
+
+    # A known mode after an unknown one is mapped
+    mapping = helper.map_mpp_values_to_dbus({'mode': 'B'}, CAPABILITIES)
+    assert tuple(mapping[path] for path in STATE_PATHS) == (3, 9, 9)
+
+
+IDENTITY_PATHS = ('/CustomName', '/Serial', '/Info/Model', '/Info/Connection')
+
+
+def test_identity_republished_on_reconnect(settings, clock, timers):
+    helper = _helper()
+    service = helper.multi_service
+    inverter = helper.inverter
+
+    helper.publish_identity()
+    assert tuple(service[path] for path in IDENTITY_PATHS) == (
+        'MPP Solar MKS2-5600', '96342304100215', 'MKS2-5600', 'Serial USB (/dev/ttyUSB0)')
+
+    # Not republished while the device stays online
+    helper.update_connection_status(True)
+    inverter.model = 'MKS2-8000'
+    helper.update_connection_status(True)
+    assert service['/Info/Model'] == 'MKS2-5600'
+    assert service['/Connected'] == 1
+
+    # Another device identified while offline
+    helper.update_connection_status(False)
+    assert service['/Connected'] == 0
+    inverter.serial_number = '96342304100999'
+    helper.update_connection_status(True)
+    assert tuple(service[path] for path in IDENTITY_PATHS) == (
+        'MPP Solar MKS2-8000', '96342304100999', 'MKS2-8000', 'Serial USB (/dev/ttyUSB0)')
+    assert service['/Connected'] == 1
+
+
+@pytest.mark.parametrize('pv_power, pv2_power, has_pv2, yield_power', [
+    (500.0, 300.0, True, 800),
+    (500.0, None, True, 500),
+    (500.0, 300.0, False, 500),
+    (None, 300.0, True, None),
+])
+def test_yield_power_sums_trackers(settings, clock, timers, pv_power, pv2_power, has_pv2, yield_power):
+    capabilities = dict(CAPABILITIES, has_pv2_data=has_pv2)
+    helper = _helper(capabilities)
+    service = helper.multi_service
+
+    mapping = helper.map_mpp_values_to_dbus({'pv_power': pv_power, 'pv2_power': pv2_power}, capabilities)
+    assert mapping['/Yield/Power'] == yield_power
+    assert mapping['/Pv/0/P'] == pv_power
+    assert ('/Pv/1/P' in mapping) == has_pv2
+
+    helper.publish_data(mapping)
+    assert service['/Yield/Power'] == yield_power
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the publish policy
+"""
+
+from dbus_mppsolar.policy import PathFilter, RateLimit, admit, parse_filter
+
+
+def _step(path_filter, value, now):
+    """Run a value through the filter and commit it when accepted, as publish_data does."""
+    accepted = path_filter.accept(value, now)
+    if accepted:
+        path_filter.commit(value, now)
+    return accepted
+
+
+def test_accept_does_not_change_state():
+    path_filter = PathFilter(absolute=1.0, hysteresis=2.0)
+    assert path_filter.accept(50.0, 0.0)
+    assert path_filter.value is None
+    path_filter.commit(50.0, 0.0)
+    assert path_filter.accept(52.0, 1.0)
+    assert path_filter.value == 50.0
+    assert path_filter.direction == 0
+    assert path_filter.published_at == 0.0
+
+
+def test_first_value_always_published():
+    path_filter = PathFilter(absolute=10.0)
+    assert _step(path_filter, 230.0, 0.0)
+    assert path_filter.value == 230.0
+
+
+def test_absolute_deadband():
+    path_filter = PathFilter(absolute=2.0)
+    assert _step(path_filter, 230.0, 0.0)
+    assert not _step(path_filter, 231.5, 1.0)
+    assert not _step(path_filter, 228.0, 2.0)  # Exactly on the deadband
+    assert _step(path_filter, 232.5, 3.0)
+    assert path_filter.value == 232.5
+
+
+def test_relative_deadband():
+    path_filter = PathFilter(absolute=1.0, relative=5.0)
+    assert _step(path_filter, 1000, 0.0)
+    # 5 % of 1000 beats the absolute deadband
+    assert not _step(path_filter, 1040, 1.0)
+    assert _step(path_filter, 1060, 2.0)
+    # Near zero the absolute deadband takes over
+    path_filter = PathFilter(absolute=1.0, relative=5.0)
+    assert _step(path_filter, 2.0, 0.0)
+    assert not _step(path_filter, 2.5, 1.0)
+    assert _step(path_filter, 3.5, 2.0)
+
+
+def test_hysteresis_on_direction_change():
+    path_filter = PathFilter(absolute=1.0, hysteresis=2.0)
+    assert _step(path_filter, 50.0, 0.0)
+    assert _step(path_filter, 52.0, 1.0)  # Rising
+    # Going back down needs the deadband plus the hysteresis
+    assert not _step(path_filter, 50.0, 2.0)
+    assert not _step(path_filter, 49.0, 3.0)
+    assert _step(path_filter, 48.5, 4.0)
+    # Continuing in the same direction only needs the deadband
+    assert _step(path_filter, 47.0, 5.0)
+
+
+def test_heartbeat_releases_held_value():
+    path_filter = PathFilter(absolute=5.0, heartbeat=60.0)
+    assert _step(path_filter, 100.0, 0.0)
+    assert not _step(path_filter, 101.0, 30.0)
+    assert _step(path_filter, 101.0, 60.0)
+    assert path_filter.published_at == 60.0
+    # An unchanged value is never republished by the heartbeat
+    assert not _step(path_filter, 101.0, 200.0)
+
+
+def test_no_heartbeat_holds_forever():
+    path_filter = PathFilter(absolute=5.0)
+    assert _step(path_filter, 100.0, 0.0)
+    assert not _step(path_filter, 101.0, 1e6)
+
+
+def test_non_numeric_values():
+    path_filter = PathFilter(absolute=5.0)
+    assert _step(path_filter, 'Bulk', 0.0)
+    assert not _step(path_filter, 'Bulk', 1.0)
+    assert _step(path_filter, 'Float', 2.0)
+    assert _step(path_filter, None, 3.0)
+    assert _step(path_filter, 1, 4.0)
+
+
+def test_parse_filter():
+    path_filter = parse_filter('2, 5, 1', heartbeat=30.0)
+    assert path_filter.absolute == 2.0
+    assert path_filter.relative == 0.05
+    assert path_filter.hysteresis == 1.0
+    assert path_filter.heartbeat == 30.0
+    assert parse_filter('0.5').relative == 0.0
+
+
+def test_parse_filter_invalid():
+    assert parse_filter('') is None
+    assert parse_filter('abc') is None
+    assert parse_filter('1,,2') is None
+    assert parse_filter('1, 2, 3, 4') is None
+    assert parse_filter('-1') is None
+    assert parse_filter('1, -5') is None
+
+
+def test_rate_limit_hold_and_release():
+    rate_limit = RateLimit(2.0)
+    assert not rate_limit.hold(1, 0.0)
+    assert rate_limit.next_at == 0.5
+    assert rate_limit.hold(2, 0.1)
+    assert rate_limit.hold(3, 0.2)  # Replaces the pending value
+    assert rate_limit.has_pending
+    assert rate_limit.release(0.5) == 3
+    assert not rate_limit.has_pending
+    assert rate_limit.next_at == 1.0
+    # A new window opens once the previous one has passed
+    assert rate_limit.hold(4, 0.9)
+    assert not rate_limit.hold(5, 1.0)
+    assert not rate_limit.has_pending
+
+
+def test_rate_limit_discard():
+    rate_limit = RateLimit(1.0)
+    assert not rate_limit.hold(1, 0.0)
+    assert rate_limit.hold(2, 0.5)
+    rate_limit.discard()
+    assert not rate_limit.has_pending
+    assert rate_limit.pending is None
+    assert rate_limit.next_at == 1.0
+
+
+def test_admit_hold_revert_flush():
+    path_filter = PathFilter(absolute=1.0)
+    rate_limit = RateLimit(1.0)
+    assert admit(230.0, None, path_filter, rate_limit, 0.0)
+    path_filter.commit(230.0, 0.0)
+
+    # Held back within the window; the filter keeps its reference
+    assert not admit(240.0, 230.0, path_filter, rate_limit, 0.2)
+    assert rate_limit.has_pending
+    assert path_filter.value == 230.0
+
+    # Back to the published value before the window ends: nothing left to flush
+    assert not admit(230.0, 230.0, path_filter, rate_limit, 0.4)
+    assert not rate_limit.has_pending
+
+    # A sample within the deadband supersedes the held value too
+    assert not admit(240.0, 230.0, path_filter, rate_limit, 0.6)
+    assert not admit(230.5, 230.0, path_filter, rate_limit, 0.8)
+    assert not rate_limit.has_pending
+
+
+def test_admit_flush_publishes_latest_sample():
+    path_filter = PathFilter(absolute=1.0)
+    rate_limit = RateLimit(1.0)
+    assert admit(230.0, None, path_filter, rate_limit, 0.0)
+    path_filter.commit(230.0, 0.0)
+    assert not admit(240.0, 230.0, path_filter, rate_limit, 0.2)
+    assert not admit(235.0, 230.0, path_filter, rate_limit, 0.4)
+
+    value = rate_limit.release(1.0)
+    path_filter.commit(value, 1.0)
+    assert value == 235.0
+    assert path_filter.value == 235.0
+    assert path_filter.published_at == 1.0
+
+
+def test_admit_without_policy():
+    assert admit(1, None, None, None, 0.0)
+    assert not admit(1, 1, None, None, 0.0)
+    assert admit('Bulk', 'Float', None, None, 0.0)
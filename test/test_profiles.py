@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for model profile selection and application
+"""
+
+import pytest
+
+from dbus_mppsolar.profiles import GENERIC_PI30, PROFILES, select_profile
+from dbus_mppsolar.protocols import CODECS
+
+
+def _profile(name):
+    """Look up a registered profile by name."""
+    return next(profile for profile in PROFILES if profile.name.startswith(name))
+
+
+@pytest.mark.parametrize('protocol_id, model_name, firmware, profile', [
+    # QPI, QMN and QVFW as reported by the devices
+    ('PI30', 'MKS2-8000', 'VERFW:00072.70', 'Generic PI30'),
+    ('PI30', 'MAX', 'VERFW:00041.17', 'PI30 MAX'),
+    ('PI30', 'PIP-MAX8048', 'VERFW:00041.17', 'PI30 MAX'),
+    ('PI30', 'max-11k', '', 'PI30 MAX'),
+    ('PI30', 'LV2424', 'VERFW:00052.30', 'PI30 LV'),
+    ('PI30', '', '', 'Generic PI30'),
+    ('PI18', '', '05220', 'PI18'),
+    ('PI18', 'MAX', '', 'PI18'),
+    ('PI17', '', 'VERFW:00001.01', 'PI17'),
+    ('PI16', 'LV5048', '', 'Generic PI30'),
+    ('', '', '', 'Generic PI30'),
+    (None, None, None, 'Generic PI30'),
+])
+def test_select_profile(protocol_id, model_name, firmware, profile):
+    assert select_profile(protocol_id, model_name, firmware).name.startswith(profile)
+
+
+def test_every_profile_has_explicit_scales():
+    for profile in PROFILES:
+        assert isinstance(profile.field_scales['heat_sink_temp'], float), profile
+    assert _profile('PI30 MAX').field_scales['heat_sink_temp'] == 0.1
+    assert _profile('PI30 LV').field_scales['heat_sink_temp'] == 0.1
+    assert GENERIC_PI30.field_scales['heat_sink_temp'] == 0.1
+    assert _profile('PI18').field_scales['heat_sink_temp'] == 1.0
+
+
+# Inverter application, through a fake mpp-solar device class
+
+class FakeMPP:
+    """Stands in for the mpp-solar device class: records the protocol it was created for."""
+
+    def __init__(self, port, baud, protocol):
+        self.protocol = protocol
+
+
+@pytest.fixture
+def inverter_module(monkeypatch):
+    module = pytest.importorskip('dbus_mppsolar.inverter')
+    monkeypatch.setattr(module, 'MPP', FakeMPP)
+    return module
+
+
+@pytest.mark.parametrize('configured, profile, protocol', [
+    # Probed protocol: the profile decides
+    ('AUTO', 'PI18', 'PI18'),
+    ('AUTO', 'PI30 MAX', 'PI30MAX'),
+    ('AUTO', 'Generic PI30', 'PI30'),
+    # Configured protocol: only refined (PI30 -> PI30MAX), never replaced
+    ('PI30', 'PI30 MAX', 'PI30MAX'),
+    ('PI30', 'PI18', 'PI30'),
+    ('PI30MAX', 'Generic PI30', 'PI30MAX'),
+    ('PI18', 'Generic PI30', 'PI18'),
+    ('PI17', 'PI30 LV', 'PI17'),
+])
+def test_apply_profile_codec(inverter_module, configured, profile, protocol):
+    inverter = inverter_module.Inverter(port='/dev/null', protocol=configured)
+    profile = GENERIC_PI30 if profile == 'Generic PI30' else _profile(profile)
+
+    inverter.apply_profile(profile)
+
+    assert inverter.profile is profile
+    assert inverter.codec is CODECS[protocol]
+    assert inverter.protocol == protocol
+    assert inverter.mpp_device.protocol == protocol
+
+
+def test_apply_profile_constants(inverter_module):
+    inverter = inverter_module.Inverter(port='/dev/null', protocol='PI30')
+    inverter.apply_profile(_profile('PI30 LV'))
+    assert (inverter._ac_voltage_min, inverter._ac_voltage_max) == (90.0, 140.0)
+    assert inverter._heat_sink_temp_scale == 0.1
+    assert inverter.capacity == 10000
+
+
+@pytest.mark.parametrize('profile, readings, temperatures', [
+    # Firmwares reporting * 10 are rescaled per reading, nothing is latched
+    ('Generic PI30', (465, 45, 466), (46.5, 45.0, 46.6)),
+    ('PI30 MAX', (54, 540), (54.0, 54.0)),
+    ('PI18', (44, 440), (44.0, 440.0)),
+])
+def test_heat_sink_temp_scale(inverter_module, profile, readings, temperatures):
+    inverter = inverter_module.Inverter(port='/dev/null', protocol='AUTO')
+    inverter.apply_profile(GENERIC_PI30 if profile == 'Generic PI30' else _profile(profile))
+    key = inverter.codec.heat_sink_temp_key
+    for reading, temperature in zip(readings, temperatures):
+        inverter._parse_status_data({key: [reading, '°C']})
+        assert inverter.heat_sink_temp == pytest.approx(temperature)
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the protocol codecs, against captured mpp-solar responses
+"""
+
+import pytest
+
+from dbus_mppsolar.alarms import INVERTER_FAULT_BIT
+from dbus_mppsolar.protocols import CODECS, PROBE_ORDER, PI1X_MODE_CODES, first_value, get_codec, raw_payload
+
+# Responses as decoded by mpp-solar from real frames (metadata and unused fields trimmed)
+PI30_QPIGS = {
+    '_command': 'QPIGS',
+    'raw_response': ['(000.0 00.0 230.0 49.9 0161 0119 003 460 57.50 012 100 0069 0014 103.8 57.45 00000 '
+                     '00110110 00 00 00856 010$\x8c\r', ''],
+    'AC Input Voltage': [0.0, 'V'],
+    'AC Input Frequency': [0.0, 'Hz'],
+    'AC Output Voltage': [230.0, 'V'],
+    'AC Output Frequency': [49.9, 'Hz'],
+    'AC Output Apparent Power': [161, 'VA'],
+    'AC Output Active Power': [119, 'W'],
+    'AC Output Load': [3, '%'],
+    'BUS Voltage': [460, 'V'],
+    'Battery Voltage': [57.5, 'V'],
+    'Battery Charging Current': [12, 'A'],
+    'Battery Capacity': [100, '%'],
+    'Inverter Heat Sink Temperature': [69, '°C'],
+    'PV Input Current for Battery': [14.0, 'A'],
+    'PV Input Voltage': [103.8, 'V'],
+    'Battery Voltage from SCC': [57.45, 'V'],
+    'Battery Discharge Current': [0, 'A'],
+    'PV Input Power': [856, 'W'],
+}
+
+PI30MAX_QPIGS = {
+    '_command': 'QPIGS',
+    'AC Input Voltage': [227.2, 'V'],
+    'AC Input Frequency': [50.0, 'Hz'],
+    'AC Output Voltage': [230.3, 'V'],
+    'AC Output Frequency': [50.0, 'Hz'],
+    'AC Output Apparent Power': [829, 'VA'],
+    'AC Output Active Power': [751, 'W'],
+    'AC Output Load': [10, '%'],
+    'BUS Voltage': [447, 'V'],
+    'Battery Voltage': [54.5, 'V'],
+    'Battery Charging Current': [20, 'A'],
+    'Battery Capacity': [83, '%'],
+    'Inverter Heat Sink Temperature': [54, '°C'],
+    'PV1 Input Current': [2.7, 'A'],
+    'PV1 Input Voltage': [323.6, 'V'],
+    'Battery Discharge Current': [0, 'A'],
+    'PV1 Charging Power': [879, 'W'],
+}
+
+PI30MAX_QPIGS2 = {
+    '_command': 'QPIGS2',
+    'PV2 Input Current': [3.1, 'A'],
+    'PV2 Input Voltage': [327.3, 'V'],
+    'PV2 Charging Power': [1026, 'W'],
+}
+
+PI18_GS = {
+    '_command': 'GS',
+    'Grid voltage': [23.2, 'V'],
+    'Grid frequency': [49.9, 'Hz'],
+    'AC output voltage': [223.2, 'V'],
+    'AC output frequency': [49.9, 'Hz'],
+    'AC output apparent power': [971, 'VA'],
+    'AC output active power': [710, 'W'],
+    'Output load percent': [19, '%'],
+    'Battery voltage': [0.8, 'V'],
+    'Battery discharge current': [0, 'A'],
+    'Battery charging current': [0, 'A'],
+    'Battery capacity': [0, '%'],
+    'Inverter heat sink temperature': [44, '°C'],
+    'PV1 Input power': [520, 'W'],
+    'PV2 Input power': [0, 'W'],
+    'PV1 Input voltage': [194.1, 'V'],
+    'PV2 Input voltage': [0.0, 'V'],
+}
+
+PI17_GS = {
+    '_command': 'GS',
+    'Solar input voltage 1': [0.0, 'V'],
+    'Solar input voltage 2': [0.0, 'V'],
+    'Solar input current 1': [0.0, 'A'],
+    'Solar input current 2': [0.0, 'A'],
+    'Battery voltage': [39.4, 'V'],
+    'Battery capacity': [0, '%'],
+    'Battery current': [-12.5, 'A'],
+    'AC input voltage R': [238.9, 'V'],
+    'AC input frequency': [50.02, 'Hz'],
+    'AC output voltage R': [237.8, 'V'],
+    'AC output frequency': [50.01, 'Hz'],
+    'AC output current R': [0.0, 'A'],
+    'Inner temperature': [29, '°C'],
+}
+
+
+class Target:
+    """Receives decoded attributes, like the Inverter."""
+
+
+@pytest.mark.parametrize('protocol, result, expected', [
+    ('PI30', PI30_QPIGS, {
+        'ac_voltage': 230.0, 'frequency': 49.9, 'ac_power': 119.0, 'ac_apparent_power': 161.0,
+        'ac_load_percentage': 3.0, 'ac_input_voltage': 0.0, 'ac_input_frequency': 0.0,
+        '_battery_voltage': 57.5, '_battery_soc': 100.0, '_battery_charging_current': 12.0,
+        '_battery_discharging_current': 0.0, 'pv_voltage': 103.8, 'pv_current': 14.0, 'pv_power': 856.0,
+        'bus_voltage': 460.0,
+    }),
+    ('PI30MAX', PI30MAX_QPIGS, {
+        'ac_voltage': 230.3, 'ac_power': 751.0, 'ac_input_voltage': 227.2, '_battery_voltage': 54.5,
+        '_battery_soc': 83.0, '_battery_charging_current': 20.0, 'pv_voltage': 323.6, 'pv_current': 2.7,
+        'pv_power': 879.0, 'bus_voltage': 447.0,
+    }),
+    ('PI18', PI18_GS, {
+        'ac_voltage': 223.2, 'frequency': 49.9, 'ac_power': 710.0, 'ac_apparent_power': 971.0,
+        'ac_load_percentage': 19.0, 'ac_input_voltage': 23.2, 'ac_input_frequency': 49.9,
+        '_battery_voltage': 0.8, '_battery_charging_current': 0.0, 'pv_voltage': 194.1, 'pv_power': 520.0,
+        'pv2_voltage': 0.0, 'pv2_power': 0.0,
+    }),
+    ('PI17', PI17_GS, {
+        'ac_voltage': 237.8, 'frequency': 50.01, 'ac_current': 0.0, 'ac_input_voltage': 238.9,
+        'ac_input_frequency': 50.02, '_battery_voltage': 39.4, '_battery_soc': 0.0,
+        '_battery_charging_current': -12.5, 'pv_voltage': 0.0, 'pv_current': 0.0,
+    }),
+])
+def test_decode_status(protocol, result, expected):
+    target = Target()
+    CODECS[protocol].decode_status(result, target)
+    assert {attr: getattr(target, attr) for attr in expected} == pytest.approx(expected)
+
+
+def test_decode_pv2():
+    target = Target()
+    CODECS['PI30MAX'].decode_pv2(PI30MAX_QPIGS2, target)
+    assert (target.pv2_voltage, target.pv2_current, target.pv2_power) == (327.3, 3.1, 1026.0)
+
+
+def test_decode_fields_keeps_missing():
+    target = Target()
+    target.pv_power = 500.0
+    CODECS['PI30'].decode_status({'AC Output Voltage': [230.0, 'V']}, target)
+    assert target.ac_voltage == 230.0
+    assert target.pv_power == 500.0
+    assert not hasattr(target, 'bus_voltage')
+
+
+def test_decode_fields_scale():
+    target = Target()
+    fields = (('Inverter Heat Sink Temperature', 'heat_sink_temp', 0.1),)
+    CODECS['PI30'].decode_fields(fields, {'Inverter Heat Sink Temperature': [690, '°C']}, target)
+    assert target.heat_sink_temp == pytest.approx(69.0)
+
+
+@pytest.mark.parametrize('protocol, result, mode', [
+    ('PI30', {'Device Mode': ['Standby', '']}, 'S'),
+    ('PI30', {'Device Mode': ['Line', '']}, 'L'),
+    ('PI30', {'Device Mode': ['Power saving', '']}, 'H'),
+    # Older mpp-solar versions only return the raw frame
+    ('PI30', {'raw_response': ['(B\x13\xc9\r', '']}, 'B'),
+    ('PI30', {'raw_response': [b'(F\x08\x1c\r', '']}, 'F'),
+    ('PI30MAX', {'Device Mode': ['Fault', '']}, 'F'),
+    ('PI30', {'Device Mode': ['Unknown', '']}, None),
+    ('PI17', {'Working mode': ['Hybrid mode (Line mode, Grid mode)', '']}, 'L'),
+    ('PI17', {'Working mode': ['Battery mode', '']}, 'B'),
+    ('PI18', {'Working mode': ['Hybrid mode(Line mode, Grid mode)', '']}, 'L'),
+    ('PI18', {'Working mode': ['Fault mode', '']}, 'F'),
+    ('PI18', {'raw_response': ['^D00503\x9f\xb2\r', '']}, None),
+])
+def test_decode_mode(protocol, result, mode):
+    assert CODECS[protocol].decode_mode(result) == mode
+
+
+@pytest.mark.parametrize('code, mode', [('00', 'P'), ('01', 'S'), ('02', 'L'), ('03', 'B'), ('04', 'F'), ('05', 'L')])
+def test_decode_mode_pi1x_codes(code, mode):
+    assert PI1X_MODE_CODES[code] == mode
+    for protocol in ('PI17', 'PI18'):
+        assert CODECS[protocol].decode_mode({'Working mode': [code, '']}) == mode
+
+
+def test_decode_warnings_raw():
+    result = {'raw_response': ['(00000100000000001000000000000000V\xa6\r', '']}
+    bits = CODECS['PI30'].decode_warnings(result)
+    assert bits.index('1') == 5
+    assert bits[16] == '1'
+    assert bits.count('1') == 2
+
+
+@pytest.mark.parametrize('fault, faulted', [
+    ('00', False),
+    ('0', False),
+    ('No fault', False),
+    ('01', True),
+    ('Fan is locked', True),
+])
+def test_decode_warnings_fault_key(fault, faulted):
+    result = {'Fault code': [fault, ''], 'Line fail': ['1', ''], 'Over load': ['0', '']}
+    bits = CODECS['PI18'].decode_warnings(result)
+    assert bits[5] == '1'
+    assert bits[16] == '0'
+    assert bits[INVERTER_FAULT_BIT] == ('1' if faulted else '0')
+
+
+def test_decode_warnings_without_fault_key():
+    result = {'Fault code': ['01', ''], 'Over load': ['1', '']}
+    bits = CODECS['PI17'].decode_warnings(result)
+    assert bits[16] == '1'
+    assert bits[INVERTER_FAULT_BIT] == '0'
+
+
+@pytest.mark.parametrize('result, valid', [
+    ({'Protocol ID': ['PI30', ''], 'raw_response': ['(PI30\x9a\x0b\r', '']}, True),
+    ({'Protocol Version': ['18', ''], 'raw_response': ['^D00518;\x03\r', '']}, True),
+    ({'Protocol ID': ['PI30', '']}, True),
+    ({'raw_response': ['(NAKss\r', '']}, False),
+    ({'raw_response': [b'(NAKss\r', '']}, False),
+    ({'ERROR': ['No valid response', '']}, False),
+    ({}, False),
+    (None, False),
+    ('(PI30', False),
+])
+def test_validate(result, valid):
+    for codec in CODECS.values():
+        assert codec.validate(result) is valid
+
+
+def test_first_value_skips_metadata():
+    result = {'_command': 'QPI', 'raw_response': ['(PI30\x9a\x0b\r', ''], 'Protocol ID': [' PI30 ', '']}
+    assert first_value(result) == 'PI30'
+    assert first_value({'_command': 'QPI'}) is None
+    assert raw_payload(result).startswith('PI30')
+
+
+def test_encode_commands():
+    assert CODECS['PI30'].encode('QPIGS') == 'QPIGS'
+    assert CODECS['PI18'].encode('QPIGS') == 'GS'
+    assert CODECS['PI17'].encode('QPIWS') == 'WS'
+    assert not CODECS['PI18'].supports('QPIGS2')
+    assert not CODECS['PI17'].supports('QMN')
+    with pytest.raises(KeyError):
+        CODECS['PI17'].encode('QMN')
+
+
+def test_get_codec():
+    assert get_codec('pi18') is CODECS['PI18']
+    assert get_codec('PI30MAX') is CODECS['PI30MAX']
+    assert get_codec('AUTO') is None
+    assert get_codec(None) is None
+
+
+# Inverter decoding, through a fake mpp-solar device class
+
+class FakeMPP:
+    """Stands in for the mpp-solar device class: answers only its configured protocol."""
+
+    answers = {
+        'PI30': {'QPI': {'Protocol ID': ['PI30', '']}},
+        'PI18': {'PI': {'Protocol Version': ['18', '']}},
+        'PI17': {'PI': {'Protocol Version': ['17', ''], 'raw_response': ['^D00517\xca\xec\r', '']}},
+    }
+    device_protocol = 'PI17'
+    created = []
+
+    def __init__(self, port, baud, protocol):
+        self.protocol = protocol
+        self.commands = []
+        FakeMPP.created.append(protocol)
+
+    def run_command(self, command):
+        self.commands.append(command)
+        if self.protocol != self.device_protocol:
+            return {'ERROR': ['No valid response', '']}
+        return self.answers[self.protocol].get(command, {'raw_response': ['(NAKss\r', '']})
+
+
+@pytest.fixture
+def inverter_module(monkeypatch):
+    module = pytest.importorskip('dbus_mppsolar.inverter')
+    monkeypatch.setattr(module, 'MPP', FakeMPP)
+    monkeypatch.setattr(FakeMPP, 'created', [])
+    return module
+
+
+@pytest.mark.parametrize('charging, discharging, current', [
+    (12.0, 0.0, 12.0),
+    (0.0, 8.0, -8.0),
+    (-12.5, None, -12.5),
+    (0.0, 0.0, 0.0),
+])
+def test_battery_current(inverter_module, charging, discharging, current):
+    inverter = inverter_module.Inverter(port='/dev/null', protocol='PI30')
+    result = {'Battery Charging Current': [charging, 'A']}
+    if discharging is not None:
+        result['Battery Discharge Current'] = [discharging, 'A']
+    inverter._parse_status_data(result)
+    assert inverter._battery_current == current
+
+
+def test_pi17_signed_battery_current(inverter_module):
+    inverter = inverter_module.Inverter(port='/dev/null', protocol='PI17')
+    inverter._parse_status_data(PI17_GS)
+    assert inverter._battery_current == -12.5
+    assert inverter._battery_voltage == 39.4
+
+
+@pytest.mark.parametrize('device_protocol', PROBE_ORDER)
+def test_probe_order(inverter_module, monkeypatch, device_protocol):
+    monkeypatch.setattr(FakeMPP, 'device_protocol', device_protocol)
+    inverter = inverter_module.Inverter(port='/dev/null', protocol='AUTO')
+    assert inverter.codec is CODECS[PROBE_ORDER[0]]
+
+    result = inverter._probe_protocol()
+    assert result is not None
+    assert inverter.codec is CODECS[device_protocol]
+    assert inverter.mpp_device.protocol == device_protocol
+    # Protocols are tried in order and the probe stops at the first answer
+    assert FakeMPP.created == list(PROBE_ORDER[:PROBE_ORDER.index(device_protocol) + 1])
+
+
+def test_probe_nothing_answers(inverter_module, monkeypatch):
+    monkeypatch.setattr(FakeMPP, 'device_protocol', 'PI16')
+    inverter = inverter_module.Inverter(port='/dev/null', protocol='AUTO')
+    assert inverter._probe_protocol() is None
+    assert FakeMPP.created == list(PROBE_ORDER)